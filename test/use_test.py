@@ -1,8 +1,30 @@
 from xo.orm.mapper import XmlMapper
-from xo.orm import Model, StringField, IntegerField, Optional, ForeignKeyField
+from xo.orm import Model, StringField, IntegerField, FloatField, Optional, ForeignKeyField, ChoiceField, EnumField, toElement, toXml, dump_ndjson
+from xo.orm.common import InternPool, split_toplevel
+from xo.orm.diff import diff
+from xo.orm.schema import ModelSchema, xsd_pattern
+from xo.orm.index import RecordIndex, build_index, index_path
+from xo.orm.shared import share_columns
+from xo.orm.cache import DocumentCache
+from xo.crawler import Crawler, ModelRegistry
+from xo.template.generate import get_meta_class
 
 import os
+import io
+import re
+import sys
+import gzip
+import mmap
+import shutil
+import tempfile
+import json
+import copy
+import pickle
+import asyncio
 import unittest
+import unittest.mock
+from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
 
 
 # Model for contacts.xml
@@ -29,6 +51,15 @@ class Addresses(Model):
         year = IntegerField()
 
 
+# Model of documents refering to each other
+class Shelf(Model):
+    name = StringField()
+    neighbour = ForeignKeyField('Shelf.Book')
+
+    class Book(Model):
+        title = StringField()
+
+
 contacts_xmlfile = os.path.join(os.path.dirname(__file__), "contacts.xml")
 addresses_xmlfile = os.path.join(os.path.dirname(__file__), "addresses.xml")
 
@@ -57,4 +88,624 @@ class XmlMapperTestCase(unittest.TestCase):
         contacts = self.contacts_mapper.parse()
         self.assertEqual(contacts['/Contacts'].getChildren()[0].getParent(), contacts['/Contacts'])
 
+    def test_model_removechildren(self):
+        contacts = self.contacts_mapper.parse()
+        root = contacts['/Contacts']
+        alice, rabbit = root.getChildren("Person")
+        removed = root.removeChildren(lambda person: person.name == "Alice")
+        self.assertEqual(removed, [alice])
+        self.assertIsNone(alice.getParent())
+        self.assertEqual(root.getChildren("Person"), [rabbit])
+
+        # re-parenting keeps insertion order
+        alice.setParent(root)
+        self.assertEqual(root.getChildren("Person"), [rabbit, alice])
+        root.removeChild(rabbit)
+        self.assertNotIn(rabbit, getattr(root, '__childPerson'))
+        self.assertEqual(len(root.removeChildren()), 1)
+        self.assertEqual(root.getChildren(), [])
+
+    def test_childlist_positions(self):
+        root = self.contacts_mapper.parse()['/Contacts']
+        people = root['__childPerson']
+        alice, rabbit = people[0], people[1]
+
+        # cached positions follow appends and removals
+        hatter = Contacts.Person(name="Hatter", address="Tea Party")
+        people.append(hatter)
+        self.assertIs(people[2], hatter)
+        people.remove(alice)
+        self.assertEqual([ people[i] for i in range(len(people)) ], [rabbit, hatter])
+        people.append(alice)
+        self.assertIs(people[-1], alice)
+
+    def test_weak_parent_and_dispose(self):
+        contacts = XmlMapper(contacts_xmlfile, Contacts, weak_parent=True, gc_mode="pause").parse()
+        root = contacts['/Contacts']
+        person = root.getChildren("Person")[0]
+        self.assertIs(person.getParent(), root)
+
+        person.removeFromParent()
+        self.assertIsNone(person.getParent())
+        person.setParent(root, weak=True)
+
+        root.dispose()
+        self.assertEqual(root.getChildren(), [])
+        self.assertIsNone(person.getParent())
+        self.assertEqual(person.getChildren(), [])
+
+    def test_intern_strings(self):
+        pool = InternPool()
+        first = XmlMapper(addresses_xmlfile, Addresses, intern_strings=pool).parse()
+        second = XmlMapper(addresses_xmlfile, Addresses, intern_strings=pool).parse()
+        self.assertIs(first['/Addresses/Apartment[1]'].location, second['/Addresses/Apartment[1]'].location)
+        self.assertGreater(pool.hits, 0)
+        self.assertGreater(pool.saved_bytes, 0)
+
+    def test_parse_partitioned(self):
+        contacts = self.contacts_mapper.parse()
+        partitioned = XmlMapper(contacts_xmlfile, Contacts).parse_partitioned(processes=2, partitions=2)
+        self.assertEqual(set(partitioned.keys()), set(contacts.keys()))
+        self.assertEqual(partitioned['/Contacts/Person[2]'].name, "Rabbit")
+        self.assertIs(partitioned['/Contacts/Person[1]/Phone[2]'].getParent().getParent(), partitioned['/Contacts'])
+
+        # root without children, with or without text
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "empty.xml")
+            for xml in [ '<Contacts name="x"></Contacts>', '<Contacts name="x">hello</Contacts>', '<Contacts/>' ]:
+                with open(path, "w") as file:
+                    file.write(xml)
+                partitioned = XmlMapper(path, Contacts).parse_partitioned(processes=1)
+                self.assertEqual(list(partitioned.keys()), ['/Contacts'])
+                self.assertEqual(partitioned['/Contacts'].get('text'), XmlMapper(path, Contacts).parse()['/Contacts'].get('text'))
+
+        # boundaries are sought by names of root's children, skipping comments
+        xml = b'<Contacts><Person name="a" address="x"/><!-- <Person> --><Person name="b" address="y"/></Contacts>'
+        _, _, _, ranges = split_toplevel(xml, 8, [b'Person'])
+        self.assertEqual([ xml[start:end].count(b'name=') for start, end in ranges ], [1, 1])
+        with self.assertRaises(ValueError):
+            XmlMapper(contacts_xmlfile, Contacts, schema=True).parse_partitioned(processes=1)
+
+    def test_shared_columns(self):
+        contacts = self.contacts_mapper.parse()
+        shared = XmlMapper(contacts_xmlfile, Contacts).parse_partitioned(processes=2, partitions=2, shared_memory=True)
+        self.assertEqual(shared['/Contacts/Person[1]/Phone[2]'].number, 611953242)
+        self.assertEqual(set(shared.materialize().keys()), set(contacts.keys()))
+        self.assertEqual(shared['/Contacts/Person[2]/Email'].text, '645118456@gmail.com')
+
+        # blocks of workers that succeeded are freed when mapping fails
+        blocks = set(os.listdir("/dev/shm"))
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "contacts.xml")
+            with open(path, "wb") as file:
+                file.write(b"<Contacts><Person name='b' address='y'><Phone number='x'/></Person><Person name='a' address='x'/></Contacts>")
+            with self.assertRaises(ValueError):
+                XmlMapper(path, Contacts).parse_partitioned(processes=2, partitions=2, shared_memory=True)
+        with unittest.mock.patch.object(Contacts.Person, '__count__', (3, sys.maxsize)):
+            with self.assertRaises(RuntimeError):
+                XmlMapper(contacts_xmlfile, Contacts).parse_partitioned(processes=2, partitions=2, shared_memory=True)
+        self.assertEqual(set(os.listdir("/dev/shm")), blocks)
+
+        # columns are read in place
+        columns = pickle.loads(pickle.dumps(share_columns(contacts['/Contacts'].getChildren(), Contacts)))
+        with columns.attach():
+            self.assertEqual(columns.column(Contacts.Person.Phone, 'number').tolist(), [513754619, 611953242, 645118456])
+            self.assertEqual(columns.column(Contacts.Person.Phone, '_parent').tolist(), [0, 0, 1])
+            self.assertEqual(columns.column(Contacts.Person, 'name'), ['Alice', 'Rabbit'])
+            self.assertIsNone(columns.mask(Contacts.Person, 'name'))
+
+    def test_xml_sources(self):
+        with open(addresses_xmlfile, "rb") as file:
+            data = file.read()
+            file.seek(0)
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                sources = [ data, io.BytesIO(data), gzip.compress(data), io.BytesIO(gzip.compress(data)), buf ]
+                for source in sources:
+                    addresses = XmlMapper(source, Addresses).parse()
+                    self.assertEqual(addresses['/Addresses/Apartment[1]'].year, 1898)
+
+    def test_aparse(self):
+        async def main():
+            contacts = await XmlMapper.aparse(contacts_xmlfile, Contacts)
+            results = [ result async for result in XmlMapper.aiter_parse([addresses_xmlfile] * 3, Addresses, concurrency=2) ]
+            return contacts, results
+
+        contacts, results = asyncio.run(main())
+        self.assertEqual(len(contacts['/Contacts'].getChildren()), 2)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0][1]['/Addresses/Apartment[2]'].year, 2)
+
+    def test_get_meta_class(self):
+        meta = get_meta_class([addresses_xmlfile, addresses_xmlfile], jobs=2)
+        apartment = meta["__children__"][0]
+        self.assertEqual(str(apartment["year"]), "IntegerField()")
+        self.assertEqual(str(apartment["area"]), "Optional( IntegerField() )")
+        self.assertEqual(str(apartment["location"]), "StringField()")
+
+        meta = get_meta_class([addresses_xmlfile], sample=1)
+        self.assertNotIn("area", meta["__children__"][0])
+
+    def test_pickle(self):
+        contacts = self.contacts_mapper.parse()
+        phone = contacts['/Contacts/Person[1]/Phone[2]']
+        root = pickle.loads(pickle.dumps(contacts['/Contacts']))
+        self.assertEqual(len(root.getChildren("Phone", recursive=True)), 3)
+        self.assertEqual(root.getChildren()[0].getChildren("Phone")[1].number, phone.number)
+
+        copied = pickle.loads(pickle.dumps(contacts))
+        self.assertEqual(list(copied.keys()), list(contacts.keys()))
+        self.assertIs(copied['/Contacts/Person[1]'].getParent(), copied['/Contacts'])
+
+        copied = pickle.loads(pickle.dumps(phone))
+        self.assertEqual(copied.number, phone.number)
+        self.assertEqual(copied.getParent().getParent().getClassName(), "Contacts")
+
+        # graphs refering to each other are pickled once
+        a, b = Shelf(name="a"), Shelf(name="b")
+        for shelf in (a, b):
+            shelf.appendChild(Shelf.Book(title=shelf.name))
+        a.setAttr('neighbour', b.getChildren()[0])
+        b.setAttr('neighbour', a.getChildren()[0])
+        a2, b2 = pickle.loads(pickle.dumps([a, b]))
+        self.assertIs(a2.neighbour, b2.getChildren()[0])
+        self.assertIs(b2.neighbour, a2.getChildren()[0])
+        book = pickle.loads(pickle.dumps(a.getChildren()[0]))
+        self.assertIs(book.getParent().neighbour.getParent().neighbour, book)
+
+        shallow = copy.copy(phone)
+        self.assertEqual(shallow.number, phone.number)
+        self.assertIsNone(shallow.getParent())
+        deep = copy.deepcopy(a)
+        self.assertEqual(deep.neighbour.getParent().neighbour.title, "a")
+        self.assertIsNot(deep.neighbour, b.getChildren()[0])
+
+        # many siblings pickle in linear time
+        shelf = Shelf(name="big")
+        for i in range(4000):
+            shelf.appendChild(Shelf.Book(title=str(i)))
+        books = pickle.loads(pickle.dumps(shelf.getChildren()))
+        self.assertEqual([ book.title for book in books ], [ str(i) for i in range(4000) ])
+        self.assertTrue(all( book.getParent() is books[0].getParent() for book in books ))
+        shelf.removeChild(shelf.getChildren()[0])
+        self.assertEqual(pickle.loads(pickle.dumps(shelf.getChildren()[-1])).title, "3999")
+
+    def test_ndjson(self):
+        contacts = self.contacts_mapper.parse()
+        phones = list(contacts.iter_records(Contacts.Person.Phone))
+        self.assertEqual(phones[0], {'number': 513754619, '_path': '/Contacts/Person[1]/Phone[1]', '_parent': '/Contacts/Person[1]'})
+
+        fp = io.StringIO()
+        self.assertEqual(dump_ndjson(contacts['/Contacts'], fp), 2)
+        person = json.loads(fp.getvalue().splitlines()[1])
+        self.assertEqual(person['name'], "Rabbit")
+        self.assertEqual(person['Email'][0]['text'], "645118456@gmail.com")
+        self.assertEqual(person['Phone'], [{'number': 645118456}])
+
+    def test_diff(self):
+        old = XmlMapper(contacts_xmlfile, Contacts, digest=True).parse()
+        new = XmlMapper(contacts_xmlfile, Contacts, digest=True).parse()
+        self.assertEqual(old['/Contacts'].getDigest(), new['/Contacts'].getDigest())
+        self.assertFalse(diff(old['/Contacts'], new['/Contacts']))
+
+        new['/Contacts/Person[2]'].setAttr('address', "Sun Street No.2")
+        new['/Contacts/Person[1]/Phone[2]'].removeFromParent()
+        result = diff(old['/Contacts'], new['/Contacts'])
+        self.assertEqual([ path for path, _, _ in result.modified ], ['/Contacts/Person[2]'])
+        self.assertEqual([ path for path, _ in result.removed ], ['/Contacts/Person[1]/Phone[2]'])
+        self.assertEqual(result.added, [])
+
+        # children of duplicated primary keys are all reported
+        class Catalog(Model):
+            class Item(Model):
+                code = StringField(primary_key=True)
+                price = IntegerField()
+
+        old, new = Catalog(), Catalog()
+        for code, price in [ ("a", 1), ("a", 2), ("b", 3) ]:
+            old.appendChild(Catalog.Item(code=code, price=price))
+        new.appendChild(Catalog.Item(code="b", price=4))
+        result = diff(old, new)
+        self.assertEqual([ path for path, _ in result.removed ], ['/Catalog/Item[1]', '/Catalog/Item[2]'])
+        self.assertEqual([ path for path, _, _ in result.modified ], ['/Catalog/Item'])
+
+    def test_parse_projection(self):
+        contacts = self.contacts_mapper.parse(include=[Contacts.Person.Phone])
+        self.assertEqual(len(contacts['/Contacts'].getChildren("Phone", recursive=True)), 3)
+        self.assertEqual(contacts['/Contacts/Person[2]'].name, "Rabbit")
+        self.assertNotIn('/Contacts/Person[1]/Email', contacts)
+
+        contacts = self.contacts_mapper.parse(exclude=["Contacts.Person.Phone"])
+        self.assertEqual(contacts['/Contacts/Person[1]/Email'].text, "513754619@mail.com")
+        self.assertEqual(len(contacts['/Contacts'].getChildren("Phone", recursive=True)), 0)
+
+        full = XmlMapper(contacts_xmlfile, Contacts).parse(exclude=[])
+        self.assertEqual(list(full.keys()), list(self.contacts_mapper.parse().keys()))
+
+        # errors are located in the source
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "contacts.xml")
+            with open(path, "wb") as file:
+                file.write(b"<Contacts>\n<!-- a\n -->\n<Person name='a' address='b'>\n  <Phone number='x'/>\n  <Fax/>\n</Person>\n</Contacts>")
+            with self.assertRaisesRegex(ValueError, f"File {re.escape(path)}, line 5,"):
+                XmlMapper(path, Contacts).parse(include=[Contacts.Person.Phone])
+            with self.assertRaisesRegex(RuntimeError, f"File {re.escape(path)}, line 6,"):
+                XmlMapper(path, Contacts).parse(exclude=[Contacts.Person.Phone])
+        with self.assertRaises(ValueError):
+            XmlMapper(contacts_xmlfile, Contacts, schema=True).parse(include=[Contacts.Person.Phone])
+
+    def test_parse_lazy(self):
+        contacts = self.contacts_mapper.parse(lazy=True)
+        self.assertEqual(list(contacts.keys()), ['/Contacts'])
+        root = contacts['/Contacts']
+        self.assertFalse(root.isMaterialized())
+
+        self.assertEqual(contacts['/Contacts/Person[1]/Phone[2]'].number, 611953242)
+        self.assertTrue(root.isMaterialized())
+        self.assertFalse(contacts['/Contacts/Person[2]'].isMaterialized())
+        with self.assertRaises(KeyError):
+            contacts['/Contacts/Person[3]']
+
+        contacts.validate_all()
+        self.assertEqual(list(contacts.keys()), list(self.contacts_mapper.parse().keys()))
+
+        # a failed load is retried, not left partial
+        class Pair(Model):
+            class Item(Model):
+                n = IntegerField()
+        pair = XmlMapper(b"<Pair><Item n='1'/><Item n='x'/></Pair>", Pair).parse(lazy=True)
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                pair['/Pair'].getChildren()
+        with self.assertRaises(ValueError):
+            pair.validate_all()
+
+        # resolving every sibling is linear in their number
+        xml = "<Contacts>" + "".join( f'<Person name="p{i}" address="a"/>' for i in range(2000) ) + "</Contacts>"
+        contacts = XmlMapper(xml.encode(), Contacts).parse(lazy=True)
+        people = contacts['/Contacts'].getChildren("Person")
+        self.assertTrue(all( contacts[f'/Contacts/Person[{i+1}]'] is person for i, person in enumerate(people) ))
+        with self.assertRaises(KeyError):
+            contacts['/Contacts/Email[1]']
+
+    def test_freeze(self):
+        contacts = self.contacts_mapper.parse()
+        root = contacts['/Contacts'].freeze()
+        person = contacts['/Contacts/Person[1]']
+        with self.assertRaises(RuntimeError):
+            person.setAttr('name', "John")
+        with self.assertRaises(RuntimeError):
+            person.removeFromParent()
+        with self.assertRaises(RuntimeError):
+            root.removeChildren()
+
+        # dict api is frozen as well, cached digest stays valid
+        digest = root.getDigest()
+        mutations = [ lambda: person.__setitem__('name', "John"), lambda: person.update(name="John"),
+                      lambda: person.pop('name'), lambda: person.setdefault('age', 1), lambda: person.popitem(),
+                      lambda: person.clear(), lambda: person.__delitem__('name') ]
+        for mutate in mutations:
+            with self.assertRaises(RuntimeError):
+                mutate()
+        self.assertEqual(person.name, "Alice")
+        self.assertEqual(root.getDigest(), digest)
+
+        # frozen children aren't detached from a mutable parent
+        mutable = self.contacts_mapper.parse()['/Contacts']
+        frozen = mutable.getChildren("Person")[0].freeze()
+        with self.assertRaises(RuntimeError):
+            mutable.removeChildren()
+        self.assertIs(frozen.getParent(), mutable)
+        self.assertEqual(len(mutable.getChildren("Person")), 2)
+
+        # freezing is idempotent, a parent freezes over its frozen child
+        self.assertIs(frozen.freeze(), frozen)
+        mutable.freeze()
+        self.assertTrue(all( person.isFrozen() for person in mutable.getChildren("Person") ))
+        self.assertIs(root.freeze(), root)
+
+        thawed = root.thaw()
+        self.assertFalse(thawed.isFrozen())
+        self.assertFalse(diff(root, thawed))
+        thawed.getChildren("Person")[0].setAttr('name', "John")
+        self.assertEqual(person.name, "Alice")
+        self.assertEqual([ path for path, _, _ in diff(root, thawed).modified ], ['/Contacts/Person[1]'])
+
+        cloned = thawed.clone()
+        self.assertEqual(cloned.getChildren("Person")[0].name, "John")
+        self.assertIsNot(cloned.getChildren("Person")[0], thawed.getChildren("Person")[0])
+
+    def test_crawler(self):
+        with tempfile.TemporaryDirectory() as folder:
+            shutil.copy(contacts_xmlfile, folder)
+            shutil.copy(addresses_xmlfile, folder)
+            state = os.path.join(folder, "state.json")
+            crawler = Crawler(folder, ModelRegistry(Contacts, Addresses), workers=2, state=state)
+
+            results = { os.path.basename(r.path): r for r in crawler.crawl() }
+            self.assertEqual(set(results.keys()), {"contacts.xml", "addresses.xml"})
+            self.assertTrue(all( r.ok for r in results.values() ))
+            self.assertIs(results["contacts.xml"].model_cls, Contacts)
+            self.assertEqual(results["addresses.xml"].obj_map['/Addresses/Apartment[2]'].year, 2)
+
+            # unchanged files are skipped
+            self.assertEqual(list(crawler.crawl()), [])
+            self.assertEqual(len(list(crawler.crawl(yield_skipped=True))), 2)
+
+    def test_memory_report(self):
+        mapper = XmlMapper(contacts_xmlfile, Contacts)
+        obj_map = mapper.parse()
+        report = obj_map.memory_report(top=3, tree=mapper.tree)
+
+        self.assertEqual(sum( c.count for c in report.classes.values() ), len(obj_map))
+        self.assertGreater(report.tree, 0)
+        self.assertEqual(len(report.subtrees), 3)
+        # root subtree holds everything
+        path, size, count = report.subtrees[0]
+        self.assertEqual(path, '/Contacts')
+        self.assertEqual(count, len(obj_map))
+        self.assertEqual(size, report.total - report.tree)
+        self.assertIn('heaviest subtrees', str(report))
+
+    def test_choice_field(self):
+        class Color(Enum):
+            RED = 'red'
+            GREEN = 'green'
+
+        class Palette(Model):
+            class Swatch(Model):
+                kind = ChoiceField(['solid', 'gradient'])
+                color = Optional(EnumField(Color))
+
+        xml = b"<Palette><Swatch kind='solid' color='red'/><Swatch kind='gradient'/><Swatch kind='solid' color='green'/></Palette>"
+        obj_map = XmlMapper(xml, Palette).parse()
+        swatches = list(obj_map['/Palette'].getChildrenIter())
+        self.assertIs(swatches[0].kind, swatches[2].kind)
+        self.assertIs(swatches[0].color, Color.RED)
+        self.assertIsNone(swatches[1].get('color'))
+        self.assertEqual(toElement(swatches[2]).get('color'), 'green')
+        self.assertEqual(obj_map.to_columns(Palette.Swatch)['kind'].tolist(), [0, 1, 0])
+        self.assertEqual(obj_map.to_columns(Palette.Swatch)['color'].tolist(), [0, -1, 1])
+
+        with self.assertRaises(ValueError):
+            XmlMapper(b"<Palette><Swatch kind='plain'/></Palette>", Palette).parse()
+        with self.assertRaisesRegex(TypeError, "Choices of ChoiceField"):
+            ChoiceField(['solid', 1])
+
+        # constructed objects store canonical choices as well
+        kind = "".join(['so', 'lid'])
+        self.assertIs(Palette.Swatch(kind=kind).kind, swatches[0].kind)
+        swatches[1].setAttr('kind', kind)
+        self.assertIs(swatches[1].kind, swatches[0].kind)
+        with self.assertRaises(AttributeError):
+            swatches[0].kind = 'plain'
+
+    def test_track_source(self):
+        with open(contacts_xmlfile, "rb") as file:
+            source = file.read()
+        obj_map = XmlMapper(contacts_xmlfile, Contacts, track_source=True).parse()
+        root = obj_map['/Contacts']
+        self.assertEqual(toXml(root), source)
+
+        obj_map['/Contacts/Person[2]/Email'].text = 'rabbit@moon.com'
+        obj_map['/Contacts/Person[1]/Phone[1]'].removeFromParent()
+        obj_map['/Contacts/Person[1]'].appendChild(Contacts.Person.Phone(number=1))
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "contacts.xml")
+            root.save(path)
+            with open(path, "rb") as file:
+                saved = file.read()
+
+        # untouched subtrees are copied verbatim
+        self.assertTrue(saved.startswith(source[:source.index(b'<Email>513754619')]))
+        self.assertIn(b'<Email>rabbit@moon.com</Email>', saved)
+        saved_map = XmlMapper(saved, Contacts).parse()
+        self.assertEqual([ p.number for p in saved_map['/Contacts/Person[1]'].getChildren('Phone') ], [611953242, 1])
+
+        # reordered children are written in container order
+        obj_map = XmlMapper(contacts_xmlfile, Contacts, track_source=True).parse()
+        root = obj_map['/Contacts']
+        alice = obj_map['/Contacts/Person[1]']
+        root.removeChild(alice)
+        root.appendChild(alice)
+        saved = toXml(root)
+        self.assertEqual([ p.name for p in XmlMapper(saved, Contacts).parse()['/Contacts'].getChildren('Person') ], ["Rabbit", "Alice"])
+        self.assertEqual(len(saved), len(source))
+
+    def test_field_descriptors(self):
+        obj_map = XmlMapper(contacts_xmlfile, Contacts).parse()
+        person = obj_map['/Contacts/Person[1]']
+        phone = obj_map['/Contacts/Person[1]/Phone[1]']
+
+        self.assertIsInstance(Contacts.Person.name, StringField)
+        self.assertEqual(person.name, 'Alice')
+        self.assertIs(phone.getParent(), person)
+        self.assertEqual(Contacts.Person.Phone.getParentClassName(), 'Person')
+        self.assertEqual(Contacts.Person.Phone.getParentClassQualName(), 'Contacts.Person')
+
+        person.name = 'Alice Liddell'
+        self.assertEqual(person['name'], 'Alice Liddell')
+        with self.assertRaises(AttributeError):
+            phone.number = '611953242'
+        with self.assertRaises(AttributeError):
+            Contacts.Person.Phone(number=1).unknown
+
+        # fields named like methods keep the methods
+        class Order(Model):
+            items = StringField()
+            keys = IntegerField()
+            save = Optional( StringField() )
+
+        order = Order(items="a,b", keys=2)
+        order.setAttr('save', "no")
+        self.assertEqual([ order.getAttr(k) for k in ('items', 'keys', 'save') ], ["a,b", 2, "no"])
+        self.assertEqual(dict(order.items())['keys'], 2)
+        self.assertIn("a,b", str(order))
+        self.assertEqual(order.clone()['items'], "a,b")
+        self.assertIn(b'items="a,b"', toXml(order))
+        with self.assertRaises(AttributeError):
+            order.setAttr('keys', "2")
+
+    def test_parse_store(self):
+        with tempfile.TemporaryDirectory() as folder:
+            with XmlMapper(contacts_xmlfile, Contacts).parse_store(os.path.join(folder, "contacts.sqlite"), batch=2) as store:
+                self.assertEqual(store.count(Contacts.Person.Phone), 3)
+
+                # children are loaded at first access
+                root = store.root()
+                self.assertFalse(root.isMaterialized())
+                people = list(root.getChildrenIter())
+                self.assertEqual([ p.name for p in people ], ['Alice', 'Rabbit'])
+                self.assertEqual(people[0].getChildren('Email')[0].text, '513754619@mail.com')
+
+                # queries are pushed down
+                rabbit, = store.select(Contacts.Person, name='Rabbit')
+                self.assertEqual(rabbit.address, 'Moon Street No.1')
+                self.assertEqual([ p.number for p in store.getChildren(rabbit, 'Phone', number=645118456) ], [645118456])
+                self.assertEqual(store.getParent(rabbit).getClassName(), 'Contacts')
+
+    def test_select(self):
+        obj_map = XmlMapper(contacts_xmlfile, Contacts).parse()
+        root = obj_map['/Contacts']
+
+        phones = list(root.select('Person[@name="Alice"]/Phone'))
+        self.assertEqual([ p.number for p in phones ], [513754619, 611953242])
+        self.assertEqual([ p.number for p in root.select('//Phone[1]') ], [513754619, 645118456])
+        self.assertEqual([ e.text for e in root.select('*/Email[text()="645118456@gmail.com"]') ], ['645118456@gmail.com'])
+        self.assertEqual(len(list(root.select('Person/Phone[@number>600000000]'))), 2)
+        self.assertIs(next(root.select('Person[2]')), obj_map['/Contacts/Person[2]'])
+
+        # positions count matches of all classes under the same parent
+        self.assertEqual([ c.getClassName() for c in root.select('Person/*[1]') ], ['Email', 'Email'])
+        self.assertEqual([ c.number for c in root.select('Person/*[3]') ], [611953242])
+        self.assertEqual([ c.number for c in root.select('//*[@number][2]') ], [611953242])
+
+        # impossible steps and values are rejected up front
+        with self.assertRaises(ValueError):
+            root.select('Person/Address')
+        with self.assertRaises(ValueError):
+            root.select('Person/Phone[@number="one"]')
+
+    def test_schema(self):
+        schema = ModelSchema(Contacts)
+        self.assertTrue(schema.counts_covered)
+        self.assertIn(Contacts.Person.Phone, schema.trusted)
+
+        obj_map = XmlMapper(contacts_xmlfile, Contacts, schema=schema).parse()
+        self.assertEqual(list(obj_map.keys()), list(XmlMapper(contacts_xmlfile, Contacts).parse().keys()))
+        self.assertEqual(obj_map['/Contacts/Person[1]/Phone[2]'].number, 611953242)
+
+        # wrong type of attribute and undefined element are rejected by schema
+        with self.assertRaises(RuntimeError):
+            XmlMapper(b"<Contacts><Person name='a' address='b'><Phone number='x'/></Person></Contacts>", Contacts, schema=True).parse()
+        with self.assertRaises(RuntimeError):
+            XmlMapper(b"<Contacts><Person name='a' address='b'><Fax/></Person></Contacts>", Contacts, schema=True).parse()
+
+        self.assertEqual(xsd_pattern(r'^\d{4}-\d{5}\Z'), r'(\d{4}-\d{5})')
+        self.assertEqual(xsd_pattern(r'^(a|b)\Z'), r'((a|b))')
+        self.assertIsNone(xsd_pattern(r'(?i)abc'))
+        # `$` matches before a final line break, `^` and `$` bind to branches of top-level `|`
+        self.assertIsNone(xsd_pattern(r'^\d{4}-\d{5}$'))
+        self.assertIsNone(xsd_pattern(r'^A|B\Z'))
+
+        # text between children is ignored, numbers are accepted in all python forms
+        xml = b"<Contacts>a<Person name='a' address='b'>x<Email/>y<Phone number=' 1_000 '/>z</Person>tail</Contacts>"
+        phone = XmlMapper(xml, Contacts, schema=True).parse()['/Contacts/Person/Phone']
+        self.assertEqual(phone.number, 1000)
+
+        class Point(Model):
+            x = FloatField()
+        schema = ModelSchema(Point)
+        self.assertIn(Point, schema.trusted)
+        for value in ("nan", "-Infinity", "1_0.5e-3", " .5 ", "1.", "NaN", "INF"):
+            point = XmlMapper(f"<Point x='{value}'/>".encode(), Point, schema=schema).parse()['/Point']
+            self.assertEqual(repr(point.x), repr(float(value)))
+        with self.assertRaises(RuntimeError):
+            XmlMapper(b"<Point x='1__0'/>", Point, schema=schema).parse()
+
+        # classes of inexact translations are still checked by python
+        class Tag(Model):
+            name = StringField(re=r'^\w+$')
+        self.assertIsNone(xsd_pattern(r'^\w+$'))
+        self.assertNotIn(Tag, ModelSchema(Tag).trusted)
+        with self.assertRaises(AttributeError):
+            XmlMapper(b'<Tag name="a+b"/>', Tag, schema=True).parse()
+        self.assertEqual(XmlMapper(b'<Tag name="a_b"/>', Tag, schema=True).parse()['/Tag'].name, "a_b")
+
+    def test_iter_records(self):
+        people = list(XmlMapper.iter_records(contacts_xmlfile, Contacts))
+        self.assertEqual([ p.name for p in people ], ['Alice', 'Rabbit'])
+        self.assertIsNone(people[0].getParent())
+        self.assertEqual([ p.number for p in people[0].getChildren('Phone') ], [513754619, 611953242])
+
+        phones = XmlMapper.iter_records(gzip.compress(open(contacts_xmlfile, 'rb').read()), Contacts, level=2)
+        self.assertEqual(sum( 1 for obj in phones if obj.getClassName() == 'Phone' ), 3)
+
+        # records are yielded before the count error of root's children
+        class Pair(Model):
+            class Item(Model):
+                __count__ = 2
+        records = XmlMapper.iter_records(b"<Pair><Item/></Pair>", Pair)
+        self.assertEqual(next(records).getClassName(), 'Item')
+        with self.assertRaises(RuntimeError):
+            next(records)
+
+    def test_record_index(self):
+        class Directory(Model):
+            class Person(Model):
+                name = StringField(primary_key=True)
+                class Phone(Model):
+                    number = IntegerField(primary_key=True)
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "contacts.xml")
+            with open(path, "wb") as file:
+                file.write(open(contacts_xmlfile, "rb").read().replace(b"Contacts", b"Directory").replace(b"<Email>", b"<!--").replace(b"</Email>", b"-->"))
+
+            index = build_index(path, Directory, [Directory.Person, Directory.Person.Phone])
+            self.assertEqual([ e.line for e in index ], [2, 4, 5, 7, 9])
+            index = RecordIndex.load(index_path(path))
+
+            rabbit = XmlMapper.load_record(path, index, "Rabbit", Directory)
+            self.assertEqual(rabbit.name, 'Rabbit')
+            self.assertEqual([ p.number for p in rabbit.getChildren('Phone') ], [645118456])
+            self.assertEqual(XmlMapper.load_record(path, index_path(path), 611953242, Directory).number, 611953242)
+            self.assertEqual(XmlMapper.load_record(path, index, "/Directory/Person[2]/Phone", Directory).number, 645118456)
+            with self.assertRaises(KeyError):
+                XmlMapper.load_record(path, index, "Hatter", Directory)
+
+            # a changed file is detected
+            with open(path, "ab") as file:
+                file.write(b"\n")
+            with self.assertRaises(RuntimeError):
+                XmlMapper.load_record(path, index, "Rabbit", Directory)
+
+    def test_document_cache(self):
+        with tempfile.TemporaryDirectory() as folder:
+            contacts, addresses = os.path.join(folder, "contacts.xml"), os.path.join(folder, "addresses.xml")
+            shutil.copy(contacts_xmlfile, contacts)
+            shutil.copy(addresses_xmlfile, addresses)
+
+            # concurrent requests parse once
+            cache = DocumentCache(1 << 30)
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                maps = list(executor.map(lambda _: cache.get(contacts, Contacts), range(8)))
+            self.assertTrue(all( m is maps[0] for m in maps ))
+            self.assertEqual((cache.misses, cache.hits), (1, 7))
+            self.assertTrue(maps[0]['/Contacts'].isFrozen())
+
+            # a changed file is parsed again
+            stat = os.stat(contacts)
+            os.utime(contacts, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+            self.assertIsNot(cache.get(contacts, Contacts), maps[0])
+            self.assertEqual(cache.invalidations, 1)
+
+            # budget holds one document, least recently used is evicted
+            cache = DocumentCache(cache.size)
+            cache.get(contacts, Contacts)
+            cache.get(addresses, Addresses)
+            self.assertEqual(cache.evictions, 1)
+            self.assertNotIn((contacts, Contacts), cache)
+            self.assertIn((addresses, Addresses), cache)
+            self.assertLessEqual(cache.size, cache.budget)
+
     # TODO: add more test cases.
\ No newline at end of file
@@ -1 +1,5 @@
-from .spider import XmlLinker, XmlMapper
\ No newline at end of file
+from xo.orm.mapper import XmlMapper
+from .spider import Crawler, CrawlResult, ModelRegistry, sniff_root_tag
+
+
+__all__ = ['Crawler', 'CrawlResult', 'ModelRegistry', 'sniff_root_tag', 'XmlMapper']
@@ -0,0 +1,283 @@
+"""
+# Crawl a directory of xml files into model objects
+#
+# Copyright (C) 2019 ZIJIAN JIANG
+"""
+
+import os
+import json
+import time
+import fnmatch
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from lxml import etree
+from xo import logger
+from xo.orm.common import open_xml_source
+from xo.orm.mapper import XmlMapper
+
+
+def sniff_root_tag(path: str) -> str:
+    """Read tag of root element of xml file, only the beginning of file is parsed.
+
+    Args:
+        path: Xml file path, could be compressed.
+
+    Returns:
+        Root tag without namespace.
+    """
+    with open_xml_source(path) as (src, _):
+        for _, elem in etree.iterparse(src, events=("start",)):
+            tag = elem.tag
+            return tag[tag.find('}')+1:]
+    raise ValueError(f"File {path} has no root element")
+
+
+class ModelRegistry(object):
+    """Registry of `Model` classes keyed by root tag of xml files they map.
+    """
+    def __init__(self, *model_classes: type):
+        self._models: Dict[str, type] = dict()
+        for model_cls in model_classes:
+            self.register(model_cls)
+
+    def register(self, model_cls: type, root_tag: str = None) -> type:
+        """Register `model_cls` for xml files whose root tag is `root_tag`.
+
+        Could be used as class decorator.
+
+        Args:
+            model_cls: Root `Model` class.
+            root_tag: Root tag, default is class name of `model_cls`.
+
+        Returns:
+            `model_cls`.
+        """
+        root_tag = root_tag or model_cls.getClassName()
+        if root_tag in self._models and self._models[root_tag] is not model_cls:
+            raise ValueError(f"Root tag '{root_tag}' is already registered by '{self._models[root_tag].getClassQualName()}'")
+        self._models[root_tag] = model_cls
+        return model_cls
+
+    def resolve(self, root_tag: str) -> type:
+        """
+        Returns:
+            `Model` class registered for `root_tag`.
+
+        Raises:
+            KeyError: No model is registered for `root_tag`.
+        """
+        try:
+            return self._models[root_tag]
+        except KeyError:
+            raise KeyError(f"No model registered for root tag '{root_tag}'")
+
+    def __contains__(self, root_tag):
+        return root_tag in self._models
+
+    def __len__(self):
+        return len(self._models)
+
+
+class CrawlResult(object):
+    """Result of crawling one file.
+
+    Attributes:
+        path: Xml file path.
+        model_cls: `Model` class used, `None` if root tag is not resolved.
+        obj_map: Mapped objects, `None` if failed or skipped.
+        error: Exception raised, `None` if succeeded.
+        elapsed: Seconds spent on this file in worker.
+        skipped: File is unchanged since last crawl, not mapped again.
+    """
+    __slots__ = [ 'path', 'model_cls', 'obj_map', 'error', 'elapsed', 'skipped', 'signature' ]
+
+    def __init__(self, path, *, model_cls=None, obj_map=None, error=None, elapsed=0.0, skipped=False, signature=None):
+        self.path = path
+        self.model_cls = model_cls
+        self.obj_map = obj_map
+        self.error = error
+        self.elapsed = elapsed
+        self.skipped = skipped
+        self.signature = signature
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        status = 'skipped' if self.skipped else ('ok' if self.ok else f'error={self.error!r}')
+        return f'<CrawlResult {self.path} {status} {self.elapsed:.3f}s>'
+
+
+def _file_hash(path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _crawl_job(path: str, models: Dict[str, type], options: dict, previous_hash: str, use_hash: bool) -> CrawlResult:
+    """*Internal* worker, route one file to its model and map it.
+    """
+    start = time.perf_counter()
+    model_cls = None
+    signature = None
+    try:
+        stat = os.stat(path)
+        signature = { 'mtime': stat.st_mtime_ns, 'size': stat.st_size }
+        if use_hash:
+            signature['hash'] = _file_hash(path)
+            if previous_hash is not None and signature['hash'] == previous_hash:
+                return CrawlResult(path, skipped=True, elapsed=time.perf_counter() - start, signature=signature)
+
+        root_tag = sniff_root_tag(path)
+        if root_tag not in models:
+            raise KeyError(f"No model registered for root tag '{root_tag}'")
+        model_cls = models[root_tag]
+        obj_map = XmlMapper(path, model_cls, **options).parse()
+        return CrawlResult(path, model_cls=model_cls, obj_map=obj_map, elapsed=time.perf_counter() - start, signature=signature)
+
+    except Exception as e:
+        return CrawlResult(path, model_cls=model_cls, error=e, elapsed=time.perf_counter() - start, signature=signature)
+
+
+class Crawler(object):
+    """Crawl xml files under a directory, map each of them with `Model` class of its root tag in a worker pool.
+
+    Example:
+
+        registry = ModelRegistry(Contacts, Addresses)
+        crawler = Crawler("./project", registry, include=["*.xml", "*.xml.gz"], state=".xo-state.json")
+        for result in crawler.crawl():
+            if result.ok:
+                print(result.path, result.elapsed, len(result.obj_map))
+            else:
+                print(result.path, result.error)
+    """
+    def __init__(self, root: str, registry: ModelRegistry, *,
+                 include: Iterable[str] = ("*.xml",), exclude: Iterable[str] = (), recursive: bool = True,
+                 workers: int = None, processes: bool = False,
+                 state: str = None, check: str = "mtime", **mapper_options):
+        """
+        Args:
+            root: Directory to crawl.
+            registry: `ModelRegistry` routing files to models.
+            include: Glob patterns of file names to crawl.
+            exclude: Glob patterns of paths (relative to `root`) or file names to skip.
+            recursive: Crawl sub directories.
+            workers: Number of workers, default is number of cpus.
+            processes: Use process pool instead of thread pool, models must be importable by workers.
+            state: Json file keeping signatures of crawled files, unchanged files are skipped in next crawl.
+            check: `"mtime"` file is unchanged if mtime and size are the same;
+                   `"hash"` file is unchanged if content hash is the same (mtime and size are checked first).
+            mapper_options: Keyword arguments of `XmlMapper`.
+        """
+        if check not in ("mtime", "hash"):
+            raise ValueError(f"Unknown check '{check}', expect 'mtime' or 'hash'")
+
+        self.root = root
+        self.registry = registry
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self.recursive = recursive
+        self.workers = workers or os.cpu_count() or 1
+        self.processes = processes
+        self.state = state
+        self.check = check
+        self.mapper_options = mapper_options
+
+    def discover(self) -> Iterator[str]:
+        """
+        Yields:
+            Paths of files to crawl, in sorted order.
+        """
+        base = Path(self.root)
+        paths = base.rglob("*") if self.recursive else base.glob("*")
+        for path in sorted(paths):
+            if not path.is_file():
+                continue
+            relative = path.relative_to(base).as_posix()
+            if not any( fnmatch.fnmatch(path.name, pattern) for pattern in self.include ):
+                continue
+            if any( fnmatch.fnmatch(relative, pattern) or fnmatch.fnmatch(path.name, pattern) for pattern in self.exclude ):
+                continue
+            yield str(path)
+
+    def _load_state(self) -> Dict[str, dict]:
+        if self.state is None or not os.path.isfile(self.state):
+            return dict()
+        with open(self.state, "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def _save_state(self, state: Dict[str, dict]):
+        if self.state is None:
+            return
+        tmp = f"{self.state}.tmp"
+        with open(tmp, "w", encoding="utf-8") as file:
+            json.dump(state, file)
+        os.replace(tmp, self.state)
+
+    def crawl(self, *, yield_skipped: bool = False) -> Iterator[CrawlResult]:
+        """Crawl files, yield results as soon as they are done.
+
+        Args:
+            yield_skipped: Also yield results of unchanged files.
+
+        Yields:
+            `CrawlResult`.
+        """
+        state = self._load_state()
+        models = dict(self.registry._models)
+        use_hash = self.check == "hash"
+
+        Pool = ProcessPoolExecutor if self.processes else ThreadPoolExecutor
+        with Pool(max_workers=self.workers) as executor:
+            pending = set()
+            try:
+                for path in self.discover():
+                    previous = state.get(path)
+                    stat = os.stat(path)
+                    if previous is not None and previous.get('mtime') == stat.st_mtime_ns and previous.get('size') == stat.st_size:
+                        if yield_skipped:
+                            yield CrawlResult(path, skipped=True, signature=previous)
+                        continue
+
+                    previous_hash = previous.get('hash') if previous else None
+                    pending.add( executor.submit(_crawl_job, path, models, self.mapper_options, previous_hash, use_hash) )
+
+                    # bound number of results waiting in memory
+                    if len(pending) >= self.workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for result in self._collect(done, state, yield_skipped):
+                            yield result
+                #endfor
+
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for result in self._collect(done, state, yield_skipped):
+                        yield result
+            finally:
+                for future in pending:
+                    future.cancel()
+                self._save_state(state)
+
+    def _collect(self, done, state: Dict[str, dict], yield_skipped: bool) -> List[CrawlResult]:
+        """*Internal* record signatures of finished files, return results to yield.
+        """
+        results = [ ]
+        for future in done:
+            result = future.result()
+            if result.ok and result.signature is not None:
+                state[result.path] = result.signature
+            elif not result.ok:
+                state.pop(result.path, None)
+                logger.warning(f"Crawl failed: {result.path}: {result.error}")
+
+            if yield_skipped or not result.skipped:
+                results.append(result)
+        #endfor
+        return results
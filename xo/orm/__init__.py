@@ -1,7 +1,8 @@
 from .model import Model
-from .field import Optional, StringField, FloatField, ForeignKeyField, IntegerField, ForeignKeyArrayField
-from .convert import toElement
+from .field import Optional, StringField, FloatField, ForeignKeyField, IntegerField, ForeignKeyArrayField, ChoiceField, EnumField
+from .convert import toElement, toDict, toXml, dump_ndjson, toColumns
 
 
 __all__ = ['Model', 'Optional',
-           'StringField', 'FloatField', 'ForeignKeyField', 'IntegerField', 'ForeignKeyArrayField', 'toElement']
\ No newline at end of file
+           'StringField', 'FloatField', 'ForeignKeyField', 'IntegerField', 'ForeignKeyArrayField', 'ChoiceField', 'EnumField', 'toElement',
+           'toDict', 'toXml', 'dump_ndjson', 'toColumns']
\ No newline at end of file
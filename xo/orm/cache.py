@@ -0,0 +1,183 @@
+"""
+# In-process cache of mapped documents, bounded by memory
+#
+# Copyright (C) 2019 ZIJIAN JIANG
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Tuple
+
+from .memory import memory_report
+from .mapper import XmlMapper
+
+
+class _Entry(object):
+    """*Internal* cached document.
+    """
+    __slots__ = [ 'signature', 'obj_map', 'size' ]
+
+    def __init__(self, signature: Tuple[int, int], obj_map: dict, size: int):
+        self.signature = signature
+        self.obj_map = obj_map
+        self.size = size
+
+
+class DocumentCache(object):
+    """Least recently used cache of mapped xml files, keyed by (path, model class), for long-running services.
+
+    A cached document is dropped when size or mtime of its file changes. Documents are evicted, least
+    recently used first, when their estimated memory (see `xo.orm.memory.memory_report`) exceeds `budget`.
+    Concurrent `get()` of the same missing document parse it once, in the first calling thread.
+
+    Cached documents are shared by all callers: they are frozen by default (see `Model.freeze()`),
+    use `thaw()` of an object for a mutable copy.
+
+    Example:
+
+        cache = DocumentCache(512 << 20)
+        contacts = cache.get("contacts.xml", Contacts)['/Contacts']
+
+    Attributes:
+        budget: Maximum estimated bytes of cached documents.
+        hits: Number of `get()` served from cache, waiting for a concurrent parse included.
+        misses: Number of `get()` that parsed the file.
+        evictions: Number of documents evicted for the budget.
+        invalidations: Number of documents dropped because their files changed.
+    """
+    def __init__(self, budget: int, *, freeze: bool = True, **mapper_options):
+        """
+        Args:
+            budget: Maximum estimated bytes of cached documents, a document larger than it is returned but not kept.
+            freeze: Freeze root of every cached document.
+            mapper_options: Options of `XmlMapper`.
+        """
+        self.budget = budget
+        self.freeze = freeze
+        self.mapper_options = mapper_options
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key: _Entry, least recently used first
+        self._loading = dict()          # key: Future of a parse in progress
+        self._size = 0
+
+    @property
+    def size(self) -> int:
+        """Estimated bytes of cached documents.
+        """
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        path, model_cls = key
+        return (os.path.abspath(path), model_cls) in self._entries
+
+    def get(self, path: str, model_cls: type) -> dict:
+        """Mapped objects of xml file `path`, parsed at first `get()` or after the file changed.
+
+        Args:
+            path: Xml file path.
+            model_cls: `Model` class.
+
+        Returns:
+            Map of xpath to objects, see `XmlMapper.parse()`.
+
+        Raises:
+            Exceptions of `XmlMapper.parse()`, raised in all threads waiting for the same parse.
+        """
+        key = (os.path.abspath(path), model_cls)
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        loading = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.signature != signature:
+                self._drop(key)
+                self.invalidations += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.obj_map
+
+            future = self._loading.get(key)
+            if future is not None:
+                self.hits += 1
+            else:
+                future = self._loading[key] = Future()
+                self.misses += 1
+                loading = True
+        #endwith
+
+        if not loading:
+            return future.result()
+
+        try:
+            obj_map = self._parse(path, model_cls)
+            size = memory_report(obj_map, top=0).total
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._loading[key]
+            if size <= self.budget:
+                self._entries[key] = _Entry(signature, obj_map, size)
+                self._size += size
+                self._evict()
+        future.set_result(obj_map)
+        return obj_map
+
+    def _parse(self, path: str, model_cls: type) -> dict:
+        """*Internal* map file, outside of the lock.
+        """
+        obj_map = XmlMapper(path, model_cls, **self.mapper_options).parse()
+        if self.freeze:
+            obj_map[f'/{model_cls.getClassName()}'].freeze()
+        return obj_map
+
+    def _drop(self, key):
+        """*Internal* remove entry of `key`, under the lock.
+        """
+        entry = self._entries.pop(key)
+        self._size -= entry.size
+
+    def _evict(self):
+        """*Internal* evict least recently used entries until within budget, under the lock.
+        """
+        while self._size > self.budget and self._entries:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+        #endwhile
+
+    def invalidate(self, path: str, model_cls: type = None):
+        """Drop cached documents of `path`, of all model classes by default.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            for key in [ k for k in self._entries if k[0] == path and (model_cls is None or k[1] is model_cls) ]:
+                self._drop(key)
+                self.invalidations += 1
+        #endwith
+
+    def clear(self):
+        """Drop all cached documents, counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        return { 'documents': len(self._entries), 'size': self._size, 'budget': self.budget, 'hits': self.hits,
+                 'misses': self.misses, 'evictions': self.evictions, 'invalidations': self.invalidations }
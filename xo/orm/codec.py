@@ -0,0 +1,169 @@
+import weakref
+from typing import List
+
+from .field import ForeignKeyField, ForeignKeyArrayField
+
+
+def pack_graph(root, *, with_index: bool = False, external: list = None):
+    """Pack object graph under `root` into flat node array.
+
+    Nodes are listed in depth first order, every node only refers to its parent by index,
+    so packing and pickling the result never recurse along the graph.
+
+    Packed format:
+        (classes, nodes, refs)
+        classes: List of model classes.
+        nodes: List of (class index, parent index or -1, weak parent, dict of attribute values).
+        refs: List of (node index, key, node index or list of node index) of foreign keys
+              refering to objects inside the graph.
+
+    Args:
+        root: Root object of graph, could be any object of a graph.
+        with_index: Also return dict of id(object): node index.
+        external: List to collect (node index, key, value) of foreign keys refering to objects outside
+                  of the graph, they are removed from nodes; in a list value, objects inside the graph
+                  are replaced by their node index. See `set_external`.
+
+    Returns:
+        Packed graph, or tuple of (packed graph, index) if `with_index`.
+    """
+    classes = [ ]
+    class_index = dict()
+    nodes = [ ]
+    index = dict()
+    foreign = [ ]
+
+    stack = [ (root, -1) ]
+    while stack:
+        obj, parent_idx = stack.pop()
+        cls = obj.__class__
+
+        cls_idx = class_index.get(cls)
+        if cls_idx is None:
+            cls_idx = class_index[cls] = len(classes)
+            classes.append(cls)
+
+        weak = False
+        values = dict()
+        for k, v in obj.items():
+            if k.startswith('__'):
+                if k.startswith('__parent'):
+                    weak = type(v) is weakref.ref
+                continue
+            values[k] = v
+
+        for k, field in obj.getFieldItems():
+            if type(field) in (ForeignKeyField, ForeignKeyArrayField) and k in values:
+                foreign.append( (len(nodes), k, values[k]) )
+        #endfor
+
+        index[id(obj)] = len(nodes)
+        nodes.append( (cls_idx, parent_idx, weak, values) )
+
+        node_idx = len(nodes) - 1
+        children = [ ]
+        for childcls in obj.getChildClasses():
+            children += [ (child, node_idx) for child in obj[f'__child{childcls.getClassName()}'] ]
+        stack.extend(reversed(children))
+    #endwhile
+
+    # foreign keys refering to objects inside graph become indexes
+    refs = [ ]
+    for node_idx, k, value in foreign:
+        if type(value) is list and all( id(v) in index for v in value ):
+            refs.append( (node_idx, k, [ index[id(v)] for v in value ]) )
+            del nodes[node_idx][3][k]
+        elif value is not None and type(value) is not list and id(value) in index:
+            refs.append( (node_idx, k, index[id(value)]) )
+            del nodes[node_idx][3][k]
+        elif value is not None and external is not None:
+            if type(value) is list:
+                value = [ index.get(id(v), v) for v in value ]
+            external.append( (node_idx, k, value) )
+            del nodes[node_idx][3][k]
+    #endfor
+
+    packed = (classes, nodes, refs)
+    if with_index:
+        return packed, index
+    return packed
+
+
+def unpack_graph(packed) -> List:
+    """Rebuild object graph packed by `pack_graph`, without running `Model.__init__` validation.
+
+    Args:
+        packed: Packed graph.
+
+    Returns:
+        List of objects in node order, the first one is root.
+    """
+    classes, nodes, refs = packed
+
+    objs = [ ]
+    for cls_idx, parent_idx, weak, values in nodes:
+        cls = classes[cls_idx]
+        obj = cls.__new__(cls)
+        obj.update(values)
+        obj._initLinks()
+
+        if parent_idx >= 0:
+            parent = objs[parent_idx]
+            obj[f'__parent{parent.getClassName()}'] = weakref.ref(parent) if weak else parent
+            parent[f'__child{cls.getClassName()}'].append(obj)
+
+        objs.append(obj)
+    #endfor
+
+    for node_idx, k, ref in refs:
+        if type(ref) is list:
+            objs[node_idx][k] = [ objs[i] for i in ref ]
+        else:
+            objs[node_idx][k] = objs[ref]
+    #endfor
+
+    return objs
+
+
+def iter_graph(root):
+    """Objects of graph under `root`, in node order of `pack_graph`.
+    """
+    stack = [ root ]
+    while stack:
+        obj = stack.pop()
+        yield obj
+
+        children = [ ]
+        for childcls in obj.getChildClasses():
+            children += obj[f'__child{childcls.getClassName()}']
+        stack.extend(reversed(children))
+    #endwhile
+
+
+def unpack_node(packed, node_idx: int):
+    """Rebuild object graph and return object of `node_idx`, used by `Model.__reduce__`.
+    """
+    return unpack_graph(packed)[node_idx]
+
+
+def node_of(root, path: tuple):
+    """Object at `path` of (container key, position) under `root`, used by `Model.__reduce__` of non-root objects.
+    """
+    obj = root
+    for key, position in path:
+        obj = obj[key][position]
+    return obj
+
+
+def set_external(root, external: list):
+    """Assign foreign keys collected by `pack_graph(external=...)` in graph under `root`.
+
+    Used by `Model.__setstate__`: pickle restores the state after the graph, so graphs
+    refering to each other are restored through the pickle memo instead of recursion.
+    """
+    objs = list(iter_graph(root))
+    for node_idx, k, value in external:
+        if type(value) is list:
+            value = [ objs[v] if type(v) is int else v for v in value ]
+        objs[node_idx][k] = value
+    #endfor
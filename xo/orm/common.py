@@ -1,5 +1,16 @@
+import io
+import os
+import copy
 import re
+import gc
+import sys
+import bz2
+import gzip
+import lzma
+import mmap
 import inspect
+from concurrent.futures import CancelledError
+from contextlib import contextmanager
 from typing import Type, List
 from lxml import etree, objectify
 
@@ -7,11 +18,11 @@ from lxml import etree, objectify
 #   File Utilities
 # ==========================================
 
-def xml2tree(path: str) -> etree._Element:
+def xml2tree(path) -> etree._Element:
     """Read etree from xml file.
     
     Args:
-        path: Xml file path.
+        path: Xml file path, or any source accepted by `parse_xml`.
     
     Returns:
         Etree.
@@ -20,9 +31,8 @@ def xml2tree(path: str) -> etree._Element:
         IOError: Failed to read file.
         Exception: Bug
     """
-    with open(path, "r", encoding="utf-8") as file:
-        tree = etree.parse(file)
-        
+    tree = parse_xml(path)
+
     root = tree.getroot()
     if not etree.iselement(root):
         raise Exception("error")
@@ -39,12 +49,204 @@ def xml2file(root: etree._Element, path: str):
         IOError: Failed to write file.
     """
     with open(path, mode='wb') as file:
-        parser = etree.XMLParser(encoding='utf-8',remove_blank_text=True)
-        string = str(etree.tostring(root, pretty_print=True, encoding='unicode'))
-        string = string.encode('utf-8')
-        root = etree.XML(string, parser)
-        output = b"<?xml version=\"1.0\" encoding=\"utf-8\"?>" + b"\n" + etree.tostring(root, pretty_print=True, encoding='utf-8', xml_declaration=False)
-        file.write(output)
+        file.write(tree2bytes(root))
+
+def tree2bytes(root: etree._Element) -> bytes:
+    """Serialise etree root as indented utf-8 xml document, in one pass.
+
+    Whitespace-only texts are re-indented, `root` itself is not modified.
+    """
+    root = copy.deepcopy(root)
+    etree.indent(root)
+    return b"<?xml version=\"1.0\" encoding=\"utf-8\"?>" + b"\n" + etree.tostring(root, pretty_print=True, encoding='utf-8', xml_declaration=False)
+
+_MAGICS = [
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+]
+
+_FEED_SIZE = 1 << 20
+
+def sniff_compression(head: bytes) -> str:
+    """Detect compression format from leading bytes.
+
+    Returns:
+        `"gzip"`, `"bz2"`, `"xz"`, `"zstd"` or `None` if not compressed.
+    """
+    for magic, name in _MAGICS:
+        if head[:len(magic)] == magic:
+            return name
+    return None
+
+def _decompressor(fileobj, compression: str):
+    """*Internal* wrap binary file object with streaming decompressor.
+    """
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    elif compression == "bz2":
+        return bz2.BZ2File(fileobj, mode="rb")
+    elif compression == "xz":
+        return lzma.LZMAFile(fileobj, mode="rb")
+    elif compression == "zstd":
+        try:
+            from compression import zstd
+            return zstd.ZstdFile(fileobj, mode="rb")
+        except ImportError:
+            pass
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading zstd compressed xml requires package 'zstandard'")
+        return zstandard.ZstdDecompressor().stream_reader(fileobj)
+    else:
+        raise ValueError(f"Unknown compression '{compression}'")
+
+@contextmanager
+def open_xml_source(source):
+    """Open xml source for binary parsing.
+
+    Args:
+        source: One of
+            file path (`str` or `os.PathLike`);
+            `bytes`, `bytearray`, `memoryview` or `mmap.mmap` of the document;
+            binary file object (text file object is accepted but lxml has to re-encode it).
+            Gzip, bz2, xz and zstd compressed sources are decompressed transparently.
+
+    Yields:
+        Tuple of (src, base_url), `src` is file path, `bytes`, buffer or binary file object.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        path = os.fspath(source)
+        with open(path, "rb") as file:
+            compression = sniff_compression(file.read(6))
+
+        if compression is None:
+            # let libxml2 read the file itself
+            yield path, path
+        else:
+            with open(path, "rb") as file, _decompressor(file, compression) as stream:
+                yield stream, path
+
+    elif isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        compression = sniff_compression(bytes(source[:6]))
+        if compression is None:
+            yield source, None
+        else:
+            fileobj = source if isinstance(source, mmap.mmap) else io.BytesIO(source)
+            fileobj.seek(0)
+            with _decompressor(fileobj, compression) as stream:
+                yield stream, None
+
+    elif hasattr(source, "read"):
+        base_url = getattr(source, "name", None)
+        base_url = base_url if isinstance(base_url, str) else None
+        if isinstance(source, io.TextIOBase):
+            yield source, base_url
+            return
+
+        if hasattr(source, "peek"):
+            head = source.peek(6)[:6]
+        elif source.seekable():
+            position = source.tell()
+            head = source.read(6)
+            source.seek(position)
+        else:
+            head = b""
+
+        compression = sniff_compression(head)
+        if compression is None:
+            yield source, base_url
+        else:
+            with _decompressor(source, compression) as stream:
+                yield stream, base_url
+
+    else:
+        raise TypeError(f"Unsupported xml source type '{type(source).__name__}'")
+
+def parse_xml(source, parser: etree.XMLParser = None, *, cancel=None) -> etree._ElementTree:
+    """Parse xml source in binary mode, see `open_xml_source` for accepted sources.
+
+    Args:
+        source: Xml source.
+        parser: Lxml parser, default parser if `None`.
+        cancel: `threading.Event`, if given, source is fed to parser by slices
+                and parsing stops as soon as it is set.
+
+    Returns:
+        Etree.
+
+    Raises:
+        CancelledError: `cancel` is set.
+    """
+    with open_xml_source(source) as (src, base_url):
+        if isinstance(src, bytes) and cancel is None:
+            return etree.fromstring(src, parser, base_url=base_url).getroottree()
+
+        elif not isinstance(src, (bytes, bytearray, memoryview, mmap.mmap)) and cancel is None:
+            return etree.parse(src, parser, base_url=base_url)
+
+        parser = parser if parser is not None else etree.XMLParser()
+        tree = _feed(src, parser, cancel).getroottree()
+        if base_url:
+            tree.docinfo.URL = base_url
+        return tree
+
+def feed_xml(source, parser: etree.XMLParser, *, cancel=None):
+    """Feed xml source to `parser` by slices, see `open_xml_source` for accepted sources.
+
+    Works with parser target (`etree.XMLParser(target=...)`), no tree is built then.
+
+    Args:
+        source: Xml source.
+        parser: Lxml parser.
+        cancel: `threading.Event`, stop as soon as it is set.
+
+    Returns:
+        Result of `parser.close()`.
+
+    Raises:
+        CancelledError: `cancel` is set.
+    """
+    with open_xml_source(source) as (src, _):
+        return _feed(src, parser, cancel)
+
+def _feed(src, parser: etree.XMLParser, cancel):
+    """*Internal* feed opened source to parser, return `parser.close()`.
+    """
+    if isinstance(src, (bytes, bytearray, memoryview, mmap.mmap)):
+        # feed slices, never copy the whole buffer
+        view = memoryview(src) if not isinstance(src, mmap.mmap) else src
+        chunks = ( bytes(view[i:i+_FEED_SIZE]) for i in range(0, len(view), _FEED_SIZE) )
+    elif isinstance(src, str):
+        # file path
+        chunks = _read_chunks(open(src, "rb"), close=True)
+    else:
+        chunks = _read_chunks(src)
+
+    try:
+        for chunk in chunks:
+            if cancel is not None and cancel.is_set():
+                raise CancelledError()
+            parser.feed(chunk)
+        #endfor
+    finally:
+        chunks.close()
+    return parser.close()
+
+def _read_chunks(file, *, close=False):
+    """*Internal* read file object by chunks.
+    """
+    try:
+        while True:
+            chunk = file.read(_FEED_SIZE)
+            if not chunk:
+                break
+            yield chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+    finally:
+        if close:
+            file.close()
 
 def strip_xpath_index(xpath: str):
     """
@@ -82,9 +284,29 @@ def get_all_class_types(cls: Type) -> List[Type]:
 
     return cls_list
 
-def read_xml_without_namespace(xml_file: str) -> etree._Element:
+def strip_namespace(root: etree._Element):
+    """Remove namespaces of tags and attributes of elements in subtree of `root`, in place.
+    """
+    # check if the element in the xml has namespace#
+    for elem in root.iter():
+        if not isinstance(elem.tag, str):
+            continue
+        i = elem.tag.find('}')
+        if i >= 0:
+            elem.tag = elem.tag[i+1:]
+            for attribute in elem.attrib:
+                j = attribute.find('}')
+                if j >= 0:
+                    value = elem.attrib[attribute]
+                    del elem.attrib[attribute]
+                    elem.attrib[attribute[j+1:]] = value
+    #endfor
+
+def read_xml_without_namespace(xml_file, *, cancel=None) -> etree._Element:
     '''This function receive a xml file and return an etree of this xml without any namespace related symbols.
 
+    `xml_file` could be any source accepted by `parse_xml`, see `parse_xml` for `cancel`.
+
     Example: 
         {http://www.omg.org/XMI}version -> version
         conf:Conf -> Conf
@@ -94,23 +316,357 @@ def read_xml_without_namespace(xml_file: str) -> etree._Element:
     '''
     # remove annotation in the origin xml #
     parser = etree.XMLParser(remove_comments=True)
-    tree = etree.parse(xml_file, parser)
+    tree = parse_xml(xml_file, parser, cancel=cancel)
     root = tree.getroot()
 
-    # check if the element in the xml has namespace#
-    for elem in root.getiterator():
-        i = elem.tag.find('}')
-        if i >= 0:
-            elem.tag = elem.tag[i+1:]
-            for attribute in elem.attrib:
-                j = attribute.find('}')
-                if j >= 0:
-                    value = elem.attrib[attribute]
-                    del elem.attrib[attribute]
-                    elem.attrib[attribute[j+1:]] = value
+    strip_namespace(root)
     objectify.deannotate(root, cleanup_namespaces=True)
 
     if not etree.iselement(root):
         raise Exception("error")
 
     return tree
+
+
+# ==========================================
+#   Raw Bytes Scanning
+# ==========================================
+
+_XML_TOKEN = re.compile(br"""<!--.*?-->|<!\[CDATA\[.*?\]\]>|<\?.*?\?>|<!DOCTYPE(?:[^\[>]|\[.*?\])*>"""
+                        br"""|<(/?)([^\s/>!?]+)(?:[^>"']|"[^"]*"|'[^']*')*?(/?)>""", re.S)
+
+def scan_xml_tags(buf, pos: int = 0):
+    """Scan raw xml bytes for element tags, without decoding or building any node.
+
+    Comments, CDATA sections, processing instructions and doctype are skipped.
+
+    Args:
+        buf: Bytes like object, `bytes` or `mmap`.
+        pos: Offset to start scanning.
+
+    Yields:
+        Tuple of (kind, name, start, end), kind is one of `'start'`, `'end'`, `'empty'`;
+        `buf[start:end]` is the whole tag.
+    """
+    for m in _XML_TOKEN.finditer(buf, pos):
+        name = m.group(2)
+        if name is None:
+            continue
+        elif m.group(1):
+            yield 'end', name, m.start(), m.end()
+        elif m.group(3):
+            yield 'empty', name, m.start(), m.end()
+        else:
+            yield 'start', name, m.start(), m.end()
+
+def read_xml_bytes(source) -> bytes:
+    """Read whole (decompressed) document of xml source, see `open_xml_source` for accepted sources.
+    """
+    with open_xml_source(source) as (src, _):
+        if isinstance(src, str):
+            with open(src, "rb") as file:
+                return file.read()
+        elif isinstance(src, (bytes, bytearray, memoryview, mmap.mmap)):
+            return bytes(src)
+        else:
+            data = src.read()
+            return data.encode('utf-8') if isinstance(data, str) else data
+
+def element_spans(buf) -> List[tuple]:
+    """Byte spans of all elements in raw xml bytes, in document order, see `scan_xml_tags`.
+
+    Args:
+        buf: Bytes like object, `bytes` or `mmap`.
+
+    Returns:
+        List of (start, content, text_end, close, end, tail_end) of every element.
+        `buf[start:content]` is the start tag, `buf[content:text_end]` the text before first child,
+        `buf[close:end]` the end tag (`close` is `None` for empty element tag `<a/>`),
+        `buf[end:tail_end]` the tail up to the next tag.
+
+    Raises:
+        ValueError: Tags are not balanced.
+    """
+    spans = [ ]
+    stack = [ ]         # index of open elements
+    last = None         # index of element waiting for its tail_end
+    for kind, name, start, end in scan_xml_tags(buf):
+        if last is not None:
+            spans[last][5] = start
+            last = None
+        if stack and spans[stack[-1]][2] is None:
+            spans[stack[-1]][2] = start
+
+        if kind == 'start':
+            stack.append(len(spans))
+            spans.append( [start, end, None, None, None, None] )
+        elif kind == 'empty':
+            last = len(spans)
+            spans.append( [start, end, end, None, end, None] )
+        else:
+            if not stack:
+                raise ValueError(f"Unbalanced end tag '{name.decode()}' at offset {start}")
+            last = stack.pop()
+            spans[last][3] = start
+            spans[last][4] = end
+    #endfor
+
+    if stack:
+        raise ValueError("Xml is not well-formed, element is not closed")
+    if last is not None:
+        spans[last][5] = len(buf)
+    return [ tuple(span) for span in spans ]
+
+def split_toplevel(buf, partitions: int, names=None):
+    """Split raw xml bytes at boundaries of children of root element.
+
+    With `names`, the buffer is cut at about `len(buf) / partitions` offsets, each moved forward to
+    the next start tag of a root's child; bytes in between are only searched for comments and CDATA
+    sections. Otherwise every tag is scanned to track depth.
+
+    Args:
+        buf: Bytes like object, `bytes` or `mmap`.
+        partitions: Expected number of ranges, ranges are of about the same size.
+        names: Local names (`bytes`) of elements of root's children, that deeper elements never use.
+
+    Returns:
+        Tuple of (prolog, root_open, head, ranges).
+        prolog: Bytes before root element (xml declaration, doctype...).
+        root_open: Start tag of root element, it is self-closing if root has no children.
+        head: Bytes between root start tag and its first child, or its end tag if root has no children.
+        ranges: List of (start, end), each `buf[start:end]` holds a sequence of whole children of root.
+
+    Raises:
+        ValueError: Xml is not well-formed.
+    """
+    if names is None:
+        return _split_scanning(buf, partitions)
+
+    first = next(scan_xml_tags(buf), None)
+    if first is None:
+        raise ValueError("Xml has no root element")
+    kind, root_name, root_start, root_end = first
+    if kind == 'end':
+        raise ValueError(f"Unexpected end tag '{root_name.decode()}' at byte {root_start}")
+    elif kind == 'empty':
+        return buf[:root_start], buf[root_start:root_end], b"", [ ]
+
+    # end tag of root is the last tag, a match in a trailing comment is skipped
+    root_close = len(buf)
+    while True:
+        root_close = buf.rfind(b"</" + root_name, root_end, root_close)
+        if root_close < 0:
+            raise ValueError("Xml is not well-formed, root element is not closed")
+        if _skip_markup(buf, root_end, root_close) == root_close:
+            break
+    #endwhile
+    tail = scan_xml_tags(buf, root_close)
+    kind, name, _, _ = next(tail, (None, None, None, None))
+    if kind != 'end' or name != root_name:
+        raise ValueError("Xml is not well-formed, root element is not closed")
+    extra = next(tail, None)
+    if extra is not None:
+        raise ValueError(f"Extra element '{extra[1].decode()}' after root element, at byte {extra[2]}")
+
+    first_child = next(scan_xml_tags(buf, root_end))[2]
+    if first_child == root_close:
+        return buf[:root_start], buf[root_start:root_end], buf[root_end:root_close], [ ]
+
+    starts = re.compile(br"<(?:[^\s/>!?:]+:)?(?:" + b"|".join( re.escape(n) for n in names ) + br")[\s/>]")
+    target = max(1, (root_close - first_child) // max(1, partitions))
+    bounds = [ first_child ]
+    safe = first_child      # offset known to be outside of comments and CDATA sections
+    pos = first_child + target
+    while pos < root_close:
+        m = starts.search(buf, pos, root_close)
+        if m is None:
+            break
+        safe = _skip_markup(buf, safe, m.start())
+        if safe != m.start():
+            # start tag is text of a comment or CDATA section
+            pos = safe
+            continue
+        bounds.append(safe)
+        pos = safe + target
+    #endwhile
+
+    ranges = list(zip(bounds, bounds[1:] + [ root_close ]))
+    return buf[:root_start], buf[root_start:root_end], buf[root_end:first_child], ranges
+
+_MARKUP_OPEN = re.compile(br"<!--|<!\[CDATA\[")
+
+def _skip_markup(buf, safe: int, pos: int) -> int:
+    """*Internal* `pos` if it is outside of comments and CDATA sections, else end of the one holding it.
+
+    `safe` is an offset before `pos` known to be outside of them, bytes in between are searched.
+    """
+    while True:
+        m = _MARKUP_OPEN.search(buf, safe, pos)
+        if m is None:
+            return pos
+        close = b"-->" if m.group() == b"<!--" else b"]]>"
+        end = buf.find(close, m.end())
+        if end < 0:
+            raise ValueError(f"Xml is not well-formed, markup at byte {m.start()} is not closed")
+        safe = end + len(close)
+        if safe > pos:
+            return safe
+    #endwhile
+
+def _split_scanning(buf, partitions: int):
+    """*Internal* `split_toplevel` scanning every tag.
+    """
+    target = max(1, len(buf) // max(1, partitions))
+    depth = 0
+    root_start = root_end = root_close = first_child = None
+    range_start = child_start = None
+    closed = False
+    ranges = [ ]
+
+    for kind, name, start, end in scan_xml_tags(buf):
+        if closed:
+            raise ValueError(f"Extra element '{name.decode()}' after root element, at byte {start}")
+
+        if depth == 0:
+            if kind == 'end':
+                raise ValueError(f"Unexpected end tag '{name.decode()}' at byte {start}")
+            root_start, root_end = start, end
+            if kind == 'empty':
+                return buf[:start], buf[start:end], b"", [ ]
+            depth = 1
+            continue
+
+        if depth == 1 and kind == 'end':
+            closed = True
+            root_close = start
+            continue
+        elif depth == 1 and kind == 'start':
+            child_start = start
+            depth = 2
+            continue
+        elif depth == 1:
+            # self-closing child
+            child_start = start
+        elif kind == 'start':
+            depth += 1
+            continue
+        elif kind == 'end':
+            depth -= 1
+            if depth > 1:
+                continue
+        else:
+            continue
+        #endif
+
+        # a whole child of root is in buf[child_start:end]
+        if first_child is None:
+            first_child = child_start
+        if range_start is None:
+            range_start = child_start
+        last_end = end
+        if end - range_start >= target:
+            ranges.append( (range_start, end) )
+            range_start = None
+    #endfor
+
+    if not closed:
+        raise ValueError("Xml is not well-formed, root element is not closed")
+
+    if range_start is not None:
+        ranges.append( (range_start, last_end) )
+
+    head_end = first_child if first_child is not None else root_close
+    return buf[:root_start], buf[root_start:root_end], buf[root_end:head_end], ranges
+
+
+
+# ==========================================
+#   Value Interning
+# ==========================================
+
+class InternPool(object):
+    """Pool of deduplicated values.
+
+    Equal values passed to `intern()` are replaced by the first one seen, so repeated
+    attribute values (codes, references, units...) are stored only once.
+    One pool can be shared by many `XmlMapper` to deduplicate across a batch of files.
+
+    Attributes:
+        hits: Number of values replaced by a pooled one.
+        misses: Number of values added into pool.
+        saved_bytes: Approximate bytes saved by replaced values.
+    """
+    __slots__ = [ '_values', 'hits', 'misses', 'saved_bytes' ]
+
+    def __init__(self):
+        self._values = dict()
+        self.hits = 0
+        self.misses = 0
+        self.saved_bytes = 0
+
+    def intern(self, value):
+        """Return pooled value equals to `value`.
+        """
+        pooled = self._values.setdefault(value, value)
+        if pooled is value:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.saved_bytes += sys.getsizeof(value)
+        return pooled
+
+    def clear(self):
+        self._values.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            Dict of `values`, `hits`, `misses` and `saved_bytes`.
+        """
+        return { 'values': len(self._values), 'hits': self.hits, 'misses': self.misses, 'saved_bytes': self.saved_bytes }
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, value):
+        return value in self._values
+
+    def __repr__(self):
+        return f'<InternPool values={len(self._values)} hits={self.hits} saved_bytes={self.saved_bytes}>'
+
+
+
+# ==========================================
+#   Garbage Collector Utilities
+# ==========================================
+
+@contextmanager
+def gc_paused(mode: str = "pause"):
+    """Keep cyclic garbage collector away while building a large object graph.
+
+    Args:
+        mode: `None` do nothing.
+              `"pause"` disable gc inside the block, restore it on exit.
+              `"freeze"` like `"pause"`, then move all objects tracked so far into the permanent
+              generation (`gc.freeze()`), so following collections never rescan the graph.
+              Frozen objects are only freed by reference counting, see `Model.dispose()`.
+
+    Raises:
+        ValueError: Unknown mode.
+    """
+    if mode is None:
+        yield
+        return
+
+    if mode not in ("pause", "freeze"):
+        raise ValueError(f"Unknown gc mode '{mode}', expect: None, 'pause' or 'freeze'")
+
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if mode == "freeze" and hasattr(gc, "freeze"):
+            gc.freeze()
+        if enabled:
+            gc.enable()
@@ -1,7 +1,12 @@
 
+import json
+from array import array
+from enum import Enum
+from xml.sax.saxutils import escape, unescape
 from lxml import etree
-from .field import StringField, FloatField, IntegerField
+from .field import StringField, FloatField, IntegerField, ChoiceField, EnumField, ForeignKeyField, ForeignKeyArrayField
 from .field import Optional
+from .common import tree2bytes
 
 
 def toElement(model) -> etree._Element:
@@ -9,13 +14,254 @@ def toElement(model) -> etree._Element:
     TODO: maybe rewrite it into none recursive callback will be better,
     Hope it never meets stack overflow...
     """
-    elem = etree.Element(model.getClassName())
-    for k, v in model.getFieldItems():
-        if type( v ) in [StringField, FloatField, IntegerField, Optional] and model.getAttr(k) is not None:
-            elem.set( k, str ( model.getAttr( k ) ) ) 
-    
+    elem = _shallowElement(model)
+
     for childcls in model.getChildClasses():
         for child in getattr(model, f'__child{childcls.getClassName()}'):
             elem.append( toElement(child) )
 
-    return elem
\ No newline at end of file
+    return elem
+
+
+def _shallowElement(model) -> etree._Element:
+    """*Internal* etree element of attributes of model, without text and children.
+    """
+    elem = etree.Element(model.getClassName())
+    for k, v in model.getFieldItems():
+        if type( v ) in [StringField, FloatField, IntegerField, ChoiceField, EnumField, Optional] and model.getAttr(k) is not None:
+            value = model.getAttr( k )
+            elem.set( k, str( value.value if isinstance(value, Enum) else value ) )
+    return elem
+
+
+def _startTag(model) -> bytes:
+    """*Internal* serialised start tag of model, attributes included.
+    """
+    return etree.tostring(_shallowElement(model), encoding='utf-8')[:-2] + b'>'
+
+
+def _render(model, source: bytes, out: list):
+    """*Internal* append serialised pieces of subtree of model to `out`, clean subtrees are slices of `source`.
+    """
+    span = model.get('__span')
+    if span is not None and '__dirty' not in model:
+        out.append(source[span[0]:span[4]])
+        return
+
+    children = [ child for childcls in model.getChildClasses()
+                       for child in model[f'__child{childcls.getClassName()}'] ]
+    text = model.get('text') or ''
+
+    if span is None or span[3] is None:
+        # new, or self-closing in source
+        if not text and not children:
+            out.append(_startTag(model)[:-1] + b'/>')
+            return
+        out.append(_startTag(model))
+        out.append(escape(text).encode('utf-8'))
+        for child in children:
+            _render(child, source, out)
+        out.append(f'</{model.getClassName()}>'.encode())
+        return
+
+    # children from source fill source slots of their class in container order, so reordered ones
+    # move while tails and interleaving of classes are kept; new children follow them
+    inside = lambda child: '__span' in child and span[0] < child['__span'][0] < span[4]
+    kept = [ ]      # (source slot, child)
+    added = [ ]
+    for childcls in model.getChildClasses():
+        own = [ ]
+        for child in model[f'__child{childcls.getClassName()}']:
+            (own if inside(child) else added).append(child)
+        kept.extend( zip(sorted( c['__span'] for c in own ), own) )
+    #endfor
+    kept.sort(key=lambda pair: pair[0][0])
+
+    source_text = source[span[1]:span[2]]
+    if model['__dirty'] is False:
+        out.append(source[span[0]:span[2]])
+    else:
+        out.append(_startTag(model))
+        # keep source text with its layout if it's unchanged
+        if unescape(source_text.decode('utf-8', 'replace')).strip() == text:
+            out.append(source_text)
+        else:
+            out.append(escape(text).encode('utf-8'))
+    #endif
+
+    tail = b''
+    for slot, child in kept:
+        out.append(tail)
+        _render(child, source, out)
+        tail = source[slot[4]:slot[5]]
+    #endfor
+    separator = source_text if kept and source_text.isspace() else b''
+    for child in added:
+        out.append(separator)
+        _render(child, source, out)
+    #endfor
+    out.append(tail)
+
+    if model['__dirty'] is False:
+        out.append(source[span[3]:span[4]])
+    else:
+        out.append(f'</{model.getClassName()}>'.encode())
+
+
+def toXml(model) -> bytes:
+    """Serialise subtree of model as xml document bytes.
+
+    Objects mapped with `XmlMapper(track_source=True)` are written incrementally:
+    subtrees without changes are copied verbatim from source bytes, changed objects are re-serialised
+    (attributes and text in utf-8, without namespace prefixes), so time scales with number of edits.
+    Prolog of the source document is kept when model is the root.
+    Otherwise `toElement` of the whole subtree is written, see `xo.orm.common.tree2bytes`.
+
+    Notice:
+        Tracked objects moved into another tracked document are written as if they were new.
+
+    Args:
+        model: Model object.
+
+    Returns:
+        Xml document bytes.
+    """
+    root = model
+    while root.getParentClassName() is not None and root.getParent() is not None:
+        root = root.getParent()
+
+    source = root.get('__source')
+    if source is None or '__span' not in model:
+        return tree2bytes(toElement(model))
+
+    out = [ ]
+    if model is root:
+        out.append(source[:model['__span'][0]])
+    else:
+        out.append(b"<?xml version=\"1.0\" encoding=\"utf-8\"?>\n")
+    _render(model, source, out)
+    if model is root:
+        out.append(source[model['__span'][4]:])
+    return b"".join(out)
+
+
+def _primaryKey(obj):
+    """*Internal* primary key value of referenced object, `None` if its model has no primary key.
+    """
+    if obj is None:
+        return None
+    for k, v in obj.getFieldItems():
+        if getattr(v, 'primary_key', False):
+            return obj.get(k)
+    return None
+
+
+def _values(model) -> dict:
+    """*Internal* attribute values of model, internal links excluded and foreign keys as primary keys.
+    """
+    record = { }
+    for k, v in model.items():
+        if k.startswith('__'):
+            continue
+        field = model.getField(k)
+        if type(field) == ForeignKeyField:
+            v = _primaryKey(v)
+        elif type(field) == ForeignKeyArrayField:
+            v = [ _primaryKey(o) for o in v ]
+        elif isinstance(v, Enum):
+            v = v.value
+        record[k] = v
+    return record
+
+
+def toDict(model, *, nested=True) -> dict:
+    """Convert model into plain dict, ready for json.
+
+    Internal `__parent{Class}`/`__child{Class}` links are excluded,
+    foreign keys are replaced by primary key value of objects they refer to.
+
+    Args:
+        model: Model object.
+        nested: Include children as `{ClassName: [child dict, ...]}`, recursively.
+
+    Returns:
+        Dict of attributes (and children).
+    """
+    record = _values(model)
+    if not nested:
+        return record
+
+    stack = [ (model, record) ]
+    while stack:
+        obj, obj_record = stack.pop()
+        for childcls in obj.getChildClasses():
+            children = obj[f'__child{childcls.getClassName()}']
+            if len(children) == 0:
+                continue
+            records = obj_record[childcls.getClassName()] = [ ]
+            for child in children:
+                child_record = _values(child)
+                records.append(child_record)
+                stack.append( (child, child_record) )
+    #endwhile
+    return record
+
+
+def dump_ndjson(objs, fp, *, nested=True) -> int:
+    """Write objects as newline delimited json, one line per object.
+
+    Objects are converted and written one at a time, so with a streaming source of objects
+    memory does not grow with the document.
+
+    Args:
+        objs: Root model object, then one document per its child is written;
+              or iterable of model objects.
+        fp: Text file object to write.
+        nested: Write every object with its subtree, see `toDict`.
+
+    Returns:
+        Number of lines written.
+    """
+    if hasattr(objs, 'getChildrenIter'):
+        objs = objs.getChildrenIter()
+
+    count = 0
+    for obj in objs:
+        fp.write(json.dumps(toDict(obj, nested=nested), ensure_ascii=False))
+        fp.write("\n")
+        count += 1
+    return count
+
+
+def toColumns(objs, cls) -> dict:
+    """Convert objects of one model class into columns of attribute values.
+
+    Columns of `ChoiceField` attributes are `array` of integer choice codes (`-1` for `None`),
+    see `ChoiceField.code()` and `ChoiceField.decode()`; other columns are lists as `toDict` converts.
+
+    Args:
+        objs: Iterable of objects of `cls`.
+        cls: Model class.
+
+    Returns:
+        Dict of attribute name (and `text`) to column.
+    """
+    choices = { }
+    for k, v in cls.getFieldItems():
+        field = v.field if type(v) == Optional else v
+        if isinstance(field, ChoiceField):
+            choices[k] = field
+
+    columns = { k: (array(choices[k].typecode) if k in choices else [ ])
+                for k, v in cls.getFieldItems() }
+    columns['text'] = [ ]
+    for obj in objs:
+        record = _values(obj)
+        for k, column in columns.items():
+            if k in choices:
+                column.append(choices[k].code(obj.get(k)))
+            else:
+                column.append(record.get(k))
+        #endfor
+    #endfor
+    return columns
@@ -0,0 +1,179 @@
+import hashlib
+from typing import List, Tuple
+
+from .convert import _values
+
+
+_DIGEST_KEY = '__digest'
+
+
+def _own_digest(obj) -> bytes:
+    """*Internal* digest of class, attribute values and text of `obj`, children excluded.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(obj.getClassQualName().encode())
+    for k, v in sorted(_values(obj).items()):
+        h.update(b'\0')
+        h.update(k.encode())
+        h.update(b'\1')
+        h.update(type(v).__name__.encode())
+        h.update(repr(v).encode())
+    return h.digest()
+
+
+def digest(root) -> bytes:
+    """Merkle digest of subtree under `root`: own attribute values and ordered digests of children.
+
+    Digests are cached in every object of the subtree, `Model` mutations invalidate cache of the object
+    and its ancestors, so recomputing after a few changes only touches changed paths.
+
+    Args:
+        root: Model object.
+
+    Returns:
+        Digest bytes.
+    """
+    cached = root.get(_DIGEST_KEY)
+    if cached is not None:
+        return cached
+
+    # post order without recursion
+    stack = [ (root, False) ]
+    while stack:
+        obj, expanded = stack.pop()
+        if _DIGEST_KEY in obj:
+            continue
+
+        children = [ child for childcls in obj.getChildClasses() for child in obj[f'__child{childcls.getClassName()}'] ]
+        if not expanded:
+            stack.append( (obj, True) )
+            stack.extend( (child, False) for child in children if _DIGEST_KEY not in child )
+            continue
+
+        h = hashlib.blake2b(_own_digest(obj), digest_size=16)
+        for child in children:
+            h.update(child[_DIGEST_KEY])
+        obj[_DIGEST_KEY] = h.digest()
+    #endwhile
+    return root[_DIGEST_KEY]
+
+
+class DiffResult(object):
+    """Result of `diff`.
+
+    Attributes:
+        added: List of (xpath, new object).
+        removed: List of (xpath, old object).
+        modified: List of (xpath, old object, new object) whose own attribute values or text changed.
+    """
+    def __init__(self):
+        self.added: List[Tuple[str, object]] = [ ]
+        self.removed: List[Tuple[str, object]] = [ ]
+        self.modified: List[Tuple[str, object, object]] = [ ]
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.modified)
+
+    def __repr__(self):
+        return f'<DiffResult added={len(self.added)} removed={len(self.removed)} modified={len(self.modified)}>'
+
+
+def _path(parent_path: str, name: str, index: int, size: int) -> str:
+    return f'{parent_path}/{name}[{index}]' if size > 1 else f'{parent_path}/{name}'
+
+
+def _primary_key_name(cls):
+    for k, v in cls.getFieldItems():
+        if getattr(v, 'primary_key', False):
+            return k
+    return None
+
+
+def _pair(old_children: list, new_children: list, key_name):
+    """*Internal* pair children of old and new parent.
+
+    Unchanged children are paired by digest first, then by primary key if model has one, else by position.
+
+    Returns:
+        Tuple of (pairs of (old index, new index), unpaired old indexes, unpaired new indexes).
+    """
+    pairs = [ ]
+    by_digest = dict()
+    for i, child in enumerate(old_children):
+        by_digest.setdefault(digest(child), [ ]).append(i)
+
+    old_left = set(range(len(old_children)))
+    new_left = [ ]
+    for j, child in enumerate(new_children):
+        candidates = by_digest.get(digest(child))
+        if candidates:
+            old_left.discard(candidates[0])
+            candidates.pop(0)
+        else:
+            new_left.append(j)
+    #endfor
+
+    old_left = sorted(old_left)
+    if key_name is not None:
+        # duplicated keys are paired in order, leftovers are unpaired
+        by_key = dict()
+        for i in old_left:
+            by_key.setdefault(old_children[i].get(key_name), [ ]).append(i)
+        unpaired_new = [ ]
+        for j in new_left:
+            candidates = by_key.get(new_children[j].get(key_name))
+            if candidates:
+                pairs.append( (candidates.pop(0), j) )
+            else:
+                unpaired_new.append(j)
+        #endfor
+        return pairs, sorted( i for candidates in by_key.values() for i in candidates ), unpaired_new
+
+    n = min(len(old_left), len(new_left))
+    pairs = list(zip(old_left[:n], new_left[:n]))
+    return pairs, old_left[n:], new_left[n:]
+
+
+def diff(old_root, new_root) -> DiffResult:
+    """Compare two mapped documents, identical subtrees are skipped by digest.
+
+    Args:
+        old_root: Root object of old document.
+        new_root: Root object of new document.
+
+    Returns:
+        `DiffResult`, xpaths of added and modified objects are of new document, removed ones are of old document.
+
+    Raises:
+        ValueError: Roots are of different classes.
+    """
+    if old_root.__class__ is not new_root.__class__:
+        raise ValueError(f"Can't diff '{old_root.getClassQualName()}' with '{new_root.getClassQualName()}'")
+
+    result = DiffResult()
+    stack = [ (old_root, new_root, f'/{new_root.getClassName()}', f'/{old_root.getClassName()}') ]
+    while stack:
+        old, new, new_path, old_path = stack.pop()
+        if digest(old) == digest(new):
+            continue
+
+        if _own_digest(old) != _own_digest(new):
+            result.modified.append( (new_path, old, new) )
+
+        for childcls in new.getChildClasses():
+            name = childcls.getClassName()
+            old_children = list(old[f'__child{name}'])
+            new_children = list(new[f'__child{name}'])
+            pairs, removed, added = _pair(old_children, new_children, _primary_key_name(childcls))
+
+            for i, j in pairs:
+                stack.append( (old_children[i], new_children[j],
+                               _path(new_path, name, j + 1, len(new_children)),
+                               _path(old_path, name, i + 1, len(old_children))) )
+            for i in removed:
+                result.removed.append( (_path(old_path, name, i + 1, len(old_children)), old_children[i]) )
+            for j in added:
+                result.added.append( (_path(new_path, name, j + 1, len(new_children)), new_children[j]) )
+        #endfor
+    #endwhile
+    return result
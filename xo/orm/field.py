@@ -1,7 +1,11 @@
 import re
-from typing import Union, List
+import sys
+from enum import Enum
+from typing import Union, List, Iterable
 from abc import ABC, abstractmethod
 
+from .common import InternPool
+
 
 class Field(ABC):
     """ Base field type
@@ -110,15 +114,25 @@ class StringField(Field):
         primary_key: inherit from Field
         default: inherit from Field
         r: regular expression
+        pool: `InternPool` deduplicating mapped values of this field, or `None`
     """
-    def __init__(self, name=None, primary_key=False, default=None, *, re=None):
+    def __init__(self, name=None, primary_key=False, default=None, *, re=None, intern=False):
         """
         Parameter:
             re: regular expression validator
+            intern: `True` to deduplicate mapped values in a pool owned by this field,
+                    or an `InternPool` to share with other fields and mappers.
         """
         super().__init__(name, str, primary_key, default)
         self.r = re
 
+        if intern is True:
+            self.pool = InternPool()
+        elif isinstance(intern, InternPool):
+            self.pool = intern
+        else:
+            self.pool = None
+
     def is_valid(self, string) -> bool:
         if self.r:
             return re.match(self.r, string) is not None
@@ -127,6 +141,105 @@ class StringField(Field):
 
 
 
+class ChoiceField(Field):
+    """Choice Field, value is one of a fixed set of strings
+
+    Validation is a hashed membership test, mapped values are the canonical (shared) choice objects,
+    and every choice has a small integer code for columnar export.
+
+    Attributes:
+        name: inherit from Field
+        primary_key: inherit from Field
+        default: inherit from Field
+        choices: canonical values, in order of their codes
+        enum: `Enum` class of choices, or `None`
+        r: same as `choices`, shown in constraint error messages
+    """
+    def __init__(self, choices:Union[Iterable[str], type], name=None, primary_key=False, default=None):
+        """
+        Parameter:
+            choices: strings, or an `Enum` class whose members are stored (xml text is member's value)
+        """
+        if isinstance(choices, type) and issubclass(choices, Enum):
+            super().__init__(name, choices, primary_key, default)
+            self.enum = choices
+            self.choices = tuple(choices)
+            self._lookup = { str(member.value): member for member in choices }
+        else:
+            super().__init__(name, str, primary_key, default)
+            self.enum = None
+            choices = list(choices)
+            if not all( type(choice) == str for choice in choices ):
+                raise TypeError("Choices of ChoiceField expect strings or an Enum class")
+            self.choices = tuple(dict.fromkeys( sys.intern(choice) for choice in choices ))
+            self._lookup = { choice: choice for choice in self.choices }
+
+        if len(self.choices) == 0:
+            raise ValueError("ChoiceField expects at least one choice")
+
+        self._codes = { choice: code for code, choice in enumerate(self.choices) }
+        self.r = self.choices
+
+    def is_valid(self, value) -> bool:
+        return value in self._codes
+
+    def canonical(self, string:str):
+        """
+        Returns:
+            Canonical choice of xml text `string`.
+
+        Raises:
+            ValueError: `string` is not a choice.
+        """
+        try:
+            return self._lookup[string]
+        except KeyError:
+            raise ValueError(f"'{string}' is not a choice of {self}")
+
+    def text(self, value) -> str:
+        """
+        Returns:
+            Xml text of choice `value`.
+        """
+        return str(value.value) if self.enum is not None else value
+
+    def code(self, value) -> int:
+        """
+        Returns:
+            Integer code of choice `value`, `-1` for `None`.
+        """
+        if value is None:
+            return -1
+        return self._codes[value]
+
+    def decode(self, code:int):
+        """
+        Returns:
+            Choice of integer `code`, `None` for `-1`.
+        """
+        if code < 0:
+            return None
+        return self.choices[code]
+
+    @property
+    def typecode(self) -> str:
+        """Smallest signed `array` typecode holding codes of all choices.
+        """
+        n = len(self.choices)
+        return 'b' if n < 1 << 7 else ('h' if n < 1 << 15 else 'i')
+
+
+
+class EnumField(ChoiceField):
+    """Enum Field, a `ChoiceField` storing members of an `Enum` class
+    """
+    def __init__(self, enum:type, name=None, primary_key=False, default=None):
+        if not (isinstance(enum, type) and issubclass(enum, Enum)):
+            raise TypeError("EnumField expects an Enum class")
+        super().__init__(enum, name, primary_key, default)
+
+
+
 class IntegerField(Field):
     """ Integer Field
 
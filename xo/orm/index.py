@@ -0,0 +1,295 @@
+"""
+# Sidecar byte offset index of records in huge xml files
+#
+# Copyright (C) 2019 ZIJIAN JIANG
+"""
+
+import os
+import re
+import json
+import mmap
+import html
+from typing import Dict, List, Iterable, Iterator
+
+from .field import Optional, ChoiceField
+from .common import scan_xml_tags, sniff_compression, get_all_class_types
+from .diff import _primary_key_name
+
+
+INDEX_VERSION = 1
+
+_XPATH_STEP = re.compile(r"/([^\[\]/]+)(?:\[(\d+)\])?")
+
+
+def index_path(path: str) -> str:
+    """Default sidecar path of index of xml file `path`.
+    """
+    return f"{path}.xoidx"
+
+
+def canonical_xpath(xpath: str) -> str:
+    """Xpath with an explicit position in every step but the root, e.g. `/Contacts/Person` -> `/Contacts/Person[1]`.
+
+    Raises:
+        ValueError: `xpath` is not an absolute path of element names.
+    """
+    steps = list(_XPATH_STEP.finditer(xpath))
+    if not steps or ''.join( m.group(0) for m in steps ) != xpath:
+        raise ValueError(f"Xpath '{xpath}' is not an absolute path of element names")
+    return ''.join( f"/{m.group(1)}" if i == 0 else f"/{m.group(1)}[{m.group(2) or 1}]" for i, m in enumerate(steps) )
+
+
+class IndexEntry(object):
+    """Location of one record in xml file.
+
+    Attributes:
+        qualname: Class qualname of record.
+        xpath: Canonical xpath of record, see `canonical_xpath`.
+        offset: Byte offset of start tag of record.
+        length: Number of bytes of record, from its start tag to its end tag.
+        line: Line number of start tag of record.
+        key: Raw xml text of primary key of record, `None` if its class has no primary key.
+    """
+    __slots__ = [ 'qualname', 'xpath', 'offset', 'length', 'line', 'key' ]
+
+    def __init__(self, qualname: str, xpath: str, offset: int, length: int, line: int, key: str = None):
+        self.qualname = qualname
+        self.xpath = xpath
+        self.offset = offset
+        self.length = length
+        self.line = line
+        self.key = key
+
+    def __repr__(self):
+        return f"IndexEntry({self.xpath!r}, offset={self.offset}, length={self.length}, line={self.line}, key={self.key!r})"
+
+
+class RecordIndex(object):
+    """Byte offsets, line numbers and primary keys of elements of chosen classes in an xml file.
+
+    An index is built once by scanning raw bytes of the file (see `build_index`), kept in a json sidecar,
+    then `XmlMapper.load_record()` seeks to a record and maps only its subtree.
+
+    Attributes:
+        path: Indexed xml file.
+        size: Size of indexed file in bytes.
+        mtime: Modification time of indexed file, in nanoseconds.
+        model: Qualname of root `Model` class.
+        prolog: Bytes before root element (xml declaration, doctype...).
+        root_open: Start tag of root element, namespaces declared on it apply to records.
+        entries: List of `IndexEntry` in document order.
+    """
+    def __init__(self, path: str, size: int, mtime: int, model: str, prolog: bytes, root_open: bytes, entries: List[IndexEntry]):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.model = model
+        self.prolog = prolog
+        self.root_open = root_open
+        self.entries = entries
+
+        self._xpaths = { entry.xpath: entry for entry in entries }
+        self._keys = None       # qualname: { primary key value: entry }, built at first lookup by key
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[IndexEntry]:
+        return iter(self.entries)
+
+    def is_stale(self, path: str = None) -> bool:
+        """Whether xml file `path` (indexed file by default) changed since indexing, by size and mtime.
+        """
+        stat = os.stat(path or self.path)
+        return stat.st_size != self.size or stat.st_mtime_ns != self.mtime
+
+    def _key_map(self, model_cls: type) -> Dict[str, dict]:
+        """*Internal* entries keyed by converted primary key values, per class qualname.
+        """
+        if self._keys is None:
+            classes = { c.getClassQualName(): c for c in get_all_class_types(model_cls) }
+            keys = dict()
+            for entry in self.entries:
+                if entry.key is None:
+                    continue
+                v = classes[entry.qualname].getField(_primary_key_name(classes[entry.qualname]))
+                field = v.field if type(v) == Optional else v
+                value = field.canonical(entry.key) if isinstance(field, ChoiceField) else field.column_type(entry.key)
+                keys.setdefault(entry.qualname, dict())[value] = entry
+            #endfor
+            self._keys = keys
+        return self._keys
+
+    def find(self, key, model_cls: type, cls=None) -> IndexEntry:
+        """Entry of a record.
+
+        Args:
+            key: Xpath of record (`str` starting with `/`), or value of its primary key.
+            model_cls: Root `Model` class, to convert primary key values.
+            cls: `Model` class or qualname of record, needed when several indexed classes have the same key value.
+
+        Raises:
+            KeyError: No record of `key`.
+            ValueError: `key` matches records of several classes.
+        """
+        if model_cls.getClassQualName() != self.model:
+            raise ValueError(f"Index of {self.path} is built for model '{self.model}', not '{model_cls.getClassQualName()}'")
+        if isinstance(key, str) and key.startswith('/'):
+            return self._xpaths[canonical_xpath(key)]
+
+        qualname = cls if cls is None or isinstance(cls, str) else cls.getClassQualName()
+        found = [ keys[key] for name, keys in self._key_map(model_cls).items()
+                  if (qualname is None or name == qualname) and key in keys ]
+        if not found:
+            raise KeyError(key)
+        elif len(found) > 1:
+            raise ValueError(f"Key {key!r} matches records of classes {[ e.qualname for e in found ]}, specify class")
+        return found[0]
+
+    def save(self, path: str = None) -> str:
+        """Write index into json sidecar `path`, `index_path()` of indexed file by default.
+
+        Returns:
+            Sidecar path.
+        """
+        path = path or index_path(self.path)
+        data = {
+            'version': INDEX_VERSION,
+            'path': self.path, 'size': self.size, 'mtime': self.mtime, 'model': self.model,
+            # raw bytes round trip through latin-1
+            'prolog': self.prolog.decode('latin-1'), 'root_open': self.root_open.decode('latin-1'),
+            'entries': [ [e.qualname, e.xpath, e.offset, e.length, e.line, e.key] for e in self.entries ],
+        }
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> 'RecordIndex':
+        """Read index from json sidecar `path`.
+
+        Raises:
+            ValueError: Sidecar is of another version.
+        """
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        if data.get('version') != INDEX_VERSION:
+            raise ValueError(f"Index {path} is of version {data.get('version')}, expect: {INDEX_VERSION}")
+        return cls(data['path'], data['size'], data['mtime'], data['model'],
+                   data['prolog'].encode('latin-1'), data['root_open'].encode('latin-1'),
+                   [ IndexEntry(*entry) for entry in data['entries'] ])
+
+
+def _attribute(tag: bytes, name: str):
+    """*Internal* unescaped value of attribute `name` (in any namespace) in raw start tag, `None` if absent.
+    """
+    m = re.search(br"""\s(?:[^\s=/>]+:)?""" + re.escape(name.encode()) + br"""\s*=\s*(?:"([^"]*)"|'([^']*)')""", tag)
+    if m is None:
+        return None
+    value = m.group(1) if m.group(1) is not None else m.group(2)
+    return html.unescape(value.decode('utf-8'))
+
+
+def build_index(path: str, model_cls: type, classes: Iterable, *, sidecar: bool = True) -> RecordIndex:
+    """Index elements of `classes` in xml file `path` by scanning its raw bytes, without parsing it.
+
+    Only classes of elements on the way to indexed classes are resolved, nothing is validated:
+    `XmlMapper.load_record()` validates the records it maps.
+
+    Args:
+        path: Uncompressed xml file path.
+        model_cls: Root `Model` class.
+        classes: Indexed `Model` classes or their qualnames.
+        sidecar: Save index into `index_path(path)`.
+
+    Returns:
+        `RecordIndex`.
+
+    Raises:
+        RuntimeError: Xml element class is not defined in model.
+        ValueError: File is compressed or xml is not well-formed.
+    """
+    all_classes = { c.getClassQualName(): c for c in get_all_class_types(model_cls) }
+    indexed = set()
+    for c in classes:
+        qualname = c if isinstance(c, str) else c.getClassQualName()
+        if qualname not in all_classes:
+            raise ValueError(f"Class '{qualname}' is not defined in model '{model_cls.getClassQualName()}'")
+        indexed.add(all_classes[qualname])
+    #endfor
+
+    # classes that are indexed or have indexed descendants
+    leads = set()
+    for c in reversed(list(all_classes.values())):
+        if c in indexed or any( child in leads for child in c.getChildClasses() ):
+            leads.add(c)
+    #endfor
+    keys = { c: _primary_key_name(c) for c in indexed }
+    childmaps = { c: { child.getClassName(): child for child in c.getChildClasses() } for c in leads }
+
+    stat = os.stat(path)
+    entries = [ ]
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        if sniff_compression(buf[:6]) is not None:
+            raise ValueError(f"build_index() can't index compressed file {path}")
+
+        stack = [ ]         # (class, canonical xpath, Counter of children tags, entry) of open elements
+        skip = 0            # depth inside elements not leading to indexed classes
+        line, last = 1, 0
+        prolog = root_open = None
+        for kind, name, start, end in scan_xml_tags(buf):
+            if kind == 'end':
+                if skip:
+                    skip -= 1
+                    continue
+                if not stack:
+                    raise ValueError(f"Unbalanced end tag '{name.decode()}' at offset {start}")
+                entry = stack.pop()[3]
+                if entry is not None:
+                    entry.length = end - entry.offset
+                continue
+            elif skip:
+                skip += kind == 'start'
+                continue
+
+            tag = name[name.find(b':')+1:].decode()
+            if root_open is None:
+                cls, xpath = model_cls, f"/{tag}"
+                if tag != cls.getClassName():
+                    raise RuntimeError(f"File {path}, xml element class {{'{tag}'}} is not defined in model.")
+                prolog, root_open = bytes(buf[:start]), bytes(buf[start:end])
+            elif not stack:
+                raise ValueError(f"Extra element '{tag}' after root element, at byte {start}")
+            else:
+                parentcls, parentpath, counts, _ = stack[-1]
+                cls = childmaps[parentcls].get(tag)
+                if cls is None:
+                    raise RuntimeError(f"File {path}, byte {start}, xml element class {{'{parentcls.getClassQualName()}.{tag}'}} is not defined in model.")
+                counts[tag] = counts.get(tag, 0) + 1
+                xpath = f"{parentpath}/{tag}[{counts[tag]}]"
+
+            if cls not in leads:
+                skip = kind == 'start'
+                continue
+
+            entry = None
+            if cls in indexed:
+                line += bytes(buf[last:start]).count(b"\n")
+                last = start
+                key = _attribute(buf[start:end], keys[cls]) if keys[cls] is not None else None
+                entry = IndexEntry(cls.getClassQualName(), xpath, start, end - start, line, key)
+                entries.append(entry)
+            if kind == 'start':
+                stack.append( (cls, xpath, dict(), entry) )
+        #endfor
+
+        if stack or skip:
+            raise ValueError(f"Xml is not well-formed, element is not closed in {path}")
+    #endwith
+
+    index = RecordIndex(path, stat.st_size, stat.st_mtime_ns, model_cls.getClassQualName(), prolog or b"", root_open or b"", entries)
+    if sidecar:
+        index.save()
+    return index
@@ -1,133 +1,1036 @@
 
 
+import io
+import os
 import re
-from itertools import chain
-from collections import defaultdict
-from typing import List, Dict, Tuple, Any
+import json
+import mmap
+import time
+import asyncio
+import weakref
+import threading
+from collections import defaultdict, Counter
+from multiprocessing import resource_tracker
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor, CancelledError
+from typing import Dict, Tuple, Any, Iterable, Iterator
 from urllib.parse import unquote 
 
 from lxml import etree
 from xo import logger
 
-from xo.orm.common import strip_xpath_index, get_all_class_types, read_xml_without_namespace
-from xo.orm.field import Field, Optional, FloatField, StringField, IntegerField, ForeignKeyField, ForeignKeyArrayField
+from xo.orm.common import get_all_class_types, read_xml_without_namespace, gc_paused, InternPool, split_toplevel, sniff_compression, feed_xml, read_xml_bytes, element_spans, open_xml_source, strip_namespace
+from xo.orm.field import Optional, FloatField, StringField, IntegerField, ChoiceField
 from xo.orm import Model
+from xo.orm.model import _fillPending
+from xo.orm.convert import toDict, toColumns
+from xo.orm.codec import pack_graph, unpack_graph
+from xo.orm.diff import digest
+from xo.orm.memory import MemoryReport, memory_report
+from xo.orm.store import ModelStore
+from xo.orm.schema import model_schema
+from xo.orm.index import RecordIndex
+from xo.orm.shared import share_columns
+
+
+
+_XPATH_STEP = re.compile(r"([^\[\]/]+)(?:\[(\d+)\])?")
+
+
+class MapResult(dict):
+    """Objects mapped by `XmlMapper`, keyed by xpath in document order.
+
+    Map of lazy parsing only holds root at first, other xpaths are resolved and added at first access.
+    """
+    _root = None
+    _tree = None
+
+    def __missing__(self, path):
+        if self._root is None:
+            raise KeyError(path)
+
+        obj = None
+        for step in path.split('/')[1:]:
+            m = _XPATH_STEP.fullmatch(step)
+            if m is None:
+                raise KeyError(path)
+            name, index = m.group(1), m.group(2)
+
+            if obj is None:
+                if name != self._root.getClassName() or index is not None:
+                    raise KeyError(path)
+                obj = self._root
+                continue
+
+            key = f'__child{name}'
+            if key not in obj.__childkeys__:
+                raise KeyError(path)
+            children = obj[key]
+            if index is None and len(children) == 1:
+                obj = children[0]
+            elif index is not None and len(children) > 1 and 1 <= int(index) <= len(children):
+                obj = children[int(index) - 1]
+            else:
+                raise KeyError(path)
+        #endfor
+
+        if obj is None:
+            raise KeyError(path)
+        self[path] = obj
+        return obj
+
+    def materialize(self) -> 'MapResult':
+        """Create all pending objects of lazy parsing and add them into this map.
+
+        Returns:
+            This map.
+        """
+        if self._root is not None:
+            obj_map = build_obj_map(self._root.materialize())
+            # keep document order
+            self.clear()
+            self.update(obj_map)
+        return self
+
+    def validate_all(self) -> 'MapResult':
+        """Same as `materialize()`, raise the first attribute or `__count__` error met.
+        """
+        return self.materialize()
+
+    def iter_records(self, cls=None, *, flatten=True):
+        """Iterate objects as plain dict records, ready for json.
+
+        Args:
+            cls: `Model` class or its qualname, `None` for objects of all classes.
+            flatten: `True` one flat record per object, with `_path` and `_parent` xpath of the object;
+                     `False` one nested record per object with its subtree, see `toDict`.
+
+        Yields:
+            Dict record.
+        """
+        if isinstance(cls, str):
+            qualname = cls
+        elif cls is not None:
+            qualname = cls.getClassQualName()
+        else:
+            qualname = None
+
+        for path, obj in self.items():
+            if qualname is not None and obj.getClassQualName() != qualname:
+                continue
+            if flatten:
+                record = toDict(obj, nested=False)
+                record['_path'] = path
+                record['_parent'] = path.rsplit('/', 1)[0] or None
+                yield record
+            else:
+                yield toDict(obj, nested=True)
+        #endfor
+
+    def to_columns(self, cls) -> Dict[str, list]:
+        """Export objects of one class as columns, see `toColumns`.
+
+        Args:
+            cls: `Model` class or its qualname.
+
+        Returns:
+            Dict of attribute name to column, with `_path` and `_parent` xpath columns.
+        """
+        qualname = cls if isinstance(cls, str) else cls.getClassQualName()
+        entries = [ (path, obj) for path, obj in self.items() if obj.getClassQualName() == qualname ]
+        if isinstance(cls, str):
+            if not entries:
+                raise KeyError(f"No object of class '{qualname}'")
+            cls = entries[0][1].__class__
+
+        columns = toColumns( (obj for _, obj in entries), cls )
+        columns['_path'] = [ path for path, _ in entries ]
+        columns['_parent'] = [ path.rsplit('/', 1)[0] or None for path, _ in entries ]
+        return columns
+
+    def memory_report(self, top:int=10, *, tree=None) -> MemoryReport:
+        """Estimate memory retained by objects of this map, per class and per subtree.
+
+        Example:
+
+            mapper = XmlMapper("contacts.xml", Contacts)
+            obj_map = mapper.parse()
+            print(obj_map.memory_report(top=5, tree=mapper.tree))
+
+        Args:
+            top: Number of heaviest subtrees to report.
+            tree: lxml etree to estimate as retained, default is the etree backing lazy parsing.
+
+        Returns:
+            `MemoryReport`, see `xo.orm.memory.memory_report`.
+        """
+        return memory_report(self, tree=tree if tree is not None else self._tree, top=top)
+
+    def __reduce__(self):
+        """Pickle every graph of the objects once, see `xo.orm.codec`.
+        """
+        graphs = [ ]
+        located = dict()    # id(root): (graph index, index of nodes)
+        entries = [ ]
+        for path, obj in self.items():
+            root = obj
+            while root.getParentClassName() is not None and root.getParent() is not None:
+                root = root.getParent()
+            if id(root) not in located:
+                packed, index = pack_graph(root, with_index=True)
+                located[id(root)] = (len(graphs), index)
+                graphs.append(packed)
+            graph_idx, index = located[id(root)]
+            entries.append( (path, graph_idx, index[id(obj)]) )
+        #endfor
+        return (_unpack_map_result, (self.__class__, graphs, entries))
+
+    def dump_ndjson(self, fp, cls=None, *, flatten=True) -> int:
+        """Write `iter_records()` as newline delimited json.
+
+        Returns:
+            Number of lines written.
+        """
+        count = 0
+        for record in self.iter_records(cls, flatten=flatten):
+            fp.write(json.dumps(record, ensure_ascii=False))
+            fp.write("\n")
+            count += 1
+        return count
 
 
 
 class XmlMapper(object):
     """Xml Mapper to convert xml etree to model objects.
     """
-    def __init__(self, xml:str, model_cls:type):
+    def __init__(self, xml:str, model_cls:type, *, weak_parent:bool=False, gc_mode:str=None, intern_strings=False,
+                 digest:bool=False, track_source:bool=False, schema=None):
         """Initializtion of XmlMapper
 
         Args:
-            xml: Xml file path.
+            xml: Xml file path, `bytes`, `mmap`, binary file object, or gzip/bz2/xz/zstd compressed of them.
+                 See `xo.orm.common.open_xml_source`.
             model_cls: `Model` class
+            weak_parent: Children only hold weak references to their parents, so the mapped graph
+                         has no parent/child reference cycle. Keep the root (or the returned map) alive.
+            gc_mode: `None`, `"pause"` or `"freeze"`, how to keep the cyclic garbage collector away
+                     while building objects, see `xo.orm.common.gc_paused`.
+            intern_strings: `True` to deduplicate string values and texts in a new `InternPool`,
+                            or an `InternPool` to share among mappers of a batch.
+                            Fields with their own pool (`StringField(intern=True)`) keep using it.
+                            See `intern_pool.saved_bytes` for the memory saved.
+            digest: Compute Merkle digests of all subtrees while parsing, for fast `xo.orm.diff.diff`.
+            track_source: Keep source bytes and byte spans of every element, so `Model.save()` only
+                          re-serialises changed objects and copies the rest verbatim.
+                          The whole (decompressed) document is kept in memory with the root.
+            schema: `True` to validate the etree with RelaxNG schema generated from `model_cls`
+                    (see `xo.orm.schema.ModelSchema`), or a `ModelSchema`, before mapping.
+                    Python checks expressed by the schema (classes of elements, `__count__`, attribute
+                    presence, types and simple regex) are skipped once it passes.
 
         """
         self.xml = xml
-        self.tree = read_xml_without_namespace(xml)
         self.model_cls = model_cls
+        self.weak_parent = weak_parent
+        self.gc_mode = gc_mode
+        self.digest = digest
+        self.track_source = track_source
+        self.schema = model_schema(model_cls) if schema is True else (schema or None)
+        self._validated = None     # schema validated the etree being mapped
+        if intern_strings is True:
+            self.intern_pool = InternPool()
+        elif isinstance(intern_strings, InternPool):
+            self.intern_pool = intern_strings
+        else:
+            self.intern_pool = None
 
-    def parse(self):
+        self._tree = None
+        self._childmaps = dict()
+        self._class_types = dict()
+        self._cancel = None
+
+    @property
+    def tree(self) -> etree._ElementTree:
+        """Etree of `xml`, it is read at first access.
+        """
+        if self._tree is None:
+            self._tree = read_xml_without_namespace(self.xml, cancel=self._cancel)
+        return self._tree
+
+    def parse(self, *, include:Iterable=None, exclude:Iterable=None, lazy:bool=False):
         """
+        Args:
+            lazy: Only map root at first, children of an object are created, converted and validated
+                  at the first access of them, backed by the retained etree.
+                  The returned map resolves xpaths on demand, use `materialize()` or `validate_all()`
+                  of it (or of `Model`) to map and check all at once. Option `digest` is ignored.
+            include: Projection, only map objects of these classes (and their ancestors, to link them).
+                     `Model` classes or their qualnames.
+            exclude: Projection, skip subtrees of these classes.
+
+        Notice:
+            With projection, xml is parsed without building an etree, skipped subtrees only cost the parser,
+            and `__count__` constraints are checked for children of mapped objects.
+
         Returns:
             Python native objects that converted from xml elements.
 
         Raises:
             RuntimeError: If root(xml type) is not expected or `__count__` constraints is vialated.
+            ValueError: If attribute's value is not expected, or projection is used with lazy parsing,
+                        option `track_source` or `schema`.
+
+        """
+        if lazy and (include is not None or exclude is not None):
+            raise ValueError("Projection can't be used with lazy parsing")
+        elif self.schema is not None and (include is not None or exclude is not None):
+            raise ValueError("Option schema can't be used with projection")
+        elif self.track_source and (lazy or include is not None or exclude is not None):
+            raise ValueError("Option track_source can't be used with lazy parsing or projection")
+        elif lazy:
+            return self._parse_lazy()
+        elif include is not None or exclude is not None:
+            return self._parse_projected(include, exclude)
+
+        if self.track_source:
+            data = read_xml_bytes(self.xml)
+            if self._tree is None and not isinstance(self.xml, (str, os.PathLike)):
+                # source object may be read only once
+                self._tree = read_xml_without_namespace(data, cancel=self._cancel)
+
+        root = self.tree.getroot()
+        self._validate()
+
+        with gc_paused(self.gc_mode):
+            obj_map = self._map(root, self.model_cls)
+            if self.track_source:
+                self._attach_source(obj_map, data)
+            if self.digest:
+                digest(obj_map[f'/{root.tag}'])
+            return obj_map
+
+    def parse_store(self, database:str, *, batch:int=10000) -> ModelStore:
+        """Stream objects into a SQLite database instead of memory, see `xo.orm.store.ModelStore`.
+
+        Xml is read with `iterparse`, every element is converted, validated and written as a row
+        when it ends, then dropped, so memory doesn't grow with the document.
+        Existing tables of the model in `database` are replaced.
+
+        Args:
+            database: SQLite database path.
+            batch: Number of rows of a class inserted at once.
+
+        Returns:
+            `ModelStore` of `database`, use `root()` or `select()` of it to read objects.
+
+        Raises:
+            RuntimeError: If root(xml type) is not expected or `__count__` constraints is vialated.
+            ValueError: If attribute's value is not expected.
+        """
+        store = ModelStore(database, self.model_cls)
+        store.create()
+
+        rows = defaultdict(list)
+        stack = [ ]     # (class, row id, Counter of children tags)
+        next_id = 0
+        with open_xml_source(self.xml) as (src, _):
+            if isinstance(src, (bytes, bytearray, memoryview, mmap.mmap)):
+                src = io.BytesIO(src)
+            for event, elem in etree.iterparse(src, events=("start", "end"), remove_comments=True):
+                tag = elem.tag[elem.tag.find('}')+1:]
+
+                if event == "start":
+                    if not stack:
+                        cls = self.model_cls
+                        if tag != cls.getClassName():
+                            raise RuntimeError(f"{_base(elem)}, xml element class {{'{tag}'}} is not defined in model.")
+                    else:
+                        parentcls, _, counts = stack[-1]
+                        cls = self._childmap(parentcls).get(tag)
+                        if cls is None:
+                            raise RuntimeError(f"{_base(elem)}, xml element class {{'{parentcls.getClassQualName()}.{tag}'}} is not defined in model.")
+                        counts[tag] += 1
+                    next_id += 1
+                    stack.append( (cls, next_id, Counter()) )
+                    continue
+
+                cls, rowid, counts = stack.pop()
+                for name, childcls in self._childmap(cls).items():
+                    if not self.is_valid_number(counts.get(name, 0), childcls.__count__):
+                        raise RuntimeError(f"File {_base(elem)}, line {elem.sourceline}, model count constaint error: '{childcls.getClassQualName()}' count is {counts.get(name, 0)}, expect: {childcls.__count__}.")
+
+                items = [ (k[k.find('}')+1:], v) for k, v in elem.items() ]
+                obj = cls(**self._convert(cls, items, elem.text, elem))
+                rows[cls].append( store._row(obj, rowid, stack[-1][1] if stack else None) )
+                if len(rows[cls]) >= batch:
+                    store.insert(cls, rows.pop(cls))
+
+                # drop converted elements
+                elem.clear()
+                parent = elem.getparent()
+                if parent is not None:
+                    while elem.getprevious() is not None:
+                        del parent[0]
+            #endfor
+        #endwith
+
+        for cls, cls_rows in rows.items():
+            store.insert(cls, cls_rows)
+        store.commit()
+        store.create_indexes()
+        return store
+
+    @classmethod
+    def iter_records(cls, source, model_cls:type, level:int=1, **options) -> Iterator[Model]:
+        """Stream records of a huge xml file, e.g. every `Person` of `Contacts`, one at a time.
+
+        Xml is read with `iterparse`, every element at depth `level` (root is depth 0) is mapped with its
+        subtree and yielded as soon as it ends, detached from its parent, then its elements are dropped.
+        Memory holds one record at a time (plus what the caller keeps), whatever the size of the file.
+
+        Elements above `level` are not mapped, they are only checked for their classes, and for `__count__`
+        constraints of their children when they end: count errors of root's children are raised after
+        all records are yielded.
+
+        Example:
+
+            for person in XmlMapper.iter_records("huge.xml", Contacts):
+                print(person.name, len(person.getChildren("Phone")))
+
+        Args:
+            source: Xml source, see `XmlMapper`.
+            model_cls: Root `Model` class.
+            level: Depth of records, 1 for children of root.
+            options: Options of `XmlMapper`, except `track_source` and `schema`.
+
+        Yields:
+            Record objects with their subtrees, validated.
+
+        Raises:
+            RuntimeError: If xml element class is not defined in model or `__count__` constraints is vialated.
             ValueError: If attribute's value is not expected.
+        """
+        if level < 1:
+            raise ValueError(f"Level of records starts from 1, got {level}")
+        mapper = cls(source, model_cls, **options)
+        if mapper.track_source or mapper.schema is not None:
+            raise ValueError("Options track_source and schema can't be used with iter_records()")
+        return mapper._iter_records(level)
 
+    def _iter_records(self, level: int) -> Iterator[Model]:
+        """*Internal* generator of `iter_records`.
         """
-        # xml elements
-        tree = self.tree
-        root = tree.getroot()
+        stack = [ ]     # (class, Counter of children tags) of ancestors of records
+        depth = 0
+        with open_xml_source(self.xml) as (src, _):
+            if isinstance(src, (bytes, bytearray, memoryview, mmap.mmap)):
+                src = io.BytesIO(src)
+            for event, elem in etree.iterparse(src, events=("start", "end"), remove_comments=True):
+                if event == "start":
+                    depth += 1
+                    if depth > level + 1:
+                        continue
+                    tag = elem.tag[elem.tag.find('}')+1:]
+                    if not stack:
+                        cls = self.model_cls
+                        if tag != cls.getClassName():
+                            raise RuntimeError(f"{_base(elem)}, xml element class {{'{tag}'}} is not defined in model.")
+                    else:
+                        parentcls, counts = stack[-1]
+                        cls = self._childmap(parentcls).get(tag)
+                        if cls is None:
+                            raise RuntimeError(f"{_base(elem)}, xml element class {{'{parentcls.getClassQualName()}.{tag}'}} is not defined in model.")
+                        counts[tag] += 1
+                    if depth <= level:
+                        stack.append( (cls, Counter()) )
+                    continue
 
-        # get class types
-        model_cls = self.model_cls
-        icls = {cls.__qualname__ : cls for cls in get_all_class_types(model_cls) }
+                depth -= 1
+                if depth > level:
+                    continue
+                elif depth == level:
+                    strip_namespace(elem)
+                    with gc_paused(self.gc_mode):
+                        record = self._map(elem, self._childmap(stack[-1][0])[elem.tag])[f'/{elem.tag}']
+                        if self.digest:
+                            digest(record)
+                else:
+                    cls, counts = stack.pop()
+                    for name, childcls in self._childmap(cls).items():
+                        if not self.is_valid_number(counts.get(name, 0), childcls.__count__):
+                            raise RuntimeError(f"File {_base(elem)}, line {elem.sourceline}, model count constaint error: '{childcls.getClassQualName()}' count is {counts.get(name, 0)}, expect: {childcls.__count__}.")
+                    record = None
 
+                # drop mapped elements
+                elem.clear()
+                parent = elem.getparent()
+                if parent is not None:
+                    while elem.getprevious() is not None:
+                        del parent[0]
 
-        # check number of children count constraints
-        for cls_name, cls in icls.items():
-            splitted = cls_name.split('.')
-            if len(splitted) < 1:
-                raise RuntimeError("Doesn't has root.")
-            elif len(splitted) == 1:
-                pass
-            elif len(splitted) > 1:
-                parent_xpath, child_xpath = "/"+"/".join(splitted[:-1]), splitted[-1]
-                for parent in tree.xpath(parent_xpath):
-                    if not self.is_valid_number(len(parent.xpath(child_xpath)), cls.__count__):
-                        raise RuntimeError(f"File {unquote(parent.base)}, line {parent.sourceline}, model count constaint error: '{cls_name}' count is {len(parent.xpath(child_xpath))}, expect: {cls.__count__}.")
+                if record is not None:
+                    yield record
+            #endfor
+        #endwith
 
+    @classmethod
+    def load_record(cls, path:str, index, key, model_cls:type, *, classname=None, **options) -> Model:
+        """Map only one record of a huge xml file, located by its sidecar index, see `xo.orm.index.build_index`.
 
+        Bytes of the record are read at its offset and wrapped with prolog and root start tag of the file
+        (so entities and namespaces declared there apply), then its subtree is mapped and validated.
 
-        paths: List[str] = [tree.getpath(e) for e in root.iter(tag=etree.Element)]
-        
-        xcls = set([strip_xpath_index(p).replace('/', '.')[1:] for p in paths])
+        Example:
 
-        # check consistance of model class and xml elements types
-        if len(xcls - icls.keys()) > 0:
-            raise RuntimeError(f"{unquote(root.base)}, xml element class {xcls - icls.keys()} is not defined in model.")
-        elif len(icls.keys() - xcls) > 0:
-            logger.debug(f"{unquote(root.base)}, class {icls.keys() - xcls} defined in model is not found in xml")
+            build_index("huge.xml", Contacts, [Contacts.Person])
+            person = XmlMapper.load_record("huge.xml", index_path("huge.xml"), "Alice", Contacts)
 
-        # build mapped object related model
-        obj_map = dict( )
-        
-        for e in root.iter(tag=etree.Element):
-            elem = e
-            path = tree.getpath(e)
+        Args:
+            path: Xml file path.
+            index: `RecordIndex` of `path` or its sidecar path.
+            key: Xpath of record or value of its primary key, see `RecordIndex.find()`.
+            model_cls: Root `Model` class.
+            classname: `Model` class or qualname of record, when `key` is ambiguous.
+            options: Options of `XmlMapper`, except `track_source` and `schema`.
+
+        Returns:
+            Record object with its subtree, detached from its parent.
+
+        Raises:
+            KeyError: No record of `key` in index.
+            RuntimeError: Index is stale, or record is not valid (line is the line of record in `path`).
+            ValueError: If attribute's value is not expected or record is not well-formed.
+        """
+        if not isinstance(index, RecordIndex):
+            index = RecordIndex.load(index)
+        if index.is_stale(path):
+            raise RuntimeError(f"Index of {path} is stale, file changed since indexing")
+        entry = index.find(key, model_cls, classname)
 
-            cls_name = strip_xpath_index(path).replace('/', '.')[1:]
-            cls = icls[cls_name]
+        with open(path, "rb") as file:
+            file.seek(entry.offset)
+            data = file.read(entry.length)
+        is_root = '/' not in entry.xpath[1:]
+        if not is_root:
+            root_tag = cls._root_tag(index.root_open)
+            data = index.prolog + index.root_open + data + b"</" + root_tag + b">"
+        else:
+            data = index.prolog + data
+
+        mapper = cls(io.BytesIO(data), model_cls, **options)
+        if mapper.track_source or mapper.schema is not None:
+            raise ValueError("Options track_source and schema can't be used with load_record()")
+        classes = { c.getClassQualName(): c for c in get_all_class_types(model_cls) }
+        try:
+            root_elem = mapper.tree.getroot()
+            elem = root_elem if is_root else next(root_elem.iterchildren(tag=etree.Element))
+            with gc_paused(mapper.gc_mode):
+                record = mapper._map(elem, classes[entry.qualname])[f'/{elem.tag}']
+                if mapper.digest:
+                    digest(record)
+        except (RuntimeError, ValueError) as e:
+            raise type(e)(f"File {path}, record '{entry.xpath}' at line {entry.line}: {e}") from e
+        except etree.XMLSyntaxError as e:
+            raise ValueError(f"File {path}, record '{entry.xpath}' at line {entry.line} is not well-formed: {e}") from e
+        return record
+
+    def parse_partitioned(self, *, processes:int=None, partitions:int=None, shared_memory:bool=False):
+        """Parse a huge xml file whose root holds many independent children, with a process pool.
+
+        The file is split at boundaries of root's children found in its raw bytes (see `split_toplevel`),
+        every partition is mapped in a worker process, then the children are stitched under one root object.
+        `__count__` constraints of root's children are checked on the whole document.
+
+        Notice:
+            `xml` must be an uncompressed file path and `model_cls` must be importable by worker processes.
+            Line numbers in error messages raised by workers are relative to the partition.
+            Options `track_source` and `schema` are not supported.
+
+        Args:
+            processes: Number of worker processes, default is number of cpus.
+            partitions: Number of partitions, default is 4 times of processes.
+            shared_memory: Workers hand objects back as columns in shared memory instead of pickled graphs,
+                           see `xo.orm.shared.SharedColumns`. Children of root are rebuilt from the columns
+                           on demand, the returned map resolves xpaths lazily as with `parse(lazy=True)`,
+                           option `digest` is ignored.
+
+        Returns:
+            Python native objects that converted from xml elements, same as `parse()`.
+
+        Raises:
+            RuntimeError: If root(xml type) is not expected or `__count__` constraints is vialated.
+            ValueError: If attribute's value is not expected, xml is not well-formed, or option
+                        `track_source` or `schema` is set.
+        """
+        processes = processes or os.cpu_count() or 1
+        partitions = partitions or processes * 4
+
+        if not isinstance(self.xml, (str, os.PathLike)):
+            raise TypeError("parse_partitioned() only accepts xml file path")
+        if self.track_source or self.schema is not None:
+            raise ValueError("Options track_source and schema can't be used with parse_partitioned()")
+
+        # boundaries are sought by names of root's children, unless deeper elements use them too
+        childclasses = self.model_cls.getChildClasses()
+        names = [ c.getClassName().encode() for c in childclasses ]
+        if any( c.getClassName().encode() in names for c in get_all_class_types(self.model_cls)
+                if c is not self.model_cls and c not in childclasses ):
+            names = None
+
+        with open(self.xml, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            if sniff_compression(buf[:6]) is not None:
+                raise ValueError(f"parse_partitioned() can't split compressed file {self.xml}")
+            prolog, root_open, head, ranges = split_toplevel(buf, partitions, names)
+
+        # map root itself, text before first child included
+        if root_open.endswith(b"/>"):
+            root_xml = prolog + root_open
+        else:
+            root_xml = prolog + root_open + head + b"</" + XmlMapper._root_tag(root_open) + b">"
+        mapper = XmlMapper(io.BytesIO(root_xml), self.model_cls, intern_strings=self.intern_pool)
+        root_elem = mapper.tree.getroot()
+        root = mapper._map(root_elem, self.model_cls, check_root_count=False)[f'/{root_elem.tag}']
+
+        options = { 'intern_strings': self.intern_pool is not None }
+        if shared_memory:
+            # workers share tracker of this process, blocks they create outlive them until attached
+            resource_tracker.ensure_running()
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            jobs = [ executor.submit(_map_partition, self.xml, prolog, root_open, start, end, self.model_cls, options, shared_memory)
+                     for start, end in ranges ]
+            if not shared_memory:
+                results = [ job.result() for job in jobs ]
 
-            assign_items = { }
+        if shared_memory:
+            # blocks of every worker that succeeded are freed if the map fails
+            mapped = False
             try:
-                for k, v in elem.items():
-                    field = cls.getField(k)
-                    if type(field) == Optional:
-                        field = field.field
-                    if field is None:
-                        logger.warning(f"Try to assign extra attribute '{k}' to undefined field of '{cls_name}', drop it.")
-                        logger.warning(f"  - File {unquote(elem.base)}, line {elem.sourceline}")
-                    elif type(field) == StringField:
-                        assign_items[k] = v
-                    elif type(field) == IntegerField:
-                        assign_items[k] = int(v)
-                    elif type(field) == FloatField:
-                        assign_items[k] = float(v)
+                results = [ job.result().attach() for job in jobs ]
+                for childcls in self.model_cls.getChildClasses():
+                    count = sum( result.count(childcls) for result in results )
+                    if not self.is_valid_number(count, childcls.__count__):
+                        raise RuntimeError(f"File {self.xml}, line {root_elem.sourceline}, model count constaint error: '{childcls.getClassQualName()}' count is {count}, expect: {childcls.__count__}.")
+                    for result in results:
+                        for child in result.objects(childcls):
+                            root.appendChild(child, weak=self.weak_parent)
+                #endfor
+                mapped = True
+            finally:
+                if not mapped:
+                    for job in jobs:
+                        if job.exception() is None:
+                            job.result().attach().close()
+
+            obj_map = MapResult( )
+            obj_map[f'/{root_elem.tag}'] = root
+            obj_map._root = root
+            return obj_map
+
+        with gc_paused(self.gc_mode):
+            children = defaultdict(list)
+            for result in results:
+                for child in result:
+                    children[child.__class__].append(child)
+            #endfor
+
+            for childcls in self.model_cls.getChildClasses():
+                count = len(children[childcls])
+                if not self.is_valid_number(count, childcls.__count__):
+                    raise RuntimeError(f"File {self.xml}, line {root_elem.sourceline}, model count constaint error: '{childcls.getClassQualName()}' count is {count}, expect: {childcls.__count__}.")
+                for child in children.pop(childcls):
+                    root.appendChild(child, weak=self.weak_parent)
+            #endfor
+
+            if self.digest:
+                digest(root)
+            return build_obj_map(root)
+
+    @staticmethod
+    def _root_tag(root_open: bytes) -> bytes:
+        return re.match(br"<([^\s/>]+)", root_open).group(1)
+
+    @classmethod
+    async def aparse(cls, source, model_cls:type, *, executor:Executor=None, **options) -> dict:
+        """Asynchronously parse `source`, reading and mapping run in an executor, not in the event loop.
+
+        When the awaiting task is cancelled, a thread running the job stops at its next checkpoint,
+        even in the middle of a document.
+
+        Example:
+
+            obj_map = await XmlMapper.aparse("contacts.xml", Contacts)
+
+        Args:
+            source: Xml source, see `XmlMapper.__init__`.
+            model_cls: `Model` class.
+            executor: Executor to run in, default is a bounded thread pool shared by all mappers.
+                      With a `ProcessPoolExecutor`, a running job can't be stopped and results are pickled back.
+            options: Keyword arguments of `XmlMapper.__init__`.
+
+        Returns:
+            Same as `parse()`.
+        """
+        loop = asyncio.get_running_loop()
+        executor = executor if executor is not None else _default_executor()
+
+        if isinstance(executor, ProcessPoolExecutor):
+            return await loop.run_in_executor(executor, _parse_job, source, model_cls, options)
+
+        mapper = cls(source, model_cls, **options)
+        mapper._cancel = threading.Event()
+        try:
+            return await loop.run_in_executor(executor, mapper.parse)
+        except asyncio.CancelledError:
+            mapper._cancel.set()
+            raise
+
+    @classmethod
+    async def aiter_parse(cls, sources:Iterable, model_cls:type, *, concurrency:int=4, executor:Executor=None,
+                          return_exceptions:bool=False, **options):
+        """Asynchronously parse many sources, yield results as soon as they are done.
+
+        At most `concurrency` documents are in flight, `sources` is consumed lazily.
+        Closing the iterator cancels documents in flight.
+
+        Example:
+
+            async for source, obj_map in XmlMapper.aiter_parse(paths, Contacts, concurrency=8):
+                ...
+
+        Args:
+            sources: Iterable of xml sources.
+            model_cls: `Model` class.
+            concurrency: Maximum number of documents in flight.
+            executor: See `aparse`.
+            return_exceptions: Yield exception as result instead of raising it.
+            options: Keyword arguments of `XmlMapper.__init__`.
+
+        Yields:
+            Tuple of (source, obj_map).
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be >= 1")
+
+        sources = iter(sources)
+        pending = dict()
+        try:
+            while True:
+                for source in sources:
+                    task = asyncio.ensure_future(cls.aparse(source, model_cls, executor=executor, **options))
+                    pending[task] = source
+                    if len(pending) >= concurrency:
+                        break
+                #endfor
+                if not pending:
+                    return
+
+                done, _ = await asyncio.wait(pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    source = pending.pop(task)
+                    if task.exception() is None:
+                        yield source, task.result()
+                    elif return_exceptions:
+                        yield source, task.exception()
                     else:
-                        raise RuntimeError(f"Unknown field type '{field}'")
-                
-                if elem.text:
-                    assign_items["text"] = elem.text.strip()
+                        raise task.exception()
+                #endfor
+            #endwhile
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _childmap(self, cls) -> Dict[str, type]:
+        """*Internal* child classes of `cls` keyed by class name.
+        """
+        childmap = self._childmaps.get(cls)
+        if childmap is None:
+            childmap = self._childmaps[cls] = { c.getClassName(): c for c in cls.getChildClasses() }
+        return childmap
+
+    def _map(self, root_elem, root_cls, *, check_root_count:bool=True) -> dict:
+        """*Internal* map element tree under `root_elem` into objects.
+
+        Class of every element is resolved from its parent's class, and xpath of every object is built
+        from its parent's xpath, same as `etree.getpath`.
+
+        Args:
+            root_elem: Element of `root_cls`.
+            root_cls: `Model` class, could be a nested class when mapping a subtree.
+            check_root_count: Whether check `__count__` constraints of `root_elem`'s children.
+
+        Returns:
+            Dict of objects keyed by xpath, in document order.
 
-            except ValueError:
-                raise ValueError(f"File {unquote(elem.base)}, line {elem.sourceline}, error type of field '{k}' of '{cls}', got '{type(v)}', expect '{field}'.")
-                    
+        Raises:
+            RuntimeError: If element class is not defined in model or `__count__` constraints is vialated.
+            ValueError: If attribute's value is not expected.
+        """
+        self._check_root(root_elem, root_cls)
+
+        weak = self.weak_parent
+        cancel = self._cancel
+        found = set()
+
+        # build mapped object related model
+        obj_map = MapResult( )
+
+        # depth first, so that objects are created in document order
+        stack = [ (root_elem, root_cls, None, f'/{root_elem.tag}') ]
+        while stack:
+            elem, cls, parent, path = stack.pop()
+
+            if cancel is not None and len(obj_map) % 1024 == 0:
+                if cancel.is_set():
+                    raise CancelledError()
+                # let event loop thread take the GIL
+                time.sleep(0)
 
             # create object of class
-            obj = cls(**assign_items)
+            obj = self._new(cls, self._convert(cls, elem.items(), elem.text, elem))
             obj_map[path] = obj
-
+            found.add(cls)
 
             # Append it to parent object and set its parent
-            parent_elem = elem.getparent()
-            if parent_elem is None:
-                pass # root
-            else:
-                # has parent
-                parent = obj_map[tree.getpath(parent_elem)]
-                parent.appendChild(obj)
+            if parent is not None:
+                parent.appendChild(obj, weak=weak)
+
+            children, counts = self._check_children(cls, elem, check_count=parent is not None or check_root_count)
+            childmap = self._childmap(cls)
+
+            indexes = defaultdict(int)
+            pending = [ ]
+            for child in children:
+                tag = child.tag
+                if counts[tag] > 1:
+                    indexes[tag] += 1
+                    pending.append( (child, childmap[tag], obj, f'{path}/{tag}[{indexes[tag]}]') )
+                else:
+                    pending.append( (child, childmap[tag], obj, f'{path}/{tag}') )
+            #endfor
+            stack.extend(reversed(pending))
+        #endwhile
+
+        class_types = self._class_types.get(root_cls)
+        if class_types is None:
+            class_types = self._class_types[root_cls] = set(get_all_class_types(root_cls))
+        unused = class_types - found
+        if len(unused) > 0:
+            logger.debug(f"{_base(root_elem)}, class {set(c.getClassQualName() for c in unused)} defined in model is not found in xml")
+
+        return obj_map
+
+    def _check_root(self, root_elem, root_cls):
+        """*Internal* check root element is of `root_cls`.
+        """
+        if root_elem.tag != root_cls.getClassName():
+            parent_qualname = root_cls.getParentClassQualName()
+            qualname = f"{parent_qualname}.{root_elem.tag}" if parent_qualname else root_elem.tag
+            raise RuntimeError(f"{_base(root_elem)}, xml element class {{'{qualname}'}} is not defined in model.")
+
+    def _check_children(self, cls, elem, *, check_count:bool=True):
+        """*Internal* check children elements of `elem` of class `cls`.
+
+        Returns:
+            Tuple of (list of children elements, Counter of children tags).
+
+        Raises:
+            RuntimeError: If element class is not defined in model or `__count__` constraints is vialated.
+        """
+        children = [ child for child in elem if isinstance(child.tag, str) ]
+        counts = Counter( child.tag for child in children )
+        childmap = self._childmap(cls)
+
+        if self._validated is not None:
+            # classes of elements are checked by schema, and counts if it covers them
+            check_count = check_count and not self._validated.counts_covered
+            undefined = ()
+        else:
+            undefined = counts.keys() - childmap.keys()
+
+        # check consistance of model class and xml elements types
+        if len(undefined) > 0:
+            raise RuntimeError(f"{_base(elem)}, xml element class {set(f'{cls.getClassQualName()}.{tag}' for tag in undefined)} is not defined in model.")
+
+        # check number of children count constraints
+        if check_count:
+            for name, childcls in childmap.items():
+                if not self.is_valid_number(counts.get(name, 0), childcls.__count__):
+                    raise RuntimeError(f"File {_base(elem)}, line {elem.sourceline}, model count constaint error: '{childcls.getClassQualName()}' count is {counts.get(name, 0)}, expect: {childcls.__count__}.")
+        #endif
+        return children, counts
+
+    def _validate(self):
+        """*Internal* validate etree with `schema`, python checks it covers are skipped afterwards.
+
+        Raises:
+            RuntimeError: Etree is not valid.
+        """
+        self._validated = None
+        if self.schema is not None:
+            self.schema.assertValid(self.tree)
+            self._validated = self.schema
 
+    def _new(self, cls, kwargs):
+        """*Internal* create object of `cls`, without python validation if schema covers all of its fields.
+        """
+        if self._validated is not None and cls in self._validated.trusted:
+            obj = cls.__new__(cls)
+            dict.update(obj, kwargs)
+            obj._initLinks()
+            return obj
+        return cls(**kwargs)
+
+    def _attach_source(self, obj_map: MapResult, data: bytes):
+        """*Internal* keep `data` with root and byte span of its element in every object, see `track_source`.
+        """
+        spans = element_spans(data)
+        if len(spans) != len(obj_map):
+            raise RuntimeError(f"{self._where()}, {len(spans)} elements found in source bytes, {len(obj_map)} objects mapped.")
 
+        for obj, span in zip(obj_map.values(), spans):
+            obj['__span'] = span
         #endfor
+        next(iter(obj_map.values()))['__source'] = data
+
+    def _parse_lazy(self) -> MapResult:
+        """*Internal* lazy parsing, see `parse`.
+        """
+        root_elem = self.tree.getroot()
+        self._validate()
+        self._check_root(root_elem, self.model_cls)
+
+        root = self._new(self.model_cls, self._convert(self.model_cls, root_elem.items(), root_elem.text, root_elem))
+        self._defer(root, root_elem)
+
+        obj_map = MapResult( )
+        obj_map[f'/{root_elem.tag}'] = root
+        obj_map._root = root
+        obj_map._tree = self.tree
         return obj_map
 
-    
+    def _defer(self, obj, elem):
+        """*Internal* make children containers of `obj` pending, they are loaded from `elem` at first access.
+        """
+        childclasses = obj.getChildClasses()
+        if len(childclasses) == 0:
+            return
+        loader = _LazyLoader(self, obj, elem)
+        for childcls in childclasses:
+            obj[f'__child{childcls.getClassName()}']._pending = loader
+
+    def _load_children(self, obj, elem):
+        """*Internal* create, validate and append children of `obj` from `elem`, their children are deferred.
+
+        Children are appended only when all of them are valid, containers stay pending otherwise.
+        """
+        cls = obj.__class__
+        children, _ = self._check_children(cls, elem)
+        childmap = self._childmap(cls)
+        link = weakref.ref(obj) if self.weak_parent else obj
+        loaded = defaultdict(list)
+        for child in children:
+            childcls = childmap[child.tag]
+            child_obj = self._new(childcls, self._convert(childcls, child.items(), child.text, child))
+            child_obj[childcls.__parentkey__] = link
+            loaded[f'__child{childcls.getClassName()}'].append(child_obj)
+            self._defer(child_obj, child)
+        #endfor
+        _fillPending(obj, loaded)
+
+    def _parse_projected(self, include, exclude) -> MapResult:
+        """*Internal* parse with projection, see `parse`.
+        """
+        classes = { c.getClassQualName(): c for c in get_all_class_types(self.model_cls) }
+
+        def resolve(items) -> set:
+            resolved = set()
+            for item in items:
+                qualname = item if isinstance(item, str) else item.getClassQualName()
+                if qualname not in classes:
+                    raise ValueError(f"Class '{qualname}' is not defined in model '{self.model_cls.getClassQualName()}'")
+                resolved.add(classes[qualname])
+            return resolved
+
+        if include is None:
+            materialize = set(classes.values())
+        else:
+            materialize = set()
+            for cls in resolve(include):
+                # ancestors link included objects to root
+                qualname = cls.getClassQualName()
+                while qualname:
+                    materialize.add(classes[qualname])
+                    qualname = classes[qualname].getParentClassQualName()
+        #endif
+
+        if exclude is not None:
+            excluded = resolve(exclude)
+            if self.model_cls in excluded:
+                raise ValueError("Can't exclude root class")
+            prefixes = tuple( f'{c.getClassQualName()}.' for c in excluded )
+            materialize = set( c for c in materialize if c not in excluded and not c.getClassQualName().startswith(prefixes) )
+
+        target = _ProjectionTarget(self, materialize)
+        parser = etree.XMLParser(target=target, remove_comments=True)
+        with gc_paused(self.gc_mode):
+            root = feed_xml(self.xml, parser, cancel=self._cancel)
+            if self.digest:
+                digest(root)
+            return build_obj_map(root)
+
+    def _convert(self, cls, items, text, elem=None, where=None) -> Dict[str, Any]:
+        """*Internal* convert attributes and text of an element into keyword arguments of `cls`.
+
+        Args:
+            cls: `Model` class.
+            items: Attribute items of element.
+            text: Text of element.
+            elem: Element, only for error messages.
+            where: Callable returning location of element for error messages, without `elem`.
+        """
+        intern_pool = self.intern_pool
+        cls_name = cls.getClassQualName()
+
+        assign_items = { }
+        try:
+            for k, v in items:
+                field = cls.getField(k)
+                if type(field) == Optional:
+                    field = field.field
+                if field is None:
+                    logger.warning(f"Try to assign extra attribute '{k}' to undefined field of '{cls_name}', drop it.")
+                    logger.warning(f"  - {self._where(elem)}")
+                elif type(field) == StringField:
+                    pool = field.pool if field.pool is not None else intern_pool
+                    assign_items[k] = v if pool is None else pool.intern(v)
+                elif type(field) == IntegerField:
+                    assign_items[k] = int(v)
+                elif type(field) == FloatField:
+                    assign_items[k] = float(v)
+                elif isinstance(field, ChoiceField):
+                    assign_items[k] = field.canonical(v)
+                else:
+                    raise RuntimeError(f"Unknown field type '{field}'")
+
+            if text:
+                text = text.strip()
+                assign_items["text"] = text if intern_pool is None else intern_pool.intern(text)
+
+        except ValueError:
+            location = self._where(elem) if where is None else where()
+            raise ValueError(f"{location}, error type of field '{k}' of '{cls}', got '{type(v)}', expect '{field}'.")
+
+        return assign_items
+
+    def _where(self, elem=None) -> str:
+        """*Internal* location of element for error messages.
+        """
+        if elem is not None:
+            return f"File {_base(elem)}, line {elem.sourceline}"
+        elif isinstance(self.xml, (str, os.PathLike)):
+            return f"File {os.fspath(self.xml)}"
+        else:
+            return "File <unknown>"
+
     @staticmethod
     def is_valid_number(num: int, count: Tuple[int,int]) -> bool:
         if type(count) == int:
@@ -139,4 +1042,206 @@ class XmlMapper(object):
 
 
 
-    
+def build_obj_map(root: Model) -> MapResult:
+    """Build dict of objects keyed by xpath from object graph, same as `XmlMapper.parse()` returns.
+
+    Args:
+        root: Root object.
+
+    Returns:
+        Dict of objects keyed by xpath.
+    """
+    obj_map = MapResult( )
+    stack = [ (root, f'/{root.getClassName()}') ]
+    while stack:
+        obj, path = stack.pop()
+        obj_map[path] = obj
+
+        pending = [ ]
+        for childcls in obj.getChildClasses():
+            name = childcls.getClassName()
+            children = obj[f'__child{name}']
+            if len(children) > 1:
+                pending += [ (child, f'{path}/{name}[{i}]') for i, child in enumerate(children, 1) ]
+            else:
+                pending += [ (child, f'{path}/{name}') for child in children ]
+        #endfor
+        stack.extend(reversed(pending))
+    #endwhile
+    return obj_map
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _default_executor() -> ThreadPoolExecutor:
+    """*Internal* bounded thread pool shared by asynchronous parsing.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4), thread_name_prefix="xo-mapper")
+        return _executor
+
+
+def _parse_job(source, model_cls: type, options: dict) -> dict:
+    """*Internal* job of `XmlMapper.aparse` in process pool.
+    """
+    return XmlMapper(source, model_cls, **options).parse()
+
+
+class _ProjectionTarget(object):
+    """*Internal* lxml parser target of projection parsing, maps objects from parser events without etree.
+    """
+    def __init__(self, mapper: XmlMapper, materialize: set):
+        self.mapper = mapper
+        self.materialize = materialize
+        self.stack = [ ]    # list of [cls, attribute items or object, text parts or text, children counts, ordinal]
+        self.skip = 0       # depth inside skipped subtree
+        self.started = 0    # number of elements started, ordinal of element for error messages
+        self.root = None
+
+    def _where(self, ordinal: int) -> str:
+        """Location of the `ordinal`-th element (from 1) for error messages.
+
+        Parser events carry no line numbers, the source is parsed again up to the element
+        (a consumed file object can't be).
+        """
+        xml = self.mapper.xml
+        if not hasattr(xml, 'read'):
+            try:
+                with open_xml_source(xml) as (src, _):
+                    if isinstance(src, (bytes, bytearray, memoryview, mmap.mmap)):
+                        src = io.BytesIO(src)
+                    for i, (_, elem) in enumerate(etree.iterparse(src, events=('start',)), 1):
+                        if i == ordinal:
+                            return self.mapper._where(elem)
+            except etree.XMLSyntaxError:
+                pass
+        return self.mapper._where()
+
+    def _create(self, entry):
+        """Create object of entry if it is not created yet.
+        """
+        if isinstance(entry[1], Model):
+            return entry[1]
+
+        cls, items, texts, _, ordinal = entry
+        text = texts if isinstance(texts, str) else "".join(texts)
+        obj = entry[1] = cls(**self.mapper._convert(cls, items, text, where=lambda: self._where(ordinal)))
+        if len(self.stack) > 1 and self.stack[-1] is entry:
+            parent = self.stack[-2][1]
+            parent.appendChild(obj, weak=self.mapper.weak_parent)
+        return obj
+
+    def start(self, tag, attrib):
+        self.started += 1
+        if self.skip:
+            self.skip += 1
+            return
+
+        tag = tag[tag.find('}')+1:]
+        if not self.stack:
+            cls = self.mapper.model_cls
+            if tag != cls.getClassName():
+                raise RuntimeError(f"{self._where(self.started)}, xml element class {{'{tag}'}} is not defined in model.")
+        else:
+            parent = self.stack[-1]
+            parent_cls = parent[0]
+            cls = self.mapper._childmap(parent_cls).get(tag)
+            if cls is None:
+                raise RuntimeError(f"{self._where(self.started)}, xml element class {{'{parent_cls.getClassQualName()}.{tag}'}} is not defined in model.")
+            parent[3][tag] += 1
+            if not isinstance(parent[2], str):
+                # text of parent is before its first child
+                parent[2] = "".join(parent[2])
+            if cls not in self.materialize:
+                self.skip = 1
+                return
+            # parent's text is complete now
+            self._create(parent)
+
+        items = [ (k[k.find('}')+1:], v) for k, v in attrib.items() ]
+        self.stack.append( [cls, items, [ ], Counter(), self.started] )
+
+    def data(self, data):
+        if not self.skip:
+            texts = self.stack[-1][2]
+            if not isinstance(texts, str):
+                texts.append(data)
+
+    def end(self, tag):
+        if self.skip:
+            self.skip -= 1
+            return
+
+        entry = self.stack[-1]
+        obj = self._create(entry)
+        self.stack.pop()
+
+        # check number of children count constraints
+        counts = entry[3]
+        for name, childcls in self.mapper._childmap(entry[0]).items():
+            if not self.mapper.is_valid_number(counts.get(name, 0), childcls.__count__):
+                raise RuntimeError(f"{self._where(entry[4])}, model count constaint error: '{childcls.getClassQualName()}' count is {counts.get(name, 0)}, expect: {childcls.__count__}.")
+
+        if not self.stack:
+            self.root = obj
+
+    def close(self):
+        return self.root
+
+
+class _LazyLoader(object):
+    """*Internal* pending loader of children containers of an object of lazy parsing.
+    """
+    __slots__ = [ 'mapper', 'owner', 'elem' ]
+
+    def __init__(self, mapper: XmlMapper, owner: Model, elem):
+        self.mapper = mapper
+        self.owner = weakref.ref(owner)
+        self.elem = elem
+
+    def __call__(self):
+        mapper, owner, elem = self.mapper, self.owner(), self.elem
+        if owner is None or elem is None:
+            return
+
+        # loader is called by whichever container is accessed first, and again only if it failed
+        mapper._load_children(owner, elem)
+        self.mapper = self.elem = None
+
+
+def _unpack_map_result(cls, graphs, entries) -> MapResult:
+    """*Internal* rebuild `MapResult` pickled by `MapResult.__reduce__`.
+    """
+    graphs = [ unpack_graph(packed) for packed in graphs ]
+    result = cls()
+    for path, graph_idx, node_idx in entries:
+        result[path] = graphs[graph_idx][node_idx]
+    return result
+
+
+def _base(elem) -> str:
+    """*Internal* file name of element for error messages.
+    """
+    return unquote(elem.base) if elem.base else "<unknown>"
+
+
+def _map_partition(xml, prolog: bytes, root_open: bytes, start: int, end: int, model_cls: type, options: dict,
+                   shared: bool = False):
+    """*Internal* worker of `XmlMapper.parse_partitioned`, map root's children in `xml[start:end]`.
+
+    Returns:
+        Children of root, detached from root, or `SharedColumns` of them if `shared`.
+    """
+    with open(xml, "rb") as file:
+        file.seek(start)
+        chunk = file.read(end - start)
+
+    root_tag = XmlMapper._root_tag(root_open)
+    mapper = XmlMapper(io.BytesIO(prolog + root_open + chunk + b"</" + root_tag + b">"), model_cls, **options)
+    root_elem = mapper.tree.getroot()
+    obj_map = mapper._map(root_elem, model_cls, check_root_count=False)
+    children = obj_map[f'/{root_elem.tag}'].removeChildren()
+    return share_columns(children, model_cls) if shared else children
@@ -0,0 +1,179 @@
+"""
+# Approximate memory retained by mapped objects
+#
+# Copyright (C) 2019 ZIJIAN JIANG
+"""
+
+import sys
+import weakref
+from typing import Dict, List, Tuple
+
+from .model import Model, ChildList
+
+
+# Approximate sizes of libxml2 structs on 64-bit platforms, lxml proxies are created on access only.
+_XML_NODE_SIZE = 120        # xmlNode, for elements, text and tail nodes
+_XML_ATTR_SIZE = 96         # xmlAttr, its value is an extra text node
+
+
+class ClassMemory(object):
+    """Objects of one `Model` class and the bytes they retain.
+
+    Attributes:
+        count: Number of objects.
+        objects: Bytes of object dicts themselves.
+        fields: Bytes of field values.
+        text: Bytes of texts.
+        containers: Bytes of children containers and parent references.
+        xpaths: Bytes of xpath keys in the map.
+    """
+    __slots__ = [ 'count', 'objects', 'fields', 'text', 'containers', 'xpaths' ]
+
+    def __init__(self):
+        self.count = 0
+        self.objects = 0
+        self.fields = 0
+        self.text = 0
+        self.containers = 0
+        self.xpaths = 0
+
+    @property
+    def total(self) -> int:
+        return self.objects + self.fields + self.text + self.containers + self.xpaths
+
+    def as_dict(self) -> Dict[str, int]:
+        return { 'count': self.count, 'objects': self.objects, 'fields': self.fields, 'text': self.text,
+                 'containers': self.containers, 'xpaths': self.xpaths, 'total': self.total }
+
+
+class MemoryReport(object):
+    """Memory report of a map of objects, see `MapResult.memory_report()`.
+
+    Attributes:
+        classes: `ClassMemory` keyed by class qualname, heaviest first.
+        tree: Approximate bytes of the retained lxml etree, `None` if no etree is retained.
+        subtrees: Heaviest subtrees, list of (xpath, bytes, number of objects).
+    """
+    def __init__(self, classes: Dict[str, ClassMemory], tree: int, subtrees: List[Tuple[str, int, int]]):
+        self.classes = classes
+        self.tree = tree
+        self.subtrees = subtrees
+
+    @property
+    def total(self) -> int:
+        """Bytes retained by objects and the etree.
+        """
+        return sum( c.total for c in self.classes.values() ) + (self.tree or 0)
+
+    def as_dict(self) -> dict:
+        return {
+            'classes': { name: c.as_dict() for name, c in self.classes.items() },
+            'tree': self.tree,
+            'subtrees': [ { 'path': path, 'bytes': size, 'count': count } for path, size, count in self.subtrees ],
+            'total': self.total,
+        }
+
+    def __str__(self):
+        columns = [ 'count', 'objects', 'fields', 'text', 'containers', 'xpaths', 'total' ]
+        width = max( [ len('class') ] + [ len(name) for name in self.classes ] )
+        lines = [ f"{'class':<{width}} " + " ".join( f'{c:>10}' for c in columns ) ]
+        for name, c in self.classes.items():
+            values = c.as_dict()
+            lines.append( f"{name:<{width}} " + " ".join( f'{values[col]:>10}' for col in columns ) )
+        if self.tree is not None:
+            lines.append(f"retained etree: {self.tree} bytes")
+        lines.append(f"total: {self.total} bytes")
+        if self.subtrees:
+            lines.append("heaviest subtrees:")
+            for path, size, count in self.subtrees:
+                lines.append(f"  {size:>10} bytes {count:>8} objects  {path}")
+        return "\n".join(lines)
+
+
+def _tree_size(tree) -> int:
+    """*Internal* approximate bytes of an lxml etree, libxml2 nodes and their strings.
+    """
+    total = 0
+    for elem in tree.getroot().iter():
+        total += _XML_NODE_SIZE + len(elem.tag) + 1
+        if elem.text:
+            total += _XML_NODE_SIZE + len(elem.text.encode()) + 1
+        if elem.tail:
+            total += _XML_NODE_SIZE + len(elem.tail.encode()) + 1
+        for k, v in elem.items():
+            total += _XML_ATTR_SIZE + _XML_NODE_SIZE + len(k) + len(v.encode()) + 2
+    #endfor
+    return total
+
+
+def memory_report(obj_map: Dict[str, Model], *, tree=None, top: int = 10) -> MemoryReport:
+    """Estimate memory retained by objects of `obj_map`, per class and per subtree.
+
+    Sizes are shallow `sys.getsizeof` of objects and values; a value shared by several objects
+    (interned string for example) is counted once, for the first object met.
+    Pending children of lazy parsing are not loaded nor counted.
+
+    Args:
+        obj_map: Map of xpath to objects, see `XmlMapper.parse()`.
+        tree: Retained lxml etree to estimate.
+        top: Number of heaviest subtrees to report.
+
+    Returns:
+        `MemoryReport`.
+    """
+    classes = dict()
+    seen = set()
+    own = dict()        # id(obj): bytes of the object alone
+    paths = dict()      # id(obj): xpath
+    objs = [ ]
+
+    def measure(value) -> int:
+        if id(value) in seen:
+            return 0
+        seen.add(id(value))
+        return sys.getsizeof(value)
+
+    for path, obj in obj_map.items():
+        if id(obj) in own:
+            continue
+        c = classes.get(obj.getClassQualName())
+        if c is None:
+            c = classes[obj.getClassQualName()] = ClassMemory()
+
+        before = c.total
+        c.count += 1
+        c.objects += sys.getsizeof(obj)
+        c.xpaths += sys.getsizeof(path)
+        for key, value in obj.items():
+            c.objects += measure(key)
+            if isinstance(value, ChildList):
+                c.containers += sys.getsizeof(value) + sys.getsizeof(value._items)
+            elif isinstance(value, (Model, weakref.ref)) or value is None:
+                if isinstance(value, weakref.ref):
+                    c.containers += sys.getsizeof(value)
+            elif key == 'text':
+                c.text += measure(value)
+            elif not key.startswith('__'):
+                c.fields += measure(value)
+        #endfor
+        own[id(obj)] = c.total - before
+        paths[id(obj)] = path
+        objs.append(obj)
+    #endfor
+
+    # accumulate subtrees bottom up, deepest first
+    subtree = dict(own)
+    counts = dict.fromkeys(own, 1)
+    for obj in sorted(objs, key=lambda o: -paths[id(o)].count('/')):
+        parent = obj.getParent() if obj.getParentClassName() is not None else None
+        if parent is not None and id(parent) in subtree:
+            subtree[id(parent)] += subtree[id(obj)]
+            counts[id(parent)] += counts[id(obj)]
+    #endfor
+
+    heaviest = sorted(own, key=lambda i: (-subtree[i], paths[i]))[:top]
+    return MemoryReport(
+        dict(sorted(classes.items(), key=lambda item: -item[1].total)),
+        None if tree is None else _tree_size(tree),
+        [ (paths[i], subtree[i], counts[i]) for i in heaviest ]
+    )
@@ -1,14 +1,246 @@
 import sys
 import inspect
-import functools
+import weakref
 from itertools import chain
 
 import typing
-from typing import Union, Type, List, Tuple
+from typing import Union, List, Tuple, Dict
 
 from .. import logger
-from .field import Field, Optional, ForeignKeyField, ForeignKeyArrayField
-from .convert import toElement
+from .field import Field, Optional, ChoiceField, ForeignKeyField, ForeignKeyArrayField
+from .convert import toElement, toXml
+from .codec import pack_graph, unpack_graph, unpack_node, node_of, set_external
+from .diff import digest
+from .select import select as _select
+
+
+class ChildList(object):
+    """Ordered container of child objects keyed by identity.
+
+    Keeps insertion order like `list`, but membership test and removal are O(1)
+    and never fall back to `Model.__eq__`.
+
+    A container could be *pending*: its children are not created yet, the pending loader is called
+    at first access (see `XmlMapper.parse(lazy=True)`).
+    A *frozen* container can't be modified.
+
+    Positional access and `index()` are O(1): a list of children and their positions are cached,
+    kept by `append`, rebuilt after removals.
+    """
+    __slots__ = [ '_items', '_pending', '_frozen', '_order', '_positions' ]
+
+    def __init__(self, iterable=()):
+        self._items = { id(child): child for child in iterable }
+        self._pending = None
+        self._frozen = None
+        self._order = None      # cached list of children, None after removals
+        self._positions = None  # cached id(child): position, None after removals
+
+    def _checkMutable(self):
+        if self._frozen is not None:
+            raise RuntimeError("Can't modify frozen ChildList")
+
+    def freeze(self):
+        """Make this container immutable, no-op if already frozen.
+        """
+        if self._frozen is not None:
+            return
+        if self._pending is not None:
+            self._load()
+        self._frozen = tuple(self._items.values())
+
+    def _load(self):
+        """*Internal* call pending loader, it fills this container (and siblings of the same owner).
+
+        The loader clears itself once it succeeded (see `_fillPending`), a failed one is kept and
+        raises again at next access instead of leaving partial children.
+        """
+        self._pending()
+
+    def append(self, child):
+        self._checkMutable()
+        if self._pending is not None:
+            self._load()
+        if id(child) not in self._items:
+            if self._order is not None:
+                self._order.append(child)
+            if self._positions is not None:
+                self._positions[id(child)] = len(self._items)
+        self._items[id(child)] = child
+
+    def remove(self, child):
+        """Remove `child` from container.
+
+        Raises:
+            ValueError: If `child` is not in container.
+        """
+        self._checkMutable()
+        if self._pending is not None:
+            self._load()
+        if self._items.pop(id(child), None) is None:
+            raise ValueError(f'{child!r} is not in ChildList')
+        self._order = self._positions = None
+
+    def discard(self, child):
+        self._checkMutable()
+        if self._pending is not None:
+            self._load()
+        if self._items.pop(id(child), None) is not None:
+            self._order = self._positions = None
+
+    def clear(self):
+        self._checkMutable()
+        self._pending = None
+        self._items.clear()
+        self._order = self._positions = None
+
+    def __contains__(self, child):
+        if self._pending is not None:
+            self._load()
+        return self._items.get(id(child)) is child
+
+    def __iter__(self):
+        if self._pending is not None:
+            self._load()
+        return iter(self._items.values())
+
+    def __reversed__(self):
+        if self._pending is not None:
+            self._load()
+        return reversed(list(self._items.values()))
+
+    def __len__(self):
+        if self._pending is not None:
+            self._load()
+        return len(self._items)
+
+    def __getitem__(self, index):
+        """Positional access, O(1) once the list of children is cached."""
+        if self._frozen is not None:
+            return self._frozen[index]
+        if self._pending is not None:
+            self._load()
+        if self._order is None:
+            self._order = list(self._items.values())
+        return self._order[index]
+
+    def index(self, child) -> int:
+        """Position of `child`, O(1) once positions are cached.
+
+        Raises:
+            ValueError: If `child` is not in container.
+        """
+        if self._pending is not None:
+            self._load()
+        if self._positions is None:
+            self._positions = { id(c): i for i, c in enumerate(self._items.values()) }
+        position = self._positions.get(id(child))
+        if position is None or self._items[id(child)] is not child:
+            raise ValueError(f'{child!r} is not in ChildList')
+        return position
+
+    def __reduce__(self):
+        # ids are not stable across processes, rebuild from values
+        return (self.__class__, (list(self),))
+
+    def __repr__(self):
+        if self._pending is not None:
+            return 'ChildList(<pending>)'
+        return f'ChildList({list(self._items.values())!r})'
+
+
+class _AttrDescriptor(object):
+    """*Internal* data descriptor reading attribute `key` of model object from its dict.
+
+    Generated by `ModelMetaclass` for every field (and `text`), so reading `obj.name` is a class level hit
+    instead of a failed normal lookup falling back to `Model.__getattr__`.
+    Reading it from the class returns the `Field`.
+    Fields named like attributes of `Model` or `dict` get no descriptor, methods are kept.
+    """
+    __slots__ = [ 'key', 'field' ]
+
+    def __init__(self, key:str, field=None):
+        self.key = key
+        self.field = field
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            if self.field is None:
+                raise AttributeError(f"type object '{objtype.__qualname__}' has no attribute '{self.key}'")
+            return self.field
+        try:
+            return dict.__getitem__(obj, self.key)
+        except KeyError:
+            raise AttributeError(f"'{obj.getClassQualName()}' object has no attribute '{self.key}'")
+
+    def __set__(self, obj, value):
+        Model.__setattr__(obj, self.key, value)
+
+
+def _fieldChecker(key:str, field):
+    """*Internal* build checker of values assigned to attribute `key` of `field`, see `Model.__setattr__`.
+
+    Returns:
+        Function `(obj, value) -> value to store`, raising `AttributeError` for wrong value;
+        `None` if values of `field` are not checked.
+    """
+    if type(field) == ForeignKeyField:
+        column_type = field.column_type
+        accepted = dict()   # type: bool, cache of qualname checks
+
+        def check(obj, value):
+            if value is not None:
+                t = type(value)
+                ok = accepted.get(t)
+                if ok is None:
+                    ok = accepted[t] = t.__qualname__ in column_type
+                if not ok:
+                    raise AttributeError(f"'{obj.__class__.__qualname__}': Wrong attribute '{key}' type, got '{t.__qualname__}', expect '{column_type}'.")
+            return value
+        return check
+
+    elif type(field) == ForeignKeyArrayField:
+        column_type = field.column_type
+
+        def check(obj, value):
+            if type(value) != list:
+                raise AttributeError(f"'{obj.__class__.__qualname__}': Wrong attribute '{key}' type, got '{type(value).__qualname__}', expect 'List({column_type})'")
+            wrongs = [ v for v in value if type(v).__qualname__ not in column_type ]
+            if len(wrongs) > 0:
+                raise AttributeError(f"'{obj.__class__.__qualname__}': Wrong attribute '{key}' type, got '{wrongs}', expect 'List({column_type})'")
+            return value
+        return check
+
+    elif isinstance(field, ChoiceField):
+        def check(obj, value):
+            if not field.is_valid(value):
+                raise AttributeError(f"'{obj.__class__.__qualname__}': Attribute error, failed at attribute '{key}' constraint '{field.r}', got: '{value}'")
+            # shared canonical choice
+            return field.canonical(field.text(value))
+        return check
+
+    elif isinstance(field, Field):
+        column_type = field.column_type
+
+        def check(obj, value):
+            if type(value) is not column_type:
+                raise AttributeError(f"'{obj.__class__.__qualname__}': Wrong attribute '{key}' type, got '{type(value)}', expect '{column_type}'.")
+            return value
+        return check
+
+    else:
+        # Optional
+        return None
+
+
+def _inherited(bases, key:str) -> bool:
+    """*Internal* whether `key` is an attribute of `bases` other than a field descriptor.
+    """
+    for base in bases:
+        for c in base.__mro__:
+            if key in vars(c):
+                return not isinstance(vars(c)[key], _AttrDescriptor)
+    return False
 
 
 class ModelMetaclass(type):
@@ -19,6 +251,7 @@ class ModelMetaclass(type):
     def __new__(cls, name, bases, attrs):
 
         if name=='Model':
+            attrs.update( __parentqualname__=None, __parentname__=None, __parentkey__=None, __childkey__=None, __childkeys__=(), __checkers__={} )
             return type.__new__(cls, name, bases, attrs)
 
         logger.debug( f'found model: {name}' )
@@ -53,12 +286,35 @@ class ModelMetaclass(type):
                 childclasses.append(v)
             #endif
 
-        for k in mappings.keys():
-            attrs.pop(k)
+        # per-field descriptors and checkers instead of Field class attributes
+        checkers = dict()
+        for k, v in mappings.items():
+            if _inherited(bases, k):
+                # fields named like methods (`items`, `keys`, `save`...) are read by `getAttr()` or `obj[key]`
+                attrs.pop(k)
+            else:
+                attrs[k] = _AttrDescriptor(k, v)
+            checker = _fieldChecker(k, v)
+            if checker is not None:
+                checkers[k] = checker
+        if 'text' not in mappings:
+            attrs['text'] = _AttrDescriptor('text')
 
         attrs['__mappings__'] = mappings 
         attrs['__fields__'] = fields
         attrs['__childclasses__'] = childclasses
+        attrs['__checkers__'] = checkers
+
+        # links metadata, computed once
+        qualname_splits = attrs['__qualname__'].split(".")
+        if len(qualname_splits) > 1:
+            attrs['__parentqualname__'] = ".".join(qualname_splits[:-1])
+            attrs['__parentname__'] = qualname_splits[-2]
+            attrs['__parentkey__'] = f'__parent{qualname_splits[-2]}'
+        else:
+            attrs['__parentqualname__'] = attrs['__parentname__'] = attrs['__parentkey__'] = None
+        attrs['__childkey__'] = f'__child{name}'     # key of container of objects of this class in parent
+        attrs['__childkeys__'] = tuple( f'__child{c.__name__}' for c in childclasses )
 
         # set count constraints
         if '__count__' in attrs:
@@ -172,6 +428,12 @@ class Model(dict, metaclass=ModelMetaclass):
                 elif v.is_valid(kwargs[k]) == False:
                     raise AttributeError(f"'{qualname}': Attribute error, failed at attribute '{k}' constraint '{v.r}', got: '{kwargs[k]}'")
 
+                else:
+                    choice = v.field if isOptional else v
+                    if isinstance(choice, ChoiceField):
+                        # shared canonical choice, as `setAttr` stores
+                        kwargs[k] = choice.canonical(choice.text(kwargs[k]))
+
             
             # ForeignKeyField ;
             elif type(v) == ForeignKeyField:
@@ -197,20 +459,23 @@ class Model(dict, metaclass=ModelMetaclass):
 
         super(Model, self).__init__(**kwargs)
 
-        #--------- assign __parent{Class}, __child{Class} attributes ---------#
+        self._initLinks()
 
-        qualname_splits = qualname.split(".")
+    def _initLinks(self):
+        """*Internal* assign empty `__parent{Class}`, `__child{Class}` attributes.
+        """
+        #--------- assign __parent{Class}, __child{Class} attributes ---------#
 
-        if len(qualname_splits) > 1:
+        # new objects are never frozen, skip the check of __setitem__
+        if self.__parentkey__ is not None:
             # have parent
-            parent_classname = qualname_splits[-2]
-            setattr(self, f'__parent{parent_classname}', None) # place holder
+            dict.__setitem__(self, self.__parentkey__, None) # place holder
         else:
             #root and not assign __parent{Class} attribute
             pass
         
-        for childclass in self.__class__.__childclasses__:
-            setattr(self, f'__child{childclass.getClassName()}', [ ])
+        for key in self.__childkeys__:
+            dict.__setitem__(self, key, ChildList())
 
         #--------- ! assign __parent{Class}, __child{Class} attributes ---------#
 
@@ -220,13 +485,7 @@ class Model(dict, metaclass=ModelMetaclass):
         Returns:
             Parent class name.
         """
-        parentclass_qualname = cls.getParentClassQualName()
-        if parentclass_qualname:
-            # return parent class `name`
-            return parentclass_qualname.split(".")[-1]
-        else:
-            # not having parent
-            return None
+        return cls.__parentname__
 
     @classmethod
     def getClassName(cls) -> str:
@@ -250,14 +509,7 @@ class Model(dict, metaclass=ModelMetaclass):
         Returns:
             Parent class qual name.
         """
-        qualname = cls.getClassQualName()
-        qualname_split = qualname.split(".")
-        if len( qualname_split ) > 1:
-            # return parent name
-            return ".".join(qualname_split[:-1])
-        else:
-            # not having parent
-            return None
+        return cls.__parentqualname__
 
     @classmethod
     def getChildClasses(cls) -> List[type]:
@@ -350,36 +602,96 @@ class Model(dict, metaclass=ModelMetaclass):
     def __setattr__(self, key, value):
         """*Internal* setter method.
         """
+        self._checkMutable()
 
-        # check 
-        field = self.getField(key)
+        # checker of field precomputed by metaclass, extra attributes are not checked
+        checker = self.__checkers__.get(key)
+        if checker is not None:
+            value = checker(self, value)
 
-        if type(field) == ForeignKeyField:
-            if value!= None and type(value).__qualname__ not in field.column_type:
-                raise AttributeError(f"'{self.__class__.__qualname__}': Wrong attribute '{key}' type, got '{type(value).__qualname__}', expect '{field.column_type}'.")
+        self[key] = value
+        self._touch()
 
-        elif type(field) == ForeignKeyArrayField:
-            if type(value) != list:
-                raise AttributeError(f"'{self.__class__.__qualname__}': Wrong attribute '{key}' type, got '{type(value).__qualname__}', expect 'List({field.column_type})'")
-            
-            else:
-                wrongs = [ v for v in value if type(v).__qualname__ not in field.column_type ]
-                if len( wrongs ) > 0:
-                    raise AttributeError(f"'{self.__class__.__qualname__}': Wrong attribute '{key}' type, got '{wrongs}', expect 'List({field.column_type})'")
+    # dict mutators raise on frozen objects as well, see `freeze()`
 
-        elif isinstance(field, Field):
-            if type(value) is not field.column_type:
-                raise AttributeError(f"'{self.__class__.__qualname__}': Wrong attribute '{key}' type, got '{type(value)}', expect '{field.column_type}'.")
+    def __setitem__(self, key, value):
+        self._checkMutable()
+        dict.__setitem__(self, key, value)
 
-        else:
-            # logger.warning(f"'{self.__class__.__qualname__}': Assign extra attribute '{key}' to object. Please notice.")
-            pass
+    def __delitem__(self, key):
+        self._checkMutable()
+        dict.__delitem__(self, key)
 
-        self[key] = value
+    def __ior__(self, other):
+        self._checkMutable()
+        return dict.__ior__(self, other)
+
+    def update(self, *args, **kwargs):
+        self._checkMutable()
+        dict.update(self, *args, **kwargs)
+
+    def pop(self, *args):
+        self._checkMutable()
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._checkMutable()
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        self._checkMutable()
+        return dict.setdefault(self, key, default)
+
+    def clear(self):
+        self._checkMutable()
+        dict.clear(self)
 
     def __hash__(self):
         return hash(id(self))
 
+    def __reduce__(self):
+        """Pickle the whole graph this object belongs to as a flat node array, see `xo.orm.codec`.
+
+        The graph is pickled once with its root, other objects are pickled as their path of
+        (container key, position) from it, so the pickle memo shares the graph between its objects. Foreign keys to objects of other
+        graphs are restored after the graph, graphs refering to each other don't recurse.
+        """
+        root = self
+        while root.getParentClassName() is not None and root.getParent() is not None:
+            root = root.getParent()
+
+        if root is not self:
+            path = [ ]
+            obj = self
+            while obj is not root:
+                parent = obj.getParent()
+                key = obj.__childkey__
+                path.append( (key, parent[key].index(obj)) )
+                obj = parent
+            #endwhile
+            return (node_of, (root, tuple(reversed(path))))
+
+        external = [ ]
+        packed = pack_graph(self, external=external)
+        if not external:
+            return (unpack_node, (packed, 0))
+        return (unpack_node, (packed, 0), external)
+
+    def __setstate__(self, external):
+        """*Internal* restore foreign keys to objects of other graphs, after the graph, see `__reduce__`.
+        """
+        set_external(self, external)
+
+    def __copy__(self):
+        """Copy of this object alone, attribute values are shared, the copy has no parent and no children.
+
+        Use `clone()` to copy the subtree, `copy.deepcopy()` the whole graph.
+        """
+        obj = self.__class__.__new__(self.__class__)
+        obj.update( (k, v) for k, v in self.items() if not k.startswith('__') )
+        obj._initLinks()
+        return obj
+
     def __eq__(self, other):
         if isinstance(other, self.__class__):
             return hash(id(self))==hash(id(other))
@@ -395,6 +707,8 @@ class Model(dict, metaclass=ModelMetaclass):
         Returns:
             Value of attribute.
         """
+        if key in self.__mappings__ or key == 'text':
+            return self.get(key)
         return getattr(self, key, None)
 
     def setAttr(self, key:str, value:typing.Optional[Union[str,int,float,object,List[object]]]):
@@ -417,16 +731,23 @@ class Model(dict, metaclass=ModelMetaclass):
     def getParent(self) -> typing.Optional['Model']:
         """Return parent if it exists.
         """
-        if self.getParentClassName() is None:
+        key = self.__parentkey__
+        if key is None:
             return None
         else:
-            return getattr(self, f'__parent{self.getParentClassName()}')
+            parent = self[key]
+            if type(parent) is weakref.ref:
+                # weak parent reference, `None` if parent has been freed
+                return parent()
+            return parent
 
-    def setParent(self, parent:'Model'):
+    def setParent(self, parent:'Model', *, weak:bool=False):
         """Set parent of this object. Also parent will be set to `parent`.
 
         Args:
             parent: Parent
+            weak: Only hold a weak reference to `parent`, so that the graph has no reference cycle
+                  between parent and children. Someone else must keep the parent (e.g. root) alive.
 
         Raises:
             RuntimeError: If parent's model is not this model's parent, runtime eror will raise,
@@ -435,11 +756,15 @@ class Model(dict, metaclass=ModelMetaclass):
         if not parent.isChildClass(self.__class__):
             raise RuntimeError(f'Can\'t assign parent of wrong type, "{self.getClassQualName()}" is not childclass of "{parent.getClassQualName()}"')
 
+        self._checkMutable()
+        parent._checkMutable()
         self.removeFromParent()
-        setattr(self, f'__parent{self.getParentClassName()}', parent)
-        getattr(parent, f'__child{self.getClassName()}').append(self)
+        siblings = parent[self.__childkey__]
+        dict.__setitem__(self, self.__parentkey__, weakref.ref(parent) if weak else parent)
+        siblings.append(self)
+        parent._touch(own=False)
 
-        if not self.is_valid_number( len( getattr(parent, f'__child{self.getClassName()}') ), self.__count__  ):
+        if not self.is_valid_number( len( siblings ), self.__count__  ):
             raise RuntimeError(f'Can\'t append child, model count exceeding constaint "{self.getClassQualName()}" count expect {self.__class__.__count__}.')
 
     def removeFromParent(self):
@@ -448,28 +773,34 @@ class Model(dict, metaclass=ModelMetaclass):
         Raises:
             RuntimeError: If this object is root, runtime error will raise, if it has no parent currently it's OK.
         """
-        parent_classname = self.getParentClassName()
-        if parent_classname is None:
+        parent_key = self.__parentkey__
+        if parent_key is None:
             raise RuntimeError(f'root class "{self.getClassQualName()}" has no parent.')
 
-        if getattr(self, f'__parent{parent_classname}') is not None:
-            parent_obj = getattr(self, f'__parent{parent_classname}')
-            getattr(parent_obj, f'__child{self.getClassName()}').remove(self)
-            setattr(self, f'__parent{parent_classname}', None)
+        self._checkMutable()
+        parent_obj = self.getParent()
+        if parent_obj is not None:
+            parent_obj[self.__childkey__].discard(self)
+            self[parent_key] = None
+            parent_obj._touch(own=False)
         else:
-            #TODO: Should we warning here?
-            pass
+            # never had a parent or weak parent is gone
+            self[parent_key] = None
     
-    def appendChild(self, child:'Model'):
+    def appendChild(self, child:'Model', *, weak:bool=False):
         """Apprent child to this object. Also childn's parent will be set to this.
 
+        Args:
+            child: Child object.
+            weak: Child only holds a weak reference to this object, see `setParent`.
+
         Raises:
             RuntimeError: If `child` model is not child of this model, runtime error will raise.
         """
         if not self.isChildClass(child.__class__):
             raise RuntimeError(f'Can\'t append child of wrong type, "{child.getClassQualName()}" is not childclass of "{self.getClassQualName()}"')
 
-        child.setParent(self)
+        child.setParent(self, weak=weak)
 
     def removeChild(self, child:'Model'):
         """Remove child from this object. Also childn's parent will be set to none.
@@ -477,22 +808,214 @@ class Model(dict, metaclass=ModelMetaclass):
         Raises:
             RuntimeError: If `child` is actually not child of this object, runtime error will raise.
         """
-        if child.getParent() != self:
-            raise RuntimeError(f'Can\'t remove object which is not child of this parent')
+        if child.getParent() is not self:
+            raise RuntimeError('Can\'t remove object which is not child of this parent')
         
         child.removeFromParent()
 
-    def removeChildren(self):
-        """Remove all children from this object. Also children's parent will be set to none.
+    def removeChildren(self, predicate=None) -> List['Model']:
+        """Remove children from this object. Also children's parent will be set to none.
+
+        Runs in O(n) of the number of children, whatever `predicate` selects.
+
+        Args:
+            predicate: Callable `predicate(child) -> bool`, remove those return `True`.
+                       If it is `None`, remove all children.
+
+        Returns:
+            List of removed children.
         """
-        for child in self.getChildren():
-            child.removeFromParent()
+        self._checkMutable()
+        parent_key = f'__parent{self.getClassName()}'
+        dropped = [ ]
+        for childcls in self.getChildClasses():
+            children = self[f'__child{childcls.getClassName()}']
+            dropped.append( list(children) if predicate is None else [ child for child in children if predicate(child) ] )
+        #endfor
+
+        # frozen children keep their parent, nothing is removed
+        for child in chain.from_iterable(dropped):
+            child._checkMutable()
+
+        removed = [ ]
+        for childcls, children in zip(self.getChildClasses(), dropped):
+            container = self[f'__child{childcls.getClassName()}']
+            if predicate is None:
+                container.clear()
+            else:
+                for child in children:
+                    container.discard(child)
+            #endif
+            for child in children:
+                child[parent_key] = None
+            removed += children
         #endfor
+        if removed:
+            self._touch(own=False)
+        return removed
+
+    def _checkMutable(self):
+        """*Internal* raise if this object is frozen.
+        """
+        if '__frozen' in self:
+            raise RuntimeError(f"'{self.getClassQualName()}' object is frozen, modify a thaw() or clone() of it.")
+
+    def isFrozen(self) -> bool:
+        return '__frozen' in self
+
+    def freeze(self) -> 'Model':
+        """Make this object and all of its descendants immutable, so they could be shared by threads without locks.
+
+        Pending objects of lazy parsing are created, digests and positional indexes of children are computed and cached.
+        Mutations (`setAttr`, `setParent`, `appendChild`, `removeFromParent`, `removeChildren`...) and dict mutators
+        (`obj[key] = value`, `update`, `pop`, `del obj[key]`...) raise `RuntimeError` afterwards, removing this object
+        from its mutable parent as well.
+
+        Returns:
+            This object.
+        """
+        self.materialize()
+        digest(self)
+
+        stack = [ self ]
+        while stack:
+            obj = stack.pop()
+            if '__frozen' in obj:
+                continue
+            dict.__setitem__(obj, '__frozen', True)
+            for key in obj.__childkeys__:
+                children = obj[key]
+                children.freeze()
+                stack.extend(children)
+        #endwhile
+        return self
+
+    def thaw(self) -> 'Model':
+        """Mutable copy-on-write clone of this frozen object, see `clone()`.
+
+        Raises:
+            RuntimeError: This object is not frozen.
+        """
+        if not self.isFrozen():
+            raise RuntimeError(f"'{self.getClassQualName()}' object is not frozen.")
+        return self.clone()
+
+    def clone(self) -> 'Model':
+        """Mutable clone of subtree under this object, the clone has no parent.
+
+        Clone of a frozen object is lazy: objects of the clone are only copied (shallowly, values are shared)
+        at the first access of them, untouched subtrees are never copied.
+        Clone of a mutable object is copied at once.
+
+        Returns:
+            Root of clone.
+        """
+        if self.isFrozen():
+            return _cloneLazy(self)
+
+        packed = pack_graph(self)
+        # clone is detached from parent of this object
+        return unpack_graph(packed)[0]
+
+    def _touch(self, own:bool=True):
+        """*Internal* this object is changed, drop cached digests of it and its ancestors.
+
+        Objects mapped with source tracking are marked dirty as well: `__dirty` is `True` if
+        attributes or text of the object changed, `False` if only its children or descendants changed.
+
+        Args:
+            own: Attributes or text of this object changed, not only its children.
+        """
+        obj = self
+        while obj is not None:
+            # callers checked mutability
+            dict.pop(obj, '__digest', None)
+            if '__span' in obj:
+                if own:
+                    obj['__dirty'] = True
+                else:
+                    obj.setdefault('__dirty', False)
+            own = False
+            obj = obj.getParent()
+
+    def getDigest(self) -> bytes:
+        """Merkle digest of subtree under this object, see `xo.orm.diff.digest`.
+        """
+        return digest(self)
+
+    def dispose(self):
+        """Break all reference cycles of the graph under this object.
+
+        Parent/children links and foreign keys of this object and all of its descendants are cleared,
+        so the whole subtree can be freed by reference counting without the cyclic garbage collector.
+        This object is detached from its parent as well. Objects are unusable as a graph afterwards.
+        """
+        self._checkMutable()
+        if self.getParentClassName() is not None:
+            self.removeFromParent()
+
+        stack = [ self ]
+        while stack:
+            obj = stack.pop()
+            for childcls in obj.getChildClasses():
+                children = obj[f'__child{childcls.getClassName()}']
+                stack.extend(children)
+                children.clear()
+            #endfor
+            if obj.getParentClassName() is not None:
+                obj[f'__parent{obj.getParentClassName()}'] = None
+
+            for k, v in obj.getFieldItems():
+                if type(v) == ForeignKeyField and k in obj:
+                    obj[k] = None
+                elif type(v) == ForeignKeyArrayField and k in obj:
+                    obj[k] = [ ]
+            #endfor
+        #endwhile
+
+    def isMaterialized(self) -> bool:
+        """Whether children of this object are created, `False` only for objects of lazy parsing.
+        """
+        return all( self[key]._pending is None for key in self.__childkeys__ )
+
+    def materialize(self) -> 'Model':
+        """Create all pending objects under this object, see `XmlMapper.parse(lazy=True)`.
+
+        Returns:
+            This object.
+        """
+        stack = [ self ]
+        while stack:
+            stack.extend( stack.pop().getChildrenIter() )
+        return self
+
+    def validate_all(self) -> 'Model':
+        """Create and validate all pending objects under this object,
+        raise the first attribute or `__count__` error met. Same as `materialize()`.
+
+        Returns:
+            This object.
+        """
+        return self.materialize()
 
     def getChildrenIter(self):
         """Return children iterator.
         """
-        return chain.from_iterable( [ getattr(self, f'__child{childcls.getClassName()}') for childcls in self.getChildClasses() ] )
+        return chain.from_iterable( [ self[key] for key in self.__childkeys__ ] )
+
+    def select(self, selector:str):
+        """Lazily select descendants of this object, e.g. `root.select('Person[@name="Alice"]/Phone')`.
+
+        Selector is compiled once per model class into a plan (impossible steps and fields are rejected
+        before any object is visited) and cached, see `xo.orm.select.compile_selector` for the syntax.
+
+        Returns:
+            Iterator of matched objects.
+
+        Raises:
+            ValueError: Selector is malformed or impossible for this model.
+        """
+        return _select(self, selector)
 
     def getChildren(self, classname=None, *, recursive=False):
         """Return children list.
@@ -529,5 +1052,79 @@ class Model(dict, metaclass=ModelMetaclass):
         """Convert object into etree.Element
         """
         return toElement(self)
-    
-        
\ No newline at end of file
+
+    def save(self, path:str):
+        """Write subtree of this object as xml file, see `xo.orm.convert.toXml`.
+
+        Objects mapped with `XmlMapper(track_source=True)` only re-serialise changed objects,
+        unchanged subtrees are copied verbatim from the source document.
+
+        Args:
+            path: File path to write.
+        """
+        data = toXml(self)
+        with open(path, mode='wb') as file:
+            file.write(data)
+
+
+
+class _CloneLoader(object):
+    """*Internal* pending loader of children containers of a lazy clone.
+    """
+    __slots__ = [ 'source', 'owner' ]
+
+    def __init__(self, source: Model, owner: Model):
+        self.source = source
+        self.owner = weakref.ref(owner)
+
+    def __call__(self):
+        source, owner = self.source, self.owner()
+        if owner is None or source is None:
+            return
+
+        parent_key = f'__parent{owner.getClassName()}'
+        loaded = dict()
+        for key in source.__childkeys__:
+            loaded[key] = [ _cloneLazy(child) for child in source[key] ]
+            for clone in loaded[key]:
+                clone[parent_key] = owner
+        #endfor
+        _fillPending(owner, loaded)
+        self.source = None
+
+
+def _fillPending(owner: Model, loaded: Dict[str, list]):
+    """*Internal* put children created by a pending loader into containers of `owner`, and clear the loader.
+
+    Loaders create all children (linked to `owner`) before calling it, so an error while loading
+    leaves the containers pending.
+
+    Args:
+        owner: Object of pending containers.
+        loaded: Children keyed by container key.
+    """
+    for key in owner.__childkeys__:
+        children = owner[key]
+        children._pending = None
+        for child in loaded.get(key, ()):
+            children._items[id(child)] = child
+        children._order = children._positions = None
+    #endfor
+
+
+def _cloneLazy(source: Model) -> Model:
+    """*Internal* copy object without its children, they are copied at first access.
+    """
+    cls = source.__class__
+    obj = cls.__new__(cls)
+    obj.update( (k, v) for k, v in source.items() if not k.startswith('__') )
+    obj._initLinks()
+    if '__digest' in source:
+        obj['__digest'] = source['__digest']
+
+    childclasses = cls.getChildClasses()
+    if len(childclasses) > 0:
+        loader = _CloneLoader(source, obj)
+        for childcls in childclasses:
+            obj[f'__child{childcls.getClassName()}']._pending = loader
+    return obj
@@ -0,0 +1,253 @@
+"""
+# RelaxNG schema generated from model classes, validated by libxml2
+#
+# Copyright (C) 2019 ZIJIAN JIANG
+"""
+
+import re
+import sys
+import typing
+from functools import lru_cache
+from typing import Set
+
+from lxml import etree
+
+from .field import Field, Optional, StringField, IntegerField, FloatField, ChoiceField
+from .common import get_all_class_types
+
+
+RNG_NS = "http://relaxng.org/ns/structure/1.0"
+XSD_DATATYPES = "http://www.w3.org/2001/XMLSchema-datatypes"
+
+# python regex constructs without an xsd equivalent: extensions and lookarounds, lazy quantifiers, `{,n}`
+_UNSUPPORTED_REGEX = re.compile(r"\(\?|[*+?}]\?|\{,")
+
+# escapes meaning the same in python and xsd, others (`\w`, `\s`, `\b`, `\x41`...) differ or don't exist
+_EXACT_ESCAPES = set("nrt\\|.-^?*+{}()[]dD")
+
+# lexical forms of `int()` and `float()`: stripped of unicode whitespace (the ones allowed in xml),
+# unicode digits, `_` between digits, case insensitive `inf`/`infinity`/`nan`
+_SPACE = "[\\s\u0085\u00a0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000]*"
+_DIGITS = r"\d(_?\d)*"
+INTEGER_PATTERN = fr"{_SPACE}[+\-]?{_DIGITS}{_SPACE}"
+FLOAT_PATTERN = (fr"{_SPACE}[+\-]?(({_DIGITS}(\.({_DIGITS})?)?|\.{_DIGITS})([eE][+\-]?{_DIGITS})?"
+                 fr"|[iI][nN][fF]([iI][nN][iI][tT][yY])?|[nN][aA][nN]){_SPACE}")
+
+
+def xsd_pattern(regex) -> typing.Optional[str]:
+    """Translate python regex of `StringField` (used with `re.match`) into an xsd pattern facet.
+
+    Only exact translations are made: `.`, `\\w`, `\\s` and their complements match other characters in xsd,
+    regexes using them are not translated, nor ones with top-level `|` (`^` and `$` bind to its branches) or
+    ending with `$` (it matches before a final line break too), use `\\Z` to anchor the end.
+
+    Args:
+        regex: Python regex string.
+
+    Returns:
+        Xsd pattern matching the same strings, `None` if `regex` is not simple enough to translate.
+    """
+    if not isinstance(regex, str):
+        return None
+
+    core = regex[1:] if regex.startswith('^') else regex
+    anchored = core.endswith('\\Z') and not core.endswith('\\\\Z')
+    if anchored:
+        core = core[:-2]
+
+    if _UNSUPPORTED_REGEX.search(core):
+        return None
+    # anchors are only allowed at both ends, `.` only in character classes, `|` only in groups
+    escaped = False
+    in_class = False
+    depth = 0
+    for i, c in enumerate(core):
+        if escaped:
+            if c not in _EXACT_ESCAPES:
+                return None
+            escaped = False
+        elif c == '\\':
+            escaped = True
+        elif in_class:
+            if c == '[' or (c == ']' and (core[i-1] == '[' or core[i-2:i] == '[^')):
+                # python literals, class subtraction and empty class in xsd
+                return None
+            in_class = c != ']'
+        elif c == '[':
+            in_class = True
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+            if depth < 0:
+                return None
+        elif c in '$^.' or (c == '|' and depth == 0):
+            return None
+    #endfor
+    if escaped or in_class or depth:
+        return None
+
+    # re.match only anchors at start, xsd patterns match whole value (xsd `.` excludes line breaks)
+    return f"({core})" if anchored else f"({core})[\\s\\S]*"
+
+
+class ModelSchema(object):
+    """RelaxNG schema of a model class tree.
+
+    Every element of a class allows its fields as attributes (typed, `Optional` ones optional),
+    any other attribute (mapper drops them with a warning), text anywhere (mapper ignores tails),
+    and children of its child classes interleaved in any order, with `__count__` as number of occurrences.
+
+    Attributes:
+        model_cls: Root `Model` class.
+        document: Schema document, see `tostring()`.
+        counts_covered: All `__count__` constraints are expressed exactly (not bounded by `max_repeat`).
+        trusted: Classes whose field constraints are all expressed, their objects need no python checks.
+    """
+    def __init__(self, model_cls: type, *, max_repeat: int = 32):
+        """
+        Args:
+            model_cls: Root `Model` class.
+            max_repeat: Largest finite `__count__` bound expressed exactly, larger ones are relaxed to
+                        `zeroOrMore`/`oneOrMore` and left to python checks.
+        """
+        self.model_cls = model_cls
+        self.max_repeat = max_repeat
+        self.counts_covered = True
+        self.trusted: Set[type] = set()
+
+        classes = get_all_class_types(model_cls)
+        self._names = { cls: f"{cls.getClassName()}.{i}" for i, cls in enumerate(classes) }
+
+        E = lambda tag, *children, **attrib: self._element(tag, children, attrib)
+        grammar = E('grammar', E('start', E('ref', name=self._names[model_cls])), datatypeLibrary=XSD_DATATYPES)
+        for cls in classes:
+            grammar.append( E('define', E('element', *self._content(cls), name=cls.getClassName()), name=self._names[cls]) )
+
+        self.document = etree.ElementTree(grammar)
+        self.relaxng = etree.RelaxNG(self.document)
+
+    @staticmethod
+    def _element(tag, children, attrib) -> etree._Element:
+        elem = etree.Element(f"{{{RNG_NS}}}{tag}", nsmap={ None: RNG_NS })
+        for k, v in attrib.items():
+            elem.set(k, v)
+        for child in children:
+            if isinstance(child, str):
+                elem.text = child
+            else:
+                elem.append(child)
+        return elem
+
+    def _data(self, field: Field) -> typing.Tuple[etree._Element, bool]:
+        """*Internal* datatype pattern of field, and whether it covers all constraints of field.
+        """
+        E = lambda tag, *children, **attrib: self._element(tag, children, attrib)
+        if isinstance(field, ChoiceField):
+            return E('choice', *[ E('value', field.text(c), type='string') for c in field.choices ]), True
+        elif type(field) == IntegerField:
+            # xsd integer and double accept some forms of python ones only (not `1_000`, `nan`...),
+            # a pattern of all forms is tried after them, it is slower
+            return E('choice', E('data', type='integer'),
+                     E('data', E('param', INTEGER_PATTERN, name='pattern'), type='string')), field.r is None
+        elif type(field) == FloatField:
+            return E('choice', E('data', type='double'),
+                     E('data', E('param', FLOAT_PATTERN, name='pattern'), type='string')), field.r is None
+        elif type(field) == StringField:
+            pattern = xsd_pattern(field.r) if field.r else None
+            if pattern is None:
+                return E('data', type='string'), not field.r
+            return E('data', E('param', pattern, name='pattern'), type='string'), True
+        else:
+            return E('text'), False
+
+    def _content(self, cls: type) -> typing.List[etree._Element]:
+        """*Internal* content patterns of element of `cls`, in sequence.
+
+        Patterns are direct children of the element, libxml2 validates explicit `group` (and `mixed`),
+        and `interleave` of several patterns, of many children in quadratic time: text of elements with
+        one child class follows each child instead.
+        """
+        E = lambda tag, *children, **attrib: self._element(tag, children, attrib)
+        content = [ ]
+        trusted = True
+
+        names = [ ]
+        for k, v in cls.getFieldItems():
+            field = v.field if type(v) == Optional else v
+            if not isinstance(field, Field):
+                # foreign keys are assigned at runtime
+                continue
+            data, covered = self._data(field)
+            trusted = trusted and covered
+            attribute = E('attribute', data, name=k)
+            content.append( E('optional', attribute) if type(v) == Optional else attribute )
+            names.append(k)
+        #endfor
+
+        # undefined attributes are dropped by mapper
+        if names:
+            any_name = E('anyName', E('except', *[ E('name', k) for k in names ]))
+        else:
+            any_name = E('anyName')
+        content.append( E('zeroOrMore', E('attribute', any_name, E('text'))) )
+
+        # attributes are unordered even in sequence, text may be anywhere between children
+        content.append( E('text') )
+        child_classes = cls.getChildClasses()
+        if len(child_classes) == 1:
+            content.append( self._occurs(self._names[child_classes[0]], child_classes[0].__count__, text=True) )
+        elif child_classes:
+            content.append( E('interleave', E('text'), *[ self._occurs(self._names[childcls], childcls.__count__)
+                                                         for childcls in child_classes ]) )
+
+        if trusted:
+            self.trusted.add(cls)
+        return content
+
+    def _occurs(self, name: str, count, text: bool = False) -> etree._Element:
+        """*Internal* pattern of reference to define `name` occurring `count` times, followed by text if `text`.
+        """
+        E = lambda tag, *children, **attrib: self._element(tag, children, attrib)
+        ref = lambda: [ E('ref', name=name), E('text') ] if text else [ E('ref', name=name) ]
+        low, high = (count, count) if type(count) == int else count
+        unbounded = high >= sys.maxsize
+
+        if low > self.max_repeat or (not unbounded and high > self.max_repeat):
+            self.counts_covered = False
+            return E('oneOrMore' if low > 0 else 'zeroOrMore', *ref())
+
+        group = E('group')
+        for _ in range(low):
+            group.extend( ref() )
+        if unbounded:
+            group.append( E('zeroOrMore', *ref()) )
+        else:
+            for _ in range(high - low):
+                group.append( E('optional', *ref()) )
+        if len(group) == 0:
+            # never occurs
+            return E('empty')
+        return group
+
+    def validate(self, tree) -> bool:
+        return self.relaxng.validate(tree)
+
+    def assertValid(self, tree):
+        """
+        Raises:
+            RuntimeError: `tree` is not valid, with the first error of libxml2.
+        """
+        if not self.relaxng.validate(tree):
+            error = self.relaxng.error_log.last_error
+            raise RuntimeError(f"File {error.filename}, line {error.line}, schema validation error: {error.message}.")
+
+    def tostring(self) -> str:
+        return etree.tostring(self.document, pretty_print=True, encoding='unicode')
+
+
+@lru_cache(maxsize=None)
+def model_schema(model_cls: type) -> ModelSchema:
+    """Schema of `model_cls`, generated once per class.
+    """
+    return ModelSchema(model_cls)
@@ -0,0 +1,222 @@
+"""
+# Selectors over object graph, compiled against model classes
+#
+# Copyright (C) 2019 ZIJIAN JIANG
+"""
+
+import re
+import operator
+from functools import lru_cache
+from itertools import islice, chain
+from typing import Dict, List, Tuple, Iterator
+
+from .field import Optional, ChoiceField
+
+
+_STEP = re.compile(r"""(//|/)?([A-Za-z_][\w.-]*|\*)((?:\[(?:[^\]"']|"[^"]*"|'[^']*')*\])*)""")
+_PREDICATE = re.compile(r"""\[((?:[^\]"']|"[^"]*"|'[^']*')*)\]""")
+_POSITION = re.compile(r"""\s*(\d+)\s*""")
+_PRESENCE = re.compile(r"""\s*@([\w.-]+)\s*""")
+_COMPARISON = re.compile(r"""\s*(@[\w.-]+|text\(\))\s*(!=|<=|>=|=|<|>)\s*(?:"([^"]*)"|'([^']*)'|([-+]?\d+(?:\.\d*)?))\s*""")
+
+_OPERATORS = { '=': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge }
+
+
+class Step(object):
+    """One compiled step of a selector.
+
+    Attributes:
+        descendant: `True` for `//` steps, matching objects at any depth.
+        keys: Children container keys to visit, keyed by class of context objects.
+        routes: For descendant steps, container keys leading to matching classes, keyed by class.
+        predicates: List of filters, `int` positions (1-based) or functions of object.
+    """
+    __slots__ = [ 'descendant', 'keys', 'routes', 'predicates' ]
+
+    def __init__(self, descendant: bool, keys: Dict[type, List[str]], routes: Dict[type, List[str]], predicates: list):
+        self.descendant = descendant
+        self.keys = keys
+        self.routes = routes
+        self.predicates = predicates
+
+
+def _predicate(classes: List[type], text: str, selector: str):
+    """*Internal* compile predicate `text` of a step matching `classes`.
+    """
+    m = _POSITION.fullmatch(text)
+    if m is not None:
+        position = int(m.group(1))
+        if position < 1:
+            raise ValueError(f"Selector '{selector}': position starts from 1, got [{text}]")
+        return position
+
+    m = _PRESENCE.fullmatch(text)
+    if m is not None:
+        name = m.group(1)
+        if not any( cls.getField(name) is not None for cls in classes ):
+            raise ValueError(f"Selector '{selector}': no class of {[c.getClassQualName() for c in classes]} has field '{name}'")
+        return lambda obj: obj.get(name) is not None
+
+    m = _COMPARISON.fullmatch(text)
+    if m is None:
+        raise ValueError(f"Selector '{selector}': unsupported predicate [{text}]")
+    target, op, literal = m.group(1), _OPERATORS[m.group(2)], next( g for g in m.group(3, 4, 5) if g is not None )
+
+    if target == 'text()':
+        name, value = 'text', literal
+    else:
+        name = target[1:]
+        fields = [ cls.getField(name) for cls in classes if cls.getField(name) is not None ]
+        if not fields:
+            raise ValueError(f"Selector '{selector}': no class of {[c.getClassQualName() for c in classes]} has field '{name}'")
+        field = fields[0].field if type(fields[0]) == Optional else fields[0]
+        try:
+            if isinstance(field, ChoiceField):
+                value = field.canonical(literal)
+            else:
+                value = field.column_type(literal)
+        except (ValueError, TypeError):
+            raise ValueError(f"Selector '{selector}': '{literal}' is not a valid value of field '{name}' {field}")
+
+    def compare(obj):
+        v = obj.get(name)
+        return v is not None and op(v, value)
+    return compare
+
+
+def _reachable(cls: type, name: str) -> Dict[type, List[str]]:
+    """*Internal* container keys leading from `cls` to descendants of class `name` (`'*'` for all).
+    """
+    routes = dict()
+    stack = [ cls ]
+    leads = dict()      # class: whether it or its descendants match
+    order = [ ]
+    seen = set()
+    while stack:
+        c = stack.pop()
+        if c in seen:
+            continue
+        seen.add(c)
+        order.append(c)
+        stack.extend(c.getChildClasses())
+    #endwhile
+    for c in reversed(order):
+        leads[c] = name == '*' or c.getClassName() == name or \
+                   any( leads.get(child, False) for child in c.getChildClasses() )
+    for c in order:
+        routes[c] = [ key for child, key in zip(c.getChildClasses(), c.__childkeys__) if leads[child] ]
+    return routes
+
+
+@lru_cache(maxsize=256)
+def compile_selector(cls: type, selector: str) -> Tuple[Step, ...]:
+    """Compile `selector` into a plan of steps against objects of `cls`, plans are cached.
+
+    Syntax is a subset of xpath, relative to the context object:
+    `Name` or `*` child steps, `//Name` descendant steps, separated by `/`, each with predicates
+    `[N]` (1-based position among matches of the same parent, of all classes, in order of `getChildren()`), `[@field]`,
+    `[@field op value]` and `[text() op value]` where `op` is one of `= != < <= > >=`.
+
+    Args:
+        cls: `Model` class of context objects.
+        selector: Selector string, e.g. `'Person[@name="Alice"]/Phone'`.
+
+    Returns:
+        Tuple of `Step`.
+
+    Raises:
+        ValueError: Selector is malformed, or a step or field is impossible for classes of the model.
+    """
+    steps = [ ]
+    classes = [ cls ]
+    pos = 0
+    while pos < len(selector):
+        m = _STEP.match(selector, pos)
+        if m is None or (pos > 0 and m.group(1) is None) or (pos == 0 and m.group(1) == '/'):
+            raise ValueError(f"Selector '{selector}': syntax error at offset {pos}")
+        pos = m.end()
+        descendant, name = m.group(1) == '//', m.group(2)
+
+        keys, routes, matched = dict(), dict(), [ ]
+        for c in classes:
+            if descendant:
+                for d, route in _reachable(c, name).items():
+                    routes.setdefault(d, route)
+                    if d is not c and (name == '*' or d.getClassName() == name) and d not in matched:
+                        matched.append(d)
+            else:
+                keys[c] = [ key for child, key in zip(c.getChildClasses(), c.__childkeys__)
+                            if name == '*' or child.getClassName() == name ]
+                matched += [ child for child in c.getChildClasses() if (name == '*' or child.getClassName() == name) and child not in matched ]
+        #endfor
+        if not matched:
+            raise ValueError(f"Selector '{selector}': step '{m.group(0)}' matches no class under {[c.getClassQualName() for c in classes]}")
+
+        predicates = [ _predicate(matched, p.group(1), selector) for p in _PREDICATE.finditer(m.group(3)) ]
+        if descendant:
+            keys = { d: [ key for child, key in zip(d.getChildClasses(), d.__childkeys__) if child in matched ] for d in routes }
+        steps.append( Step(descendant, keys, routes, predicates) )
+        classes = matched
+    #endwhile
+
+    if not steps:
+        raise ValueError("Empty selector")
+    return tuple(steps)
+
+
+def _children(obj, step: Step) -> Iterator:
+    """*Internal* candidates of `step` under context `obj`, one iterable per parent, before predicates.
+
+    Candidates of a parent are its matching containers chained in order of its child classes.
+    """
+    if not step.descendant:
+        keys = step.keys.get(obj.__class__, ())
+        if keys:
+            yield chain.from_iterable( obj[key] for key in keys )
+        return
+
+    stack = [ obj ]
+    while stack:
+        current = stack.pop()
+        keys = step.keys.get(current.__class__, ())
+        if keys:
+            yield chain.from_iterable( current[key] for key in keys )
+        pending = [ ]
+        for key in step.routes.get(current.__class__, ()):
+            pending.extend(current[key])
+        stack.extend(reversed(pending))
+    #endwhile
+
+
+def _filter(objs, predicates: list) -> Iterator:
+    """*Internal* apply predicates in order to candidates of one parent.
+    """
+    for predicate in predicates:
+        if type(predicate) is int:
+            objs = islice(objs, predicate - 1, predicate)
+        else:
+            objs = filter(predicate, objs)
+    return objs
+
+
+def select(obj, selector: str) -> Iterator:
+    """Lazily evaluate `selector` from context object `obj`, see `compile_selector` for syntax.
+
+    Args:
+        obj: Model object.
+        selector: Selector string.
+
+    Yields:
+        Matched objects.
+    """
+    plan = compile_selector(obj.__class__, selector)
+
+    def evaluate(context, i):
+        step = plan[i]
+        for candidates in _children(context, step):
+            for match in _filter(candidates, step.predicates):
+                if i == len(plan) - 1:
+                    yield match
+                else:
+                    yield from evaluate(match, i + 1)
+    return evaluate(obj, 0)
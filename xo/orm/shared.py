@@ -0,0 +1,353 @@
+"""
+# Columns of mapped objects handed between processes in shared memory
+#
+# Copyright (C) 2019 ZIJIAN JIANG
+"""
+
+import weakref
+from array import array
+from bisect import bisect_left, bisect_right
+from multiprocessing import shared_memory
+from typing import Dict, List, Iterable, Iterator
+
+from .model import Model, _fillPending
+from .field import Field, Optional, ChoiceField, IntegerField, FloatField
+from .common import get_all_class_types
+
+
+_ALIGN = 8
+
+
+def _fields(cls: type) -> list:
+    """*Internal* (name, field) of fields of `cls`, foreign keys excluded.
+    """
+    fields = [ ]
+    for k, v in cls.getFieldItems():
+        field = v.field if type(v) == Optional else v
+        if isinstance(field, Field):
+            fields.append( (k, field) )
+    return fields
+
+
+def _encode(values: list, field) -> tuple:
+    """*Internal* encode column `values` of `field` (`None` for text).
+
+    Returns:
+        Tuple of (kind, typecode, list of buffers): kind `'array'` has the values buffer, `'str'` has
+        utf-8 blob and `'q'` end offsets; a validity mask of `'b'` is appended if any value is `None`.
+    """
+    if isinstance(field, ChoiceField):
+        return 'array', field.typecode, [ array(field.typecode, ( field.code(v) for v in values )) ]
+
+    mask = None
+    if any( v is None for v in values ):
+        mask = array('b', ( v is not None for v in values ))
+
+    typecode = 'q' if type(field) == IntegerField else ('d' if type(field) == FloatField else None)
+    if typecode is not None:
+        try:
+            data = array(typecode, ( 0 if v is None else v for v in values ))
+            return 'array', typecode, [ data ] + ([ mask ] if mask is not None else [ ])
+        except OverflowError:
+            # integers beyond 64 bits are kept as text
+            pass
+
+    blob = bytearray()
+    ends = array('q')
+    for v in values:
+        if v is not None:
+            blob += str(v).encode('utf-8')
+        ends.append(len(blob))
+    #endfor
+    return 'str', None, [ blob, ends ] + ([ mask ] if mask is not None else [ ])
+
+
+def share_columns(objs: Iterable[Model], model_cls: type) -> 'SharedColumns':
+    """Write objects and their subtrees as columns into a new shared memory block.
+
+    Call it in a worker process and return the result: only its layout is pickled, the parent
+    `attach()`es to the block without copying it.
+
+    Args:
+        objs: Top objects, in document order.
+        model_cls: Root `Model` class.
+
+    Returns:
+        `SharedColumns`, closed in this process; the block lives until the parent unlinks it.
+    """
+    rows = { cls: [ ] for cls in get_all_class_types(model_cls) }
+    parents = { cls: array('q') for cls in rows }
+    index = dict()      # id(obj): row of obj in its class
+
+    stack = [ (obj, -1) for obj in reversed(list(objs)) ]
+    while stack:
+        obj, parent_row = stack.pop()
+        cls_rows = rows[obj.__class__]
+        index[id(obj)] = len(cls_rows)
+        cls_rows.append(obj)
+        parents[obj.__class__].append(parent_row)
+
+        row = index[id(obj)]
+        children = [ ]
+        for key in obj.__childkeys__:
+            children.extend( (child, row) for child in obj[key] )
+        stack.extend(reversed(children))
+    #endwhile
+
+    buffers = [ ]
+    layout = dict()
+    offset = 0
+
+    def place(buffer) -> int:
+        nonlocal offset
+        start = offset
+        buffers.append( (start, buffer) )
+        offset += (len(buffer) * getattr(buffer, 'itemsize', 1) + _ALIGN - 1) // _ALIGN * _ALIGN
+        return start
+
+    for cls, cls_objs in rows.items():
+        if not cls_objs:
+            continue
+        columns = { '_parent': ('array', 'q', place(parents[cls]), None, None) }
+        fields = _fields(cls) + [ ('text', None) ]
+        for name, field in fields:
+            kind, typecode, encoded = _encode([ obj.get(name) for obj in cls_objs ], field)
+            if kind == 'array':
+                columns[name] = (kind, typecode, place(encoded[0]), None, place(encoded[1]) if len(encoded) > 1 else None)
+            else:
+                columns[name] = (kind, typecode, place(encoded[0]), place(encoded[1]), place(encoded[2]) if len(encoded) > 2 else None)
+        #endfor
+        layout[cls.getClassQualName()] = { 'count': len(cls_objs), 'columns': columns }
+    #endfor
+
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    try:
+        for start, buffer in buffers:
+            data = memoryview(buffer).cast('B')
+            shm.buf[start:start + len(data)] = data
+            data.release()
+    finally:
+        shm.close()
+    return SharedColumns(model_cls, shm.name, layout)
+
+
+class SharedColumns(object):
+    """Columns of objects of a model in one `multiprocessing.shared_memory` block, see `share_columns`.
+
+    Every class has a `_parent` column (row of parent object in its class, `-1` for top objects),
+    a column per field and `text`, rows are in document order.
+    Integer, float and `ChoiceField` columns are zero-copy `memoryview`s of the block
+    (`ChoiceField` ones are integer codes, see `ChoiceField.decode()`), string columns are decoded on access.
+
+    Objects are rebuilt lazily: `objects()` creates top objects, children of an object are created
+    at first access (see `XmlMapper.parse(lazy=True)`), fields are copied out of the block.
+
+    Example:
+
+        with worker_result.attach() as shared:
+            numbers = shared.column(Contacts.Person.Phone, 'number')
+            people = list(shared.objects(Contacts.Person))
+
+    Attributes:
+        model_cls: Root `Model` class.
+        name: Name of shared memory block.
+        layout: Columns of every class qualname, offsets in the block.
+    """
+    def __init__(self, model_cls: type, name: str, layout: Dict[str, dict]):
+        self.model_cls = model_cls
+        self.name = name
+        self.layout = layout
+        self._shm = None
+        self._views = [ ]
+        self._decoded = dict()     # class: python values of columns
+        self._classes = { c.getClassQualName(): c for c in get_all_class_types(model_cls) }
+
+    def __getstate__(self):
+        if self._shm is not None:
+            raise TypeError("Attached SharedColumns can't be pickled, pickle it before attach()")
+        return (self.model_cls, self.name, self.layout)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def attach(self, *, unlink: bool = True) -> 'SharedColumns':
+        """Attach to the block in this process, e.g. in parent of the worker that returned it.
+
+        Args:
+            unlink: Remove name of the block at once, its memory is freed when closed (POSIX).
+
+        Returns:
+            Self.
+        """
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(name=self.name)
+            if unlink:
+                self._shm.unlink()
+        return self
+
+    def _view(self, offset: int, typecode: str, count: int) -> memoryview:
+        view = self._shm.buf[offset:offset + count * array(typecode).itemsize].cast(typecode)
+        self._views.append(view)
+        return view
+
+    def _resolve(self, cls) -> type:
+        qualname = cls if isinstance(cls, str) else cls.getClassQualName()
+        if qualname not in self._classes:
+            raise ValueError(f"Class '{qualname}' is not defined in model '{self.model_cls.getClassQualName()}'")
+        return self._classes[qualname]
+
+    def count(self, cls) -> int:
+        """Number of objects of `cls`.
+        """
+        layout = self.layout.get(self._resolve(cls).getClassQualName())
+        return 0 if layout is None else layout['count']
+
+    def column(self, cls, name: str):
+        """Column `name` (a field, `text` or `_parent`) of `cls`.
+
+        Returns:
+            `memoryview` of the block for integer, float and choice columns (see `mask()` for `None`s),
+            list of values for string columns.
+        """
+        if self._shm is None:
+            raise RuntimeError("SharedColumns is not attached")
+        cls = self._resolve(cls)
+        layout = self.layout.get(cls.getClassQualName())
+        if layout is None:
+            return [ ]
+        kind, typecode, offset, ends, mask = layout['columns'][name]
+        count = layout['count']
+        if kind == 'array':
+            return self._view(offset, typecode, count)
+
+        ends = self._view(ends, 'q', count)
+        blob = self._shm.buf
+        field = dict(_fields(cls)).get(name)
+        convert = field.column_type if field is not None and not isinstance(field, ChoiceField) else str
+        valid = self.mask(cls, name)
+        values = [ ]
+        start = offset
+        for i in range(count):
+            end = offset + ends[i]
+            values.append( convert(str(blob[start:end], 'utf-8')) if valid is None or valid[i] else None )
+            start = end
+        #endfor
+        return values
+
+    def mask(self, cls, name: str):
+        """Validity of values of column `name` of `cls`, `None` if no value is `None`.
+        """
+        cls = self._resolve(cls)
+        layout = self.layout.get(cls.getClassQualName())
+        if layout is None or layout['columns'][name][4] is None:
+            return None
+        return self._view(layout['columns'][name][4], 'b', layout['count'])
+
+    def _rows(self, cls: type) -> Dict[str, list]:
+        """*Internal* python values of all columns of `cls`, decoded once.
+        """
+        rows = self._decoded.get(cls)
+        if rows is None:
+            rows = dict()
+            for name, field in _fields(cls) + [ ('text', None) ]:
+                column = self.column(cls, name)
+                valid = self.mask(cls, name)
+                if isinstance(field, ChoiceField):
+                    rows[name] = [ field.decode(code) for code in column ]
+                elif isinstance(column, memoryview):
+                    rows[name] = [ v if valid is None or valid[i] else None for i, v in enumerate(column.tolist()) ]
+                else:
+                    rows[name] = column
+            #endfor
+            rows['_parent'] = self.column(cls, '_parent').tolist()
+            self._decoded[cls] = rows
+        return rows
+
+    def _object(self, cls: type, row: int) -> Model:
+        """*Internal* object of `row` of `cls`, children are pending.
+        """
+        rows = self._rows(cls)
+        obj = cls.__new__(cls)
+        for name, _ in _fields(cls):
+            value = rows[name][row]
+            if value is not None:
+                obj[name] = value
+        if rows['text'][row] is not None:
+            obj['text'] = rows['text'][row]
+        obj._initLinks()
+
+        if cls.__childkeys__:
+            loader = _ColumnLoader(self, obj, row)
+            for key in cls.__childkeys__:
+                obj[key]._pending = loader
+        return obj
+
+    def objects(self, cls) -> List[Model]:
+        """Top objects of `cls`, in document order.
+        """
+        cls = self._resolve(cls)
+        if cls.getClassQualName() not in self.layout:
+            return [ ]
+        parents = self.column(cls, '_parent')
+        return [ self._object(cls, row) for row in range(bisect_right(parents, -1)) ]
+
+    def _children(self, cls: type, parent_row: int) -> Iterator[Model]:
+        """*Internal* objects of `cls` whose parent is at `parent_row`, rows of a class are ordered by parent.
+        """
+        if cls.getClassQualName() not in self.layout:
+            return
+        parents = self._rows(cls)['_parent']
+        for row in range(bisect_left(parents, parent_row), bisect_right(parents, parent_row)):
+            yield self._object(cls, row)
+
+    def close(self):
+        """Release views and detach from the block.
+        """
+        for view in self._views:
+            view.release()
+        self._views = [ ]
+        self._decoded = dict()
+        if self._shm is not None:
+            self._shm.close()
+            self._shm = None
+
+    def unlink(self):
+        """Remove name of the block, if `attach()` didn't.
+        """
+        shared_memory.SharedMemory(name=self.name).unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        # views must be released before the block is closed
+        if getattr(self, '_shm', None) is not None:
+            self.close()
+
+
+class _ColumnLoader(object):
+    """*Internal* pending loader of children containers of an object rebuilt from `SharedColumns`.
+    """
+    __slots__ = [ 'shared', 'owner', 'row' ]
+
+    def __init__(self, shared: SharedColumns, owner: Model, row: int):
+        self.shared = shared
+        self.owner = weakref.ref(owner)
+        self.row = row
+
+    def __call__(self):
+        shared, owner = self.shared, self.owner()
+        if owner is None or shared is None:
+            return
+
+        loaded = dict()
+        for childcls, key in zip(owner.getChildClasses(), owner.__childkeys__):
+            loaded[key] = list(shared._children(childcls, self.row))
+            for child in loaded[key]:
+                child[childcls.__parentkey__] = owner
+        #endfor
+        _fillPending(owner, loaded)
+        self.shared = None
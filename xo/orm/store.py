@@ -0,0 +1,274 @@
+"""
+# SQLite storage backend of mapped objects
+#
+# Copyright (C) 2019 ZIJIAN JIANG
+"""
+
+import sqlite3
+import weakref
+from enum import Enum
+from typing import Dict, List, Tuple, Iterator
+
+from .model import Model, _fillPending
+from .field import Field, Optional, ChoiceField
+from .common import get_all_class_types
+
+
+_SQL_TYPES = { str: 'TEXT', int: 'INTEGER', float: 'REAL' }
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class ModelStore(object):
+    """Objects of a model stored in a SQLite database, one table per `Model` class.
+
+    Every table has columns `_id` (document order), `_parent` (`_id` of parent object, indexed),
+    one typed column per field and `text`. `ChoiceField` values are stored as their xml text.
+
+    Objects read from the store are proxies: a `Model` object of one row, its children are loaded
+    at first access (see `XmlMapper.parse(lazy=True)`), so only visited rows are in memory.
+    Use `select()`, `count()` and `getChildren()` to push conditions down to SQL.
+
+    Example:
+
+        store = XmlMapper("huge.xml", Contacts).parse_store("huge.sqlite")
+        for person in store.select(Contacts.Person, name="Alice"):
+            print(person.address, len(store.getChildren(person, "Phone")))
+    """
+    def __init__(self, database: str, model_cls: type):
+        """
+        Args:
+            database: SQLite database path, created if not exists.
+            model_cls: Root `Model` class.
+        """
+        self.database = database
+        self.model_cls = model_cls
+        self.connection = sqlite3.connect(database)
+
+        self._classes = { c.getClassQualName(): c for c in get_all_class_types(model_cls) }
+        self._columns = { }     # class: list of (name, field)
+        for cls in self._classes.values():
+            columns = [ ]
+            for k, v in cls.getFieldItems():
+                field = v.field if type(v) == Optional else v
+                if isinstance(field, Field):
+                    columns.append( (k, field) )
+            self._columns[cls] = columns
+        #endfor
+
+    # ------------------------ writing ------------------------ #
+
+    def create(self):
+        """Drop and create tables of all classes of the model.
+        """
+        with self.connection:
+            for cls, columns in self._columns.items():
+                table = _quote(cls.getClassQualName())
+                definitions = [ '_id INTEGER PRIMARY KEY', '_parent INTEGER' ]
+                for name, field in columns:
+                    sql_type = 'TEXT' if isinstance(field, ChoiceField) else _SQL_TYPES.get(field.column_type, '')
+                    definitions.append(f'{_quote(name)} {sql_type}')
+                definitions.append('text TEXT')
+
+                self.connection.execute(f'DROP TABLE IF EXISTS {table}')
+                self.connection.execute(f'CREATE TABLE {table} ({", ".join(definitions)})')
+            #endfor
+
+    def create_indexes(self):
+        """Create indexes of `_parent` columns, after bulk inserting.
+        """
+        with self.connection:
+            for cls in self._columns:
+                qualname = cls.getClassQualName()
+                self.connection.execute(f'CREATE INDEX IF NOT EXISTS {_quote(qualname + "._parent")} '
+                                        f'ON {_quote(qualname)} (_parent)')
+
+    def _row(self, obj: Model, rowid: int, parent_id: int) -> tuple:
+        """*Internal* row values of `obj`, see `insert`.
+        """
+        values = [ rowid, parent_id ]
+        for name, field in self._columns[obj.__class__]:
+            value = obj.get(name)
+            values.append( value.value if isinstance(value, Enum) else value )
+        values.append(obj.get('text'))
+        return tuple(values)
+
+    def insert(self, cls: type, rows: List[tuple]):
+        """Insert rows of `cls`, each row is (`_id`, `_parent`, field values..., text), see `XmlMapper.parse_store()`.
+        """
+        table = _quote(cls.getClassQualName())
+        marks = ", ".join( ["?"] * (len(self._columns[cls]) + 3) )
+        self.connection.executemany(f'INSERT INTO {table} VALUES ({marks})', rows)
+
+    def commit(self):
+        self.connection.commit()
+
+    # ------------------------ reading ------------------------ #
+
+    def _resolve(self, cls) -> type:
+        qualname = cls if isinstance(cls, str) else cls.getClassQualName()
+        if qualname not in self._classes:
+            raise ValueError(f"Class '{qualname}' is not defined in model '{self.model_cls.getClassQualName()}'")
+        return self._classes[qualname]
+
+    def _where(self, cls: type, conditions: Dict[str, object]) -> Tuple[List[str], list]:
+        """*Internal* SQL conditions of field equality `conditions`.
+        """
+        columns = dict(self._columns[cls])
+        clauses, params = [ ], [ ]
+        for name, value in conditions.items():
+            if name not in columns and name != 'text':
+                raise ValueError(f"'{cls.getClassQualName()}' has no field '{name}'")
+            if value is None:
+                clauses.append(f'{_quote(name)} IS NULL')
+            else:
+                clauses.append(f'{_quote(name)} = ?')
+                params.append( value.value if isinstance(value, Enum) else value )
+        #endfor
+        return clauses, params
+
+    def _object(self, cls: type, row: tuple) -> Model:
+        """*Internal* proxy object of `row`, children are pending.
+        """
+        obj = cls.__new__(cls)
+        for (name, field), value in zip(self._columns[cls], row[2:]):
+            if value is None:
+                continue
+            obj[name] = field.canonical(str(value)) if isinstance(field, ChoiceField) else value
+        if row[-1] is not None:
+            obj['text'] = row[-1]
+        obj._initLinks()
+        obj['__rowid'] = row[0]
+
+        if cls.__childkeys__:
+            loader = _RowLoader(self, obj)
+            for key in cls.__childkeys__:
+                obj[key]._pending = loader
+        return obj
+
+    def _query(self, cls: type, clauses: List[str], params: list) -> Iterator[Model]:
+        sql = f'SELECT * FROM {_quote(cls.getClassQualName())}'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        for row in self.connection.execute(sql + ' ORDER BY _id', params):
+            yield self._object(cls, row)
+
+    def root(self) -> Model:
+        """
+        Returns:
+            Root object, its descendants are loaded on demand.
+        """
+        for obj in self._query(self.model_cls, [ '_parent IS NULL' ], [ ]):
+            return obj
+        raise KeyError(f"No '{self.model_cls.getClassQualName()}' object in {self.database}")
+
+    def select(self, cls, *, where: str = None, params: tuple = (), **conditions) -> Iterator[Model]:
+        """Query objects of `cls` in document order, rows are read while iterating.
+
+        Objects are not linked to their parents, see `getParent()`.
+
+        Args:
+            cls: `Model` class or its qualname.
+            where: Extra SQL condition on columns of the table.
+            params: Parameters of `where`.
+            conditions: Field (or `text`) equality conditions.
+
+        Yields:
+            Proxy objects.
+        """
+        cls = self._resolve(cls)
+        clauses, values = self._where(cls, conditions)
+        if where is not None:
+            clauses.append(f'({where})')
+            values.extend(params)
+        return self._query(cls, clauses, values)
+
+    def count(self, cls, **conditions) -> int:
+        """
+        Returns:
+            Number of objects of `cls` matching field equality `conditions`.
+        """
+        cls = self._resolve(cls)
+        clauses, values = self._where(cls, conditions)
+        sql = f'SELECT COUNT(*) FROM {_quote(cls.getClassQualName())}'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        return self.connection.execute(sql, values).fetchone()[0]
+
+    def getChildren(self, obj: Model, classname: str = None, **conditions) -> List[Model]:
+        """Children of `obj` matching field equality `conditions`, queried without loading other children.
+
+        Args:
+            obj: Object read from this store.
+            classname: Class name of children, `None` for children of all classes.
+            conditions: Field equality conditions, only with `classname`.
+
+        Returns:
+            List of children, linked to `obj` as parent.
+        """
+        if '__rowid' not in obj:
+            raise ValueError(f"'{obj.getClassQualName()}' object is not read from {self.database}")
+        if classname is None and conditions:
+            raise ValueError("Conditions need classname of children")
+
+        childclasses = [ c for c in obj.getChildClasses() if classname is None or c.getClassName() == classname ]
+        if classname is not None and not childclasses:
+            raise ValueError(f"'{classname}' is not child class of '{obj.getClassQualName()}'")
+
+        children = [ ]
+        for childcls in childclasses:
+            clauses, values = self._where(childcls, conditions)
+            for child in self._query(childcls, [ '_parent = ?' ] + clauses, [ obj['__rowid'] ] + values):
+                child[childcls.__parentkey__] = obj
+                children.append(child)
+        #endfor
+        return children
+
+    def getParent(self, obj: Model) -> Model:
+        """Parent of `obj`, its own parent is loaded on demand as well.
+        """
+        parent = obj.getParent()
+        if parent is not None or obj.getParentClassName() is None:
+            return parent
+
+        parent_id = self.connection.execute(f'SELECT _parent FROM {_quote(obj.getClassQualName())} WHERE _id = ?',
+                                            (obj['__rowid'],)).fetchone()[0]
+        parentcls = self._classes[obj.getParentClassQualName()]
+        for parent in self._query(parentcls, [ '_id = ?' ], [ parent_id ]):
+            return parent
+        return None
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _RowLoader(object):
+    """*Internal* pending loader of children containers of an object read from `ModelStore`.
+    """
+    __slots__ = [ 'store', 'owner' ]
+
+    def __init__(self, store: ModelStore, owner: Model):
+        self.store = store
+        self.owner = weakref.ref(owner)
+
+    def __call__(self):
+        store, owner = self.store, self.owner()
+        if owner is None or store is None:
+            return
+
+        loaded = dict()
+        for childcls, key in zip(owner.getChildClasses(), owner.__childkeys__):
+            loaded[key] = list(store._query(childcls, [ '_parent = ?' ], [ owner['__rowid'] ]))
+            for child in loaded[key]:
+                child[childcls.__parentkey__] = owner
+        #endfor
+        _fillPending(owner, loaded)
+        self.store = None
@@ -4,25 +4,42 @@
 # Copyright (C) 2019 ZIJIAN JIANG
 """
 
+import io
 import os
+import re
+import random
 import argparse
 from typing import Union, Optional, List
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 from lxml import etree
-from xo.orm.common import strip_xpath_index, read_xml_without_namespace
+from xo.orm.common import open_xml_source
 from xo.orm.field import StringField, IntegerField, FloatField
 
 
 
+_INTEGER = re.compile(r"\s*[+-]?\d+\s*\Z")
+_FLOAT = re.compile(r"\s*[+-]?(?:\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?|inf|infinity|nan)\s*\Z", re.IGNORECASE)
+
+# from narrow to wide
+_FIELD_ORDER = { IntegerField: 0, FloatField: 1, StringField: 2 }
+
+
 class GenericFieldMatcher(object):
     """Generic field matcher to estimate propriate field from value.
+
+    Attributes:
+        fieldtype: Estimated field type.
+        is_optional: Value has been missing.
+        count: Number of values matched, `None` excluded.
     """
-    __slots__ = [ 'fieldtype', 'is_optional' ]
+    __slots__ = [ 'fieldtype', 'is_optional', 'count' ]
     def __init__(self):
         
         self.fieldtype = IntegerField
         self.is_optional = False
+        self.count = 0
 
 
     def match(self, value: Union[None, str, int, float]):
@@ -33,27 +50,30 @@ class GenericFieldMatcher(object):
         """
         if value is None:
             self.is_optional = True
+            return
 
-        elif self.fieldtype == IntegerField:
-            try:
-                int(value)
-            except ValueError:
-                try:
-                    float(value)
-                except ValueError:
-                    self.fieldtype = StringField
-                else:
-                    self.fieldtype = FloatField
+        self.count += 1
+        value = str(value)
+
+        if self.fieldtype == IntegerField:
+            if _INTEGER.match(value):
+                pass
+            elif _FLOAT.match(value):
+                self.fieldtype = FloatField
             else:
-                self.fieldtype = IntegerField
+                self.fieldtype = StringField
         
         elif self.fieldtype == FloatField:
-            try:
-                float(value)
-            except ValueError:
+            if not _FLOAT.match(value):
                 self.fieldtype = StringField
-            else:
-                self.fieldtype = FloatField
+
+    def merge(self, other: 'GenericFieldMatcher'):
+        """Merge estimation of `other` (e.g. from another file) into this one.
+        """
+        if _FIELD_ORDER[other.fieldtype] > _FIELD_ORDER[self.fieldtype]:
+            self.fieldtype = other.fieldtype
+        self.is_optional = self.is_optional or other.is_optional
+        self.count += other.count
 
     def __str__(self):
         if self.is_optional:
@@ -65,21 +85,27 @@ def main():
     parser = argparse.ArgumentParser(__doc__)
     parser.add_argument("files", help="xml file to convert", type=str, nargs='+')
     parser.add_argument("-o", "--out", help="output model file", type=str, default="model.py")
+    parser.add_argument("-j", "--jobs", help="number of files scanned in parallel", type=int, default=1)
+    parser.add_argument("--sample", help="only look at first N elements of every class in each file", type=int, default=None)
+    parser.add_argument("--reservoir", help="look at random N elements of every class in each file", type=int, default=None)
+    parser.add_argument("--seed", help="random seed of --reservoir", type=int, default=None)
 
     args = parser.parse_args()
-    write_model_py_from_xml(args.files, args.out)
+    write_model_py_from_xml(args.files, args.out, jobs=args.jobs, sample=args.sample, reservoir=args.reservoir, seed=args.seed)
     print(f"xml-ormz: Class template is written into file: {args.out}")
 
 
-def write_model_py_from_xml(xmlfiles: List[str], out="model.py"):
+def write_model_py_from_xml(xmlfiles: List[str], out="model.py", **kwargs):
     """Write model.py from xml files of same type.
+
+    `kwargs` are passed to `get_meta_class`.
     """
     for arg_file in xmlfiles:
         if not os.path.isfile(arg_file):
             print("File {} is not valid".format(arg_file))
             exit(-1)
 
-    meta = get_meta_class(xmlfiles)
+    meta = get_meta_class(xmlfiles, **kwargs)
     with open(out, "w") as file:
         file.write( generate_pycode(meta) )
     
@@ -101,47 +127,131 @@ def generate_pycode(meta_class:type) -> str:
         return text
 
 
-def get_meta_class(files: List[str]) -> type:
+def _strip_namespace(name: str) -> str:
+    return name[name.find('}')+1:]
+
+
+def scan_xml(fpath: str, *, sample: int = None, reservoir: int = None, seed: int = None):
+    """Stream one xml file and estimate fields of every element class.
+
+    Elements are released as soon as they are scanned, so memory does not grow with file size.
+
+    Args:
+        fpath: Xml file path.
+        sample: Only look at first `sample` elements of every class.
+        reservoir: Only look at `reservoir` elements of every class, picked uniformly at random.
+        seed: Random seed of `reservoir`.
+
+    Returns:
+        Tuple of (root tag, dict of class name: (number of elements looked at, dict of attribute: `GenericFieldMatcher`)).
+    """
+    rand = random.Random(seed)
+    counts = defaultdict(int)       # elements looked at
+    seen = defaultdict(int)         # elements met
+    samples = defaultdict(list)     # reservoir
+    matchers = defaultdict(dict)
+    root_tag = None
+
+    def look(cls_name, attrib):
+        counts[cls_name] += 1
+        cls_matchers = matchers[cls_name]
+        for key, value in attrib.items():
+            matcher = cls_matchers.get(key)
+            if matcher is None:
+                matcher = cls_matchers[key] = GenericFieldMatcher()
+            matcher.match(value)
+
+    stack = [ ]
+    with open_xml_source(fpath) as (src, _):
+        src = io.BytesIO(src) if isinstance(src, (bytes, bytearray, memoryview)) else src
+
+        for event, elem in etree.iterparse(src, events=("start", "end"), remove_comments=True):
+            if event == "start":
+                tag = _strip_namespace(elem.tag)
+                cls_name = f"{stack[-1]}.{tag}" if stack else tag
+                stack.append(cls_name)
+                if root_tag is None:
+                    root_tag = tag
+
+                seen[cls_name] += 1
+                if cls_name not in matchers:
+                    matchers[cls_name] = dict()
+
+                if sample is not None and counts[cls_name] >= sample:
+                    continue
+
+                attrib = { _strip_namespace(k): v for k, v in elem.items() }
+                if reservoir is None:
+                    look(cls_name, attrib)
+                elif len(samples[cls_name]) < reservoir:
+                    samples[cls_name].append(attrib)
+                else:
+                    i = rand.randrange(seen[cls_name])
+                    if i < reservoir:
+                        samples[cls_name][i] = attrib
+            else:
+                stack.pop()
+                # release scanned elements
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+        #endfor
+
+    for cls_name, attribs in samples.items():
+        for attrib in attribs:
+            look(cls_name, attrib)
+
+    return root_tag, { cls_name: (counts[cls_name], cls_matchers) for cls_name, cls_matchers in matchers.items() }
+
+
+def _scan_xml_job(args):
+    fpath, kwargs = args
+    return scan_xml(fpath, **kwargs)
+
+
+def get_meta_class(files: List[str], *, jobs: int = 1, sample: int = None, reservoir: int = None, seed: int = None) -> type:
     """Get meta class information of xml files of same type( same root tag )
 
     Args:
         files: List of xml files of same type.
+        jobs: Number of files scanned in parallel processes.
+        sample: Only look at first `sample` elements of every class in each file.
+        reservoir: Only look at `reservoir` random elements of every class in each file.
+        seed: Random seed of `reservoir`.
 
     Returns:
         Python model class.
     """
-    cls_attributes = defaultdict( lambda: set( ) )
-    cls_attributes_types = defaultdict( lambda: defaultdict( lambda: GenericFieldMatcher() ) )
+    cls_counts = defaultdict(int)
+    cls_attributes_types = defaultdict( dict )
     
     root_tag = set( )
 
-    for fpath in files:
-        tree = read_xml_without_namespace(fpath)
-        root = tree.getroot()
-        root_tag.add( root.tag )
-    
-        for e in root.iter(tag=etree.Element):
-            
-            elem = e
-            path = tree.getpath(e)
-
-            cls_name = strip_xpath_index(path).replace('/', '.')[1:]
+    kwargs = { 'sample': sample, 'reservoir': reservoir, 'seed': seed }
+    if jobs > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = executor.map(_scan_xml_job, [ (fpath, kwargs) for fpath in files ])
+            results = list(results)
+    else:
+        results = [ scan_xml(fpath, **kwargs) for fpath in files ]
 
-            # not first time - compare to previous one
-            if len(cls_attributes[ cls_name ]) != 0:
-                for key in set( elem.keys() ) - cls_attributes[ cls_name ]:
-                    cls_attributes_types[ cls_name ][ key ].match( None )
-            
-            cls_attributes[ cls_name ] |= set( elem.keys() )
-
-            if len( cls_attributes[ cls_name ] ) == 0:
-                cls_attributes_types[ cls_name ] = defaultdict( lambda: GenericFieldMatcher() )
-            else:
-                for key in cls_attributes[ cls_name ]:
-                    attr = elem.get(key)
-                    cls_attributes_types[ cls_name ][ key ].match(attr)
-            
-                
+    # merge estimation of every file
+    for tag, classes in results:
+        root_tag.add( tag )
+        for cls_name, (count, matchers) in classes.items():
+            cls_counts[ cls_name ] += count
+            cls_matchers = cls_attributes_types[ cls_name ]
+            for key, matcher in matchers.items():
+                if key in cls_matchers:
+                    cls_matchers[ key ].merge( matcher )
+                else:
+                    cls_matchers[ key ] = matcher
+    
+    # attribute missing in some elements is optional
+    for cls_name, matchers in cls_attributes_types.items():
+        for matcher in matchers.values():
+            if matcher.count < cls_counts[ cls_name ]:
+                matcher.is_optional = True
         
     if len(root_tag) != 1:
         raise RuntimeError(f"Different root type of xml files {files}.")